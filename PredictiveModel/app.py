@@ -1,8 +1,100 @@
-from flask import Flask, request, jsonify
-from Prediction_script import predict_crop_price
+import hmac
+import json
+import logging
+import os
+
+from flask import Flask, request, jsonify, Response, stream_with_context, abort
 import pandas as pd
 
+import compression
+from artifacts import current_grid, get_artifacts, registry
+from batch_predict import PredictionQuery, predict_batch
+from metrics import instrument_app, stage
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+# Per-route and per-stage latency, cache and error counters at /metrics
+instrument_app(app)
+# gzip/brotli for JSON and NDJSON responses when the client accepts it
+compression.init_app(app)
+
+# Upper bound on queries accepted in one batch call
+MAX_BATCH_QUERIES = 100_000
+# Batches larger than this are streamed back as NDJSON
+STREAM_THRESHOLD = 1_000
+NDJSON_MIMETYPE = "application/x-ndjson"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+# Function to score a list of {crop, city, prediction_date} dicts in one model call
+def score_queries(raw_queries, artifacts=None):
+    artifacts = artifacts or get_artifacts()
+
+    with stage("validate"):
+        dates = pd.to_datetime([q.get("prediction_date") for q in raw_queries], errors="coerce", format="%Y-%m-%d")
+        results = [None] * len(raw_queries)
+        positions = []
+        queries = []
+        for i, (q, date) in enumerate(zip(raw_queries, dates)):
+            if not q.get("crop") or not q.get("city"):
+                results[i] = (None, None, "Missing required fields 'crop' and 'city'.")
+            elif pd.isna(date):
+                results[i] = (None, None, "Invalid prediction_date format. Use YYYY-MM-DD (e.g., 2025-03-26).")
+            else:
+                positions.append(i)
+                queries.append(PredictionQuery(q["crop"], q["city"], date))
+
+    scored = predict_batch(
+        artifacts.predictor, queries, artifacts.crop_name_to_code, artifacts.city_name_to_code,
+        artifacts.series_index, current_grid(artifacts),
+    )
+    for i, result in zip(positions, scored):
+        results[i] = result
+
+    for q, (predicted_price, most_recent_price, error) in zip(raw_queries, results):
+        yield {
+            "crop": q.get("crop"),
+            "city": q.get("city"),
+            "prediction_date": q.get("prediction_date"),
+            "predicted_price": None if predicted_price is None else round(predicted_price, 2),
+            "most_recent_price": most_recent_price,
+            "error": error,
+        }
+
+
+@app.route('/api/v1/predict', methods=['POST'])
+def predict_batch_v1():
+    data = request.get_json(silent=True)
+    raw_queries = data.get('queries') if isinstance(data, dict) else data
+    if not isinstance(raw_queries, list) or not all(isinstance(q, dict) for q in raw_queries):
+        return jsonify({'error': "Body must be a list of queries or {'queries': [...]}, each with crop, city and prediction_date."}), 400
+    if len(raw_queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries are accepted per call.'}), 413
+
+    try:
+        artifacts = get_artifacts()
+    except Exception:
+        logger.exception("Failed to load prediction artifacts.")
+        return jsonify({'error': 'Prediction service is unavailable.'}), 503
+    model_version = artifacts.model_version
+
+    wants_ndjson = request.accept_mimetypes.best == NDJSON_MIMETYPE
+    if wants_ndjson or len(raw_queries) > STREAM_THRESHOLD:
+        def generate():
+            for row in score_queries(raw_queries, artifacts):
+                yield json.dumps(row) + "\n"
+        return Response(
+            stream_with_context(generate()),
+            mimetype=NDJSON_MIMETYPE,
+            headers={'X-Model-Version': model_version},
+        )
+
+    results = list(score_queries(raw_queries, artifacts))
+    with stage("serialize"):
+        return jsonify({'model_version': model_version, 'count': len(results), 'results': results})
+
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -10,13 +102,14 @@ def predict():
         # Get JSON data from the request
         data = request.get_json()
 
-        # Extract crop name, planting date, and prediction date
+        # Extract crop name, city, planting date, and prediction date
         crop_name = data.get('crop_name')
+        city_name = data.get('city_name')
         planting_date_str = data.get('planting_date')
         prediction_date_str = data.get('prediction_date')
 
         # Validate input
-        if not crop_name or not planting_date_str or not prediction_date_str:
+        if not crop_name or not city_name or not planting_date_str or not prediction_date_str:
             return jsonify({'error': 'Missing required input fields'}), 400
 
         # Convert string dates to datetime format
@@ -28,13 +121,29 @@ def predict():
             return jsonify({'error': 'Prediction date must be after planting date'}), 400
 
         # Get the predicted price
-        predicted_price = predict_crop_price(crop_name, prediction_date, planting_date)
+        row = next(score_queries([{'crop': crop_name, 'city': city_name, 'prediction_date': prediction_date.strftime('%Y-%m-%d')}]))
+        if row['error']:
+            return jsonify({'error': row['error']}), 400
 
         # Return response
-        return jsonify({'crop_name': crop_name, 'prediction_date': prediction_date_str, 'predicted_price': predicted_price})
+        return jsonify({'crop_name': crop_name, 'city_name': city_name, 'prediction_date': prediction_date_str, 'predicted_price': row['predicted_price']})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/artifacts', methods=['GET', 'POST'])
+def admin_artifacts():
+    # Reload model and data without restarting workers (disabled unless ADMIN_TOKEN is set)
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        abort(404)
+    if request.method == 'POST':
+        started = registry.reload(wait=request.args.get('wait') == '1')
+        return jsonify({'reload_started': started, **registry.status()}), 202
+    return jsonify(registry.status())
+
+
 if __name__ == '__main__':
+    # Load artifacts before serving the first request
+    get_artifacts()
+    registry.start_watcher()
     app.run(debug=True)
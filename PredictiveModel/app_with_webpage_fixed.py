@@ -1,73 +1,67 @@
 import os
+import hmac
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
-import joblib
-from flask import Flask, request, render_template_string
-import matplotlib
-
-# Use Agg backend for headless servers (must be set before pyplot import)
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from flask import Flask, Response, request, send_file, stream_with_context, url_for, abort, jsonify
+
+import compression
+from chart_cache import ChartCache
+from static_assets import StaticAssets
+from artifacts import BASE_DIR, ArtifactRegistry, current_grid
+from batch_predict import PredictionQuery, check_query, forecast_limit, get_season, predict_batch, predict_block, predict_days
+from forecast_grid import DEFAULT_HORIZON_DAYS
+from metrics import CACHE_REQUESTS, instrument_app, stage
+from markets import MARKET_WINDOW_DAYS, TransportCosts, rank_markets
+from sell_timing import SELL_WINDOW_DAYS, STORAGE_COST_PER_DAY, plan_sale
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
-# Define base directory
-BASE_DIR = Path(r"C:\Users\51ngh\OneDrive\Documents\GITHUB_Repo\Recode_Rewind_Bot_Coders\PredictiveModel")
-
-MODEL_PATH = BASE_DIR / "crop_price_model_xgboost_citywise.pkl"
-CROP_MAP_PATH = BASE_DIR / "crop_name_to_code.pkl"
-CITY_MAP_PATH = BASE_DIR / "city_name_to_code.pkl"
-COMBINED_DF_PATH = BASE_DIR / "combined_crop_data_citywise.xlsx"
-
 app = Flask(__name__)
+# Per-route and per-stage latency, cache and error counters at /metrics
+instrument_app(app)
 
 # Ensure static folder exists
 static_folder = Path(app.static_folder or "static")
 static_folder.mkdir(parents=True, exist_ok=True)
 
-# Load artifacts safely
-def safe_load_artifacts():
-    try:
-        logger.info(f"Loading model from: {MODEL_PATH}")
-        model = joblib.load(str(MODEL_PATH))
-        logger.info("Model loaded successfully.")
-    except Exception as e:
-        logger.exception("Failed to load model. Check MODEL_PATH and file integrity.")
-        raise
-
-    try:
-        crop_name_to_code = joblib.load(str(CROP_MAP_PATH))
-        city_name_to_code = joblib.load(str(CITY_MAP_PATH))
-        logger.info("Loaded crop/city mappings successfully.")
-    except Exception as e:
-        logger.exception("Failed to load mapping files.")
-        raise
-
-    try:
-        combined_df = pd.read_excel(str(COMBINED_DF_PATH))
-        combined_df["Date"] = pd.to_datetime(combined_df["Date"])
-        logger.info("Loaded combined dataset successfully.")
-    except Exception as e:
-        logger.exception("Failed to load combined dataset (Excel).")
-        raise
-
-    return model, crop_name_to_code, city_name_to_code, combined_df
-
-model, crop_name_to_code, city_name_to_code, combined_df = safe_load_artifacts()
-
-# Define the season function
-def get_season(month: int) -> int:
-    if month in [6, 7, 8, 9]:  # Monsoon
-        return 1
-    elif month in [12, 1, 2]:  # Winter
-        return 2
-    else:  # Summer
-        return 3
+# CSS and other assets are served under content-hashed URLs with long cache
+# lifetimes, and text responses are gzip/brotli-compressed when accepted
+static_assets = StaticAssets(static_folder).init_app(app)
+compression.init_app(app)
+
+# The page template is compiled once and streamed in chunks of this many template events
+PAGE_TEMPLATE = "prediction.html"
+PAGE_STREAM_BUFFER = 64
+
+# Rendered trend charts are cached on disk under content-addressed names
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CHART_MAX_AGE = 365 * 24 * 3600
+chart_cache = ChartCache(static_folder / "charts", max_bytes=CHART_CACHE_MAX_BYTES)
+
+# Cost of moving a quintal between markets (override with TRANSPORT_COSTS_FILE)
+transport_costs = TransportCosts.from_env()
+# Markets shown on the prediction page
+PAGE_MARKETS = 5
+
+# Model, mappings, dataset and everything derived from them live in a versioned,
+# hot-reloadable bundle; each request works on the bundle current when it started
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+registry = ArtifactRegistry(BASE_DIR)
+
+# WSGI factory: load everything up front (before gunicorn forks when preloading)
+# and optionally start the artifact watcher, which must run in each worker
+def create_app(preload=True, watch=True):
+    if preload:
+        registry.current()
+    if watch:
+        registry.start_watcher()
+    return app
 
 # Function to validate and parse date input
 def parse_date(date_str, date_name):
@@ -161,247 +155,56 @@ def predict_weather_and_advice(crop_name, planting_date):
     weather_advice = crop_weather.get(f"{season_name}_advice", "No specific weather advice available.")
     return weather_condition, weather_advice
 
-# Function to generate a price trend graph
-def generate_price_trend_graph(crop_name, city_name, combined_df):
-    df = combined_df[(combined_df["Crop"] == crop_name) & (combined_df["City"] == city_name)].sort_values("Date")
-    if df.empty:
+# Function to get the URL of a price trend graph; the chart itself is rendered and cached on first fetch
+def generate_price_trend_graph(crop_name, city_name, series_index):
+    if series_index.get(crop_name, city_name) is None:
         return None
-
-    plt.figure(figsize=(10, 6))
-    plt.plot(df["Date"], df["Price"], marker="o", linestyle="-", label=f"{crop_name} Price in {city_name}")
-    plt.title(f"Historical Price Trend for {crop_name} in {city_name}")
-    plt.xlabel("Date")
-    plt.ylabel("Price (INR/quintal)")
-    plt.grid(True)
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    graph_abs = Path(app.static_folder) / "price_trend.png"
-    plt.savefig(str(graph_abs), bbox_inches="tight")
-    plt.close()
-    
-    return f"/{Path(app.static_url_path.strip('/'))}/price_trend.png" if app.static_url_path else "/static/price_trend.png"
+    return url_for("price_trend_chart", crop=crop_name, city=city_name, v=series_index.version)
 
 # Function to predict the price for a given crop, city, and date
 def predict_crop_price(crop_name, city_name, prediction_date, planting_date):
-    # Special case for Thane
-    if city_name.lower() == "thane":
-        return None, None, "Predictions for Thane are unavailable due to insufficient data."
-
-    crop_code = crop_name_to_code.get(crop_name)
-    city_code = city_name_to_code.get(city_name)
-    
-    if crop_code is None:
-        return None, None, f"{crop_name} not found. Available crops: {list(crop_name_to_code.keys())}"
-    if city_code is None:
-        return None, None, f"{city_name} not found. Available cities: {list(city_name_to_code.keys())}"
-
-    df_hist = combined_df[(combined_df["Crop"] == crop_name) & (combined_df["City"] == city_name)]
-    if df_hist.empty:
-        return None, None, f"No historical price data for {crop_name} in {city_name}."
-
-    most_recent_price = float(df_hist.sort_values("Date")["Price"].iloc[-1])
-
-    new_data = pd.DataFrame([{
-        "Year": prediction_date.year,
-        "Month": prediction_date.month,
-        "Day": prediction_date.day,
-        "DayOfWeek": prediction_date.dayofweek,
-        "Crop": crop_code,
-        "City": city_code,
-        "Season": get_season(prediction_date.month),
-        "Prev_Price": most_recent_price
-    }])
-
-    # Convert numeric columns to float for model compatibility
-    for col in new_data.select_dtypes(include=["int64", "int32"]).columns:
-        new_data[col] = new_data[col].astype(float)
+    return predict_crop_prices([PredictionQuery(crop_name, city_name, prediction_date)])[0]
+
+# Function to predict several (crop, city, date) queries with a single model call
+def predict_crop_prices(queries, artifacts=None):
+    a = artifacts or registry.current()
+    return predict_batch(a.predictor, queries, a.crop_name_to_code, a.city_name_to_code, a.series_index, current_grid(a))
+
+# Function to predict every day from a start date for one crop and city in a single batch
+def predict_price_curve(crop_name, city_name, start_date, days, artifacts=None):
+    a = artifacts or registry.current()
+    return predict_days(a.predictor, crop_name, city_name, start_date, days, a.crop_name_to_code, a.city_name_to_code, a.series_index, current_grid(a))
+
+# Function to rank every market for a crop by its best price net of transport from the farmer's city
+def find_best_markets(crop_name, city_name, start_date, days, artifacts=None):
+    a = artifacts or registry.current()
+    markets = list(a.city_name_to_code.keys())
+    with stage("market_scores"):
+        prices, latest, _ = predict_block(
+            a.predictor, crop_name, markets, start_date, days, a.crop_name_to_code, a.city_name_to_code, a.series_index, current_grid(a)
+        )
+    with stage("market_rank"):
+        return rank_markets(prices, start_date, markets, latest, transport_costs.costs_from(city_name, markets))
+
+# Function to count the days from a start date that the forecast grid covers for one crop and city
+def forecast_reach(crop_name, city_name, start_date, days, artifacts=None):
+    grid = current_grid(artifacts or registry.current())
+    return grid.covered_days(crop_name, city_name, start_date, days) if grid is not None else 0
+
+# Function to summarize a sell plan for display
+def describe_sell_plan(plan):
+    if plan is None:
+        return None
+    return {
+        "date": plan.best_date.strftime("%Y-%m-%d"),
+        "days": plan.best_offset,
+        "value": round(plan.best_value, 2),
+        "gain": round(plan.gain, 2) if plan.gain is not None else None,
+        # The search stops where the forecast grid does
+        "window_days": len(plan.dates) - 1,
+        "until": str(plan.dates[-1]),
+    }
 
-    try:
-        pred = model.predict(new_data)
-        predicted_price = float(pred[0])
-    except Exception as e:
-        logger.exception("Model prediction failed.")
-        return None, None, "Model prediction error: verify model and feature alignment."
-
-    return predicted_price, most_recent_price, None
-
-# HTML Template
-HTML_TEMPLATE = """<!doctype html>
-<html lang="en">
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width,initial-scale=1">
-    <title>Crop Price Prediction</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            background: #f4f4f4;
-            padding: 20px;
-            margin: 0;
-        }
-        .container {
-            max-width: 900px;
-            margin: 0 auto;
-            background: #fff;
-            padding: 20px;
-            border-radius: 8px;
-            box-shadow: 0 0 10px rgba(0,0,0,0.1);
-        }
-        h1, h3 {
-            text-align: center;
-            color: #333;
-        }
-        label {
-            display: block;
-            margin-top: 10px;
-            font-weight: bold;
-        }
-        input, select {
-            width: 100%;
-            padding: 8px;
-            margin-top: 6px;
-            border: 1px solid #ccc;
-            border-radius: 4px;
-            box-sizing: border-box;
-        }
-        button {
-            width: 100%;
-            padding: 10px;
-            margin-top: 12px;
-            background: #28a745;
-            color: #fff;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 16px;
-        }
-        button:hover {
-            background: #218838;
-        }
-        #result, #suggestions, #weather {
-            margin-top: 20px;
-            padding: 12px;
-            border-radius: 6px;
-            background: #f9f9f9;
-            border: 1px solid #ddd;
-        }
-        .profit-negative {
-            color: red;
-            font-weight: bold;
-        }
-        .profit-positive {
-            color: green;
-            font-weight: bold;
-        }
-        .weather-favorable {
-            color: green;
-        }
-        .weather-unfavorable {
-            color: red;
-        }
-        .weather-neutral {
-            color: orange;
-        }
-        img {
-            max-width: 100%;
-            height: auto;
-            margin-top: 10px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Crop Price Prediction System</h1>
-        <form method="POST" action="/">
-            <label for="city">Location (City):</label>
-            <select id="city" name="city_name" required>
-                <option value="">Select a city</option>
-                {% for city in cities %}
-                    <option value="{{ city }}" {% if city == city_name %}selected{% endif %}>{{ city }}</option>
-                {% endfor %}
-            </select>
-
-            <label for="crop">Crop:</label>
-            <select id="crop" name="crop_name" required>
-                <option value="">Select a crop</option>
-                {% for crop in crops %}
-                    <option value="{{ crop }}" {% if crop == crop_name %}selected{% endif %}>{{ crop }}</option>
-                {% endfor %}
-            </select>
-
-            <label for="yield_q">Expected Yield (in Quintals):</label>
-            <input type="number" id="yield_q" name="yield_q" step="0.1" min="0" required value="{{ yield_amount if yield_amount is not none else '' }}">
-
-            <label for="planting_date">Planting Date:</label>
-            <input type="date" id="planting_date" name="planting_date" required value="{{ planting_date_str if planting_date_str else '' }}">
-
-            <label for="prediction_date">Prediction Date:</label>
-            <input type="date" id="prediction_date" name="prediction_date" required value="{{ prediction_date_str if prediction_date_str else '' }}">
-
-            <button type="submit">Predict Price</button>
-        </form>
-
-        <div id="suggestions">
-            {% if dominant_soil %}
-                <h3>Dominant Soil Type: {{ dominant_soil|capitalize }}</h3>
-                <p><strong>Suggested Crops for This Soil:</strong></p>
-                {% if suggested_crops %}
-                    <ul>
-                        {% for s in suggested_crops %}
-                            <li>{{ s.crop }}: {{ s.predicted_price }} INR/quintal (Predicted)</li>
-                        {% endfor %}
-                    </ul>
-                {% else %}
-                    <p>No suitable crops in our dataset for this soil type.</p>
-                {% endif %}
-            {% endif %}
-        </div>
-
-        <div id="weather">
-            {% if weather_condition %}
-                <h3>Weather Prediction for Planting</h3>
-                <p><strong>Condition:</strong> <span class="weather-{{ weather_condition }}">{{ weather_condition|capitalize }}</span></p>
-                <p><strong>Advice:</strong> {{ weather_advice }}</p>
-            {% endif %}
-        </div>
-
-        <div id="result">
-            {% if error %}
-                <p style="color: red; font-weight: bold;">Error: {{ error }}</p>
-            {% endif %}
-            
-            {% if predicted_price is not none %}
-                <h3>Prediction Results for {{ crop_name }} in {{ city_name }}</h3>
-                <p><strong>Predicted Price:</strong> {{ predicted_price }} INR/quintal</p>
-                <p><strong>Adjusted Price (with 5% annualized inflation):</strong> {{ adjusted_price }} INR/quintal</p>
-                <p><strong>Revenue (for {{ yield_amount }} quintals):</strong> {{ revenue }} INR</p>
-                <p><strong>Production Cost (for {{ yield_amount }} quintals):</strong> {{ cost }} INR</p>
-                <p><strong>Net Profit:</strong> <span class="{% if net_profit < 0 %}profit-negative{% else %}profit-positive{% endif %}">{{ net_profit }} INR</span></p>
-                <p><strong>Storage Recommendation:</strong> {{ storage_recommendation }}</p>
-                <p><strong>Most Recent Historical Price Used:</strong> {{ most_recent_price }} INR/quintal</p>
-
-                <h4>Historical Prices for {{ prediction_month }}:</h4>
-                <p><strong>Mean:</strong> {{ historical_mean }} INR/quintal | <strong>Min:</strong> {{ historical_min }} INR/quintal | <strong>Max:</strong> {{ historical_max }} INR/quintal</p>
-
-                <h4>Recent Prices:</h4>
-                <ul>
-                    {% for price in recent_prices %}
-                        <li>{{ price.Date }}: {{ price.Price }} INR/quintal</li>
-                    {% endfor %}
-                </ul>
-
-                {% if graph_path %}
-                    <h4>Price Trend Graph:</h4>
-                    <img src="{{ graph_path }}" alt="Price Trend Graph">
-                {% endif %}
-            {% endif %}
-        </div>
-    </div>
-</body>
-</html>
-"""
 
 # Main route
 @app.route("/", methods=["GET", "POST"])
@@ -429,9 +232,13 @@ def index():
     weather_condition = None
     weather_advice = None
     graph_path = None
+    storage_cost = STORAGE_COST_PER_DAY
+    best_sell = None
+    best_markets = []
 
-    crops = list(crop_name_to_code.keys())
-    cities = list(city_name_to_code.keys())
+    artifacts = registry.current()
+    crops = list(artifacts.crop_name_to_code.keys())
+    cities = list(artifacts.city_name_to_code.keys())
 
     if request.method == "POST":
         crop_name = request.form.get("crop_name")
@@ -439,6 +246,7 @@ def index():
         planting_date_str = request.form.get("planting_date")
         prediction_date_str = request.form.get("prediction_date")
         yield_str = request.form.get("yield_q")
+        storage_cost_str = request.form.get("storage_cost")
 
         if not all([crop_name, city_name, planting_date_str, prediction_date_str, yield_str]):
             error = "All fields are required."
@@ -450,6 +258,14 @@ def index():
             except Exception:
                 error = "Yield must be a valid number."
 
+            if not error and storage_cost_str:
+                try:
+                    storage_cost = float(storage_cost_str)
+                    if storage_cost < 0:
+                        error = "Storage cost cannot be negative."
+                except Exception:
+                    error = "Storage cost must be a valid number."
+
             if not error:
                 planting_date, err = parse_date(planting_date_str, "planting date")
                 if err:
@@ -465,27 +281,41 @@ def index():
                     # Weather advice
                     weather_condition, weather_advice = predict_weather_and_advice(crop_name, planting_date)
 
-                    # Dominant soil & suggestions
+                    # Collect every prediction this page needs and score them in one call
                     dominant_soil = city_to_soil.get(city_name)
+                    suggested_crop_names = []
                     if dominant_soil:
-                        suggested_crop_names = soil_crops.get(dominant_soil.lower(), [])
-                        for suggested_crop in suggested_crop_names:
-                            if suggested_crop != crop_name:
-                                pred_price, _, e = predict_crop_price(suggested_crop, city_name, prediction_date, planting_date)
-                                if not e and pred_price is not None:
-                                    days_diff = (prediction_date - planting_date).days
-                                    months_diff = days_diff / 30
-                                    adjusted_pred_price = pred_price * (1 + 0.05 * (months_diff / 12))
-                                    suggested_crops.append({
-                                        "crop": suggested_crop,
-                                        "predicted_price": round(adjusted_pred_price, 2)
-                                    })
+                        suggested_crop_names = [c for c in soil_crops.get(dominant_soil.lower(), []) if c != crop_name]
+                    suggestion_results = predict_crop_prices(
+                        [PredictionQuery(c, city_name, prediction_date) for c in suggested_crop_names], artifacts
+                    )
+                    # One daily price curve from the prediction date covers the selected price,
+                    # the +30-day storage check and the best sell date. The sell window only spans
+                    # the days the grid covers, so nothing past them is scored beyond the 31 days
+                    next_month_date = prediction_date + timedelta(days=30)
+                    reach = forecast_reach(crop_name, city_name, prediction_date, SELL_WINDOW_DAYS + 1, artifacts)
+                    curve, most_recent_price, curve_err = predict_price_curve(
+                        crop_name, city_name, prediction_date, max(reach, 31), artifacts
+                    )
+
+                    # Dominant soil & suggestions
+                    for suggested_crop, (pred_price, _, e) in zip(suggested_crop_names, suggestion_results):
+                        if not e and pred_price is not None:
+                            days_diff = (prediction_date - planting_date).days
+                            months_diff = days_diff / 30
+                            adjusted_pred_price = pred_price * (1 + 0.05 * (months_diff / 12))
+                            suggested_crops.append({
+                                "crop": suggested_crop,
+                                "predicted_price": round(adjusted_pred_price, 2)
+                            })
 
                     # Predict selected crop
-                    predicted_price, most_recent_price, err = predict_crop_price(crop_name, city_name, prediction_date, planting_date)
-                    if err:
-                        error = err
+                    if curve_err:
+                        error = curve_err
+                    elif not np.isfinite(curve[0]):
+                        error = f"No price estimate available for {crop_name} in {city_name}."
                     else:
+                        predicted_price = float(curve[0])
                         # Adjust for inflation (5% annualized simplified)
                         days_difference = (prediction_date - planting_date).days
                         months_difference = days_difference / 30
@@ -497,8 +327,7 @@ def index():
                         net_profit = revenue - cost
 
                         # Next month comparison for storage recommendation
-                        next_month_date = prediction_date + timedelta(days=30)
-                        next_month_price, _, _ = predict_crop_price(crop_name, city_name, next_month_date, planting_date)
+                        next_month_price = float(curve[30]) if np.isfinite(curve[30]) else None
                         if next_month_price is not None:
                             days_difference_next = (next_month_date - planting_date).days
                             months_difference_next = days_difference_next / 30
@@ -511,43 +340,40 @@ def index():
                         else:
                             storage_recommendation = "Unable to provide storage recommendation."
 
+                        # Best day to sell within the window, net of storage costs, on the days the grid covers
+                        with stage("sell_plan"):
+                            best_sell = describe_sell_plan(
+                                plan_sale(curve[:reach], prediction_date, planting_date, storage_cost) if reach else None
+                            )
+
+                        # Best markets for this crop from the farmer's city
+                        best_markets = find_best_markets(crop_name, city_name, prediction_date, MARKET_WINDOW_DAYS, artifacts)[:PAGE_MARKETS]
+
                         # Historical stats
-                        prediction_month = prediction_date.strftime("%B")
-                        hist = combined_df[
-                            (combined_df["Crop"] == crop_name) &
-                            (combined_df["City"] == city_name) &
-                            (combined_df["Date"].dt.month == prediction_date.month)
-                        ]["Price"]
-                        
-                        if not hist.empty:
-                            s = hist.describe()
-                            historical_mean = round(s.get("mean", 0), 2)
-                            historical_min = round(s.get("min", 0), 2)
-                            historical_max = round(s.get("max", 0), 2)
-                        else:
-                            historical_mean = historical_min = historical_max = 0
+                        with stage("history_lookup"):
+                            prediction_month = prediction_date.strftime("%B")
+                            hist = artifacts.monthly_stats.get(crop_name, city_name, prediction_date.month)
+
+                            if hist:
+                                historical_mean = round(hist["mean"], 2)
+                                historical_min = round(hist["min"], 2)
+                                historical_max = round(hist["max"], 2)
+                            else:
+                                historical_mean = historical_min = historical_max = 0
 
-                        # Recent prices
-                        recent_df = combined_df[
-                            (combined_df["Crop"] == crop_name) &
-                            (combined_df["City"] == city_name)
-                        ].sort_values("Date", ascending=False).head(5)
-                        
-                        if not recent_df.empty:
-                            recent_df = recent_df[["Date", "Price"]].copy()
-                            recent_df["Date"] = recent_df["Date"].dt.strftime("%Y-%m-%d")
-                            recent_prices = recent_df.to_dict("records")
+                            # Recent prices
+                            series = artifacts.history_index.get(crop_name, city_name)
+                            recent_prices = series.recent(5)
 
                         # Generate graph
-                        graph_path = generate_price_trend_graph(crop_name, city_name, combined_df)
+                        graph_path = generate_price_trend_graph(crop_name, city_name, artifacts.history_index)
                         
                         # Round values for display
                         predicted_price = round(predicted_price, 2)
                         adjusted_price = round(adjusted_price, 2)
                         most_recent_price = round(most_recent_price, 2)
 
-    return render_template_string(
-        HTML_TEMPLATE,
+    return Response(stream_with_context(stream_page(
         error=error,
         predicted_price=predicted_price,
         adjusted_price=adjusted_price,
@@ -572,9 +398,178 @@ def index():
         storage_recommendation=storage_recommendation if storage_recommendation else "Unable to provide storage recommendation.",
         weather_condition=weather_condition,
         weather_advice=weather_advice,
-        graph_path=graph_path
-    )
+        graph_path=graph_path,
+        storage_cost=storage_cost,
+        best_sell=best_sell,
+        sell_window_days=SELL_WINDOW_DAYS,
+        best_markets=best_markets,
+        market_window_days=MARKET_WINDOW_DAYS,
+    )), mimetype="text/html")
+
+# Function to render the page template as a stream, so the head and form reach the browser first
+def stream_page(**context):
+    template = app.jinja_env.get_template(PAGE_TEMPLATE)
+    app.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(PAGE_STREAM_BUFFER)
+    with stage("template_render"):
+        yield from stream
+
+# Historical monthly statistics as JSON, optionally filtered by crop, city and month
+@app.route("/api/monthly-stats")
+def monthly_stats_api():
+    month = request.args.get("month", type=int)
+    if month is not None and not 1 <= month <= 12:
+        return jsonify({"error": "month must be between 1 and 12."}), 400
+    artifacts = registry.current()
+    records = artifacts.monthly_stats.records(request.args.get("crop"), request.args.get("city"), month)
+    return jsonify({"dataset_version": artifacts.history_index.version, "stats": records})
+
+# Daily price forecast path for one crop and city, read from the forecast grid
+@app.route("/api/forecast")
+def forecast_api():
+    crop, city = request.args.get("crop"), request.args.get("city")
+    days = request.args.get("days", 30, type=int)
+    start, err = parse_date(request.args.get("start"), "start") if request.args.get("start") else (pd.Timestamp.today().normalize(), None)
+    if err:
+        return jsonify({"error": err}), 400
+    if not 1 <= days <= DEFAULT_HORIZON_DAYS:
+        return jsonify({"error": f"days must be between 1 and {DEFAULT_HORIZON_DAYS}."}), 400
+
+    a = registry.current()
+    _, err = check_query(PredictionQuery(crop or "", city or "", start), a.crop_name_to_code, a.city_name_to_code, a.series_index)
+    if err:
+        return jsonify({"error": err}), 404
+    grid = current_grid(a)
+    path = grid.path(crop, city, start, days) if grid is not None else None
+    if path is None:
+        return jsonify({"error": "The forecast is still being prepared; try again shortly."}), 503
+
+    dates, prices = path
+    return jsonify({
+        "model_version": a.model_version,
+        "mode": grid.mode,
+        "crop": crop,
+        "city": city,
+        "forecast": [
+            {"date": str(d), "price": round(float(p), 2) if np.isfinite(p) else None} for d, p in zip(dates, prices)
+        ],
+    })
+
+# Best day to sell within a window after the prediction date, with the full net price curve
+@app.route("/api/sell-plan")
+def sell_plan_api():
+    crop, city = request.args.get("crop"), request.args.get("city")
+    window = request.args.get("window", SELL_WINDOW_DAYS, type=int)
+    storage_cost = request.args.get("storage_cost", STORAGE_COST_PER_DAY, type=float)
+    planting_date, err = parse_date(request.args.get("planting_date"), "planting_date")
+    if not err:
+        prediction_date, err = parse_date(request.args.get("prediction_date"), "prediction_date")
+    if err or planting_date is None or prediction_date is None:
+        return jsonify({"error": err or "planting_date and prediction_date are required."}), 400
+    if not 1 <= window <= DEFAULT_HORIZON_DAYS:
+        return jsonify({"error": f"window must be between 1 and {DEFAULT_HORIZON_DAYS}."}), 400
+    if storage_cost < 0:
+        return jsonify({"error": "storage_cost cannot be negative."}), 400
+
+    a = registry.current()
+    _, err = check_query(PredictionQuery(crop or "", city or "", prediction_date), a.crop_name_to_code, a.city_name_to_code, a.series_index)
+    if err:
+        return jsonify({"error": err}), 404
+    if current_grid(a) is None:
+        return jsonify({"error": "The forecast is still being prepared; try again shortly."}), 503
+    # Only the days the grid covers are scored and searched
+    reach = forecast_reach(crop, city, prediction_date, window + 1, a)
+    if not reach:
+        return jsonify({"error": f"The forecast for {crop} in {city} does not reach {prediction_date:%Y-%m-%d}."}), 404
+    curve, most_recent_price, err = predict_price_curve(crop, city, prediction_date, reach, a)
+    if err:
+        return jsonify({"error": err}), 404
+    with stage("sell_plan"):
+        plan = plan_sale(curve, prediction_date, planting_date, storage_cost)
+    if plan is None:
+        return jsonify({"error": f"No price estimate available for {crop} in {city}."}), 404
+
+    return jsonify({
+        "model_version": a.model_version,
+        "crop": crop,
+        "city": city,
+        "storage_cost_per_day": storage_cost,
+        "window_days": len(plan.dates) - 1,
+        "forecast_until": str(plan.dates[-1]),
+        "most_recent_price": most_recent_price,
+        "best": describe_sell_plan(plan),
+        "sell_now_value": round(plan.sell_now_value, 2) if np.isfinite(plan.sell_now_value) else None,
+        "curve": [
+            {
+                "date": str(d),
+                "price": round(float(p), 2) if np.isfinite(p) else None,
+                "net_value": round(float(v), 2) if np.isfinite(v) else None,
+            }
+            for d, p, v in zip(plan.dates, plan.prices, plan.values)
+        ],
+    })
+
+# Markets ranked by their best predicted price net of transport from the farmer's city
+@app.route("/api/markets")
+def markets_api():
+    crop, city = request.args.get("crop"), request.args.get("city")
+    days = request.args.get("days", MARKET_WINDOW_DAYS, type=int)
+    start, err = parse_date(request.args.get("start"), "start") if request.args.get("start") else (pd.Timestamp.today().normalize(), None)
+    if err:
+        return jsonify({"error": err}), 400
+    if not 1 <= days <= DEFAULT_HORIZON_DAYS:
+        return jsonify({"error": f"days must be between 1 and {DEFAULT_HORIZON_DAYS}."}), 400
+    if np.datetime64(start, "D") > forecast_limit():
+        return jsonify({"error": f"Forecasts reach up to {forecast_limit()}; choose an earlier start."}), 400
+
+    a = registry.current()
+    if crop not in a.crop_name_to_code:
+        return jsonify({"error": f"{crop} not found. Available crops: {list(a.crop_name_to_code.keys())}"}), 404
+    if city not in a.city_name_to_code:
+        return jsonify({"error": f"{city} not found. Available cities: {list(a.city_name_to_code.keys())}"}), 404
+    return jsonify({
+        "model_version": a.model_version,
+        "crop": crop,
+        "from_city": city,
+        "start": start.strftime("%Y-%m-%d"),
+        "days": days,
+        "markets": find_best_markets(crop, city, start, days, a),
+    })
+
+# Cached price trend chart
+@app.route("/charts/price_trend.png")
+def price_trend_chart():
+    # Charts show the history as stored, outliers included
+    series_index = registry.current().history_index
+    series = series_index.get(request.args.get("crop"), request.args.get("city"))
+    if series is None:
+        abort(404)
+
+    with stage("chart_render"):
+        path, key, hit = chart_cache.get_or_render(series, series_index.version)
+    CACHE_REQUESTS.inc(cache="chart", result="hit" if hit else "miss")
+    response = send_file(path, mimetype="image/png", etag=key, conditional=True)
+    if request.args.get("v") == series_index.version:
+        # The URL names this exact dataset version, so the image can never change
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = CHART_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+# Admin: reload model and data without restarting workers (disabled unless ADMIN_TOKEN is set)
+@app.route("/admin/artifacts", methods=["GET", "POST"])
+def admin_artifacts():
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        abort(404)
+    if request.method == "POST":
+        started = registry.reload(wait=request.args.get("wait") == "1")
+        return jsonify({"reload_started": started, **registry.status()}), 202
+    return jsonify(registry.status())
 
 if __name__ == "__main__":
-    # For development only. Use gunicorn/uwsgi in production.
-    app.run(debug=True, host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
\ No newline at end of file
+    # For development only. Use gunicorn in production: gunicorn -c gunicorn.conf.py wsgi:app
+    create_app().run(debug=True, host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
\ No newline at end of file
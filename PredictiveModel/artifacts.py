@@ -0,0 +1,371 @@
+"""Versioned, hot-reloadable model and dataset artifacts.
+
+An ``Artifacts`` bundle is an immutable snapshot of the city-wise model,
+the crop/city code maps, the combined dataset and everything derived from
+them (series index, monthly statistics, forecast grid). ``ArtifactRegistry``
+hands the current bundle to each request. A reload, triggered by the file
+watcher or the admin endpoint, builds a new bundle in the background,
+validates it with a smoke prediction and swaps it in with a single
+reference assignment, so in-flight requests finish on the bundle they
+started with. Derived caches are keyed by the bundle's version and are
+therefore invalidated by the swap.
+
+Artifacts are read from ``MYCROP_BASE_DIR`` (defaults to this directory)
+unless a registry is created for another directory. The model, code maps and
+baseline table come from the single versioned ``crop_price_model.bundle``
+(``model_bundle.py``) when there is one. Directories without it keep
+loading the separate pickle files.
+
+Predictions go through a ``TieredPredictor``. A strict registry (the
+default) serves the model only and refuses to load without it. A lenient
+registry (``strict=False``, used by ``app_with_webpage.py``) keeps serving
+in degraded mode. If the model is missing or fails, the precomputed
+(crop, city, season) baseline table answers instead. Missing code maps
+fall back to defaults, and a missing dataset to placeholder history.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import os
+import pickle
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import data_pipeline
+from batch_predict import SEASON_BY_MONTH, PredictionQuery, check_query, predict_batch
+from forecast_grid import ForecastGridBuilder
+from inference import as_predictor
+from model_bundle import BUNDLE_FILENAME, BundleError, load_bundle
+from monthly_stats import MonthlyStatsCube
+from predictors import BaselineTable, TieredPredictor
+from price_store import MANIFEST_FILENAME, STORE_DIRNAME, open_store
+from series_index import SeriesIndex
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(os.getenv("MYCROP_BASE_DIR", Path(__file__).resolve().parent))
+
+MODEL_FILENAME = "crop_price_model_xgboost_citywise.pkl"
+CROP_MAP_FILENAME = "crop_name_to_code.pkl"
+CITY_MAP_FILENAME = "city_name_to_code.pkl"
+# Imported into the price store (price_store.py) on first load
+COMBINED_DF_FILENAME = "combined_crop_data_citywise.xlsx"
+BASELINE_FILENAME = "crop_price_baseline_citywise.pkl"
+STORE_MANIFEST = f"{STORE_DIRNAME}/{MANIFEST_FILENAME}"
+WATCHED_FILENAMES = (
+    BUNDLE_FILENAME, MODEL_FILENAME, CROP_MAP_FILENAME, CITY_MAP_FILENAME, STORE_MANIFEST, BASELINE_FILENAME,
+)
+
+# Lenient-mode defaults when the mapping files cannot be loaded; codes follow
+# the alphabetical order prediction_model.py assigns
+DEFAULT_CROPS = ["Bengal Gram", "Jowar", "Maize", "Rice", "Wheat"]
+DEFAULT_CITIES = ["Mumbai", "Nagpur", "Nashik", "Pune", "Raigad", "Thane"]
+# Typical prices (INR/quintal) for placeholder history when there is no baseline table either
+DEFAULT_BASE_PRICES = {"Rice": 2500, "Wheat": 2200, "Bengal Gram": 5500, "Jowar": 2800, "Maize": 2000}
+
+# Seconds between file watcher polls; 0 disables the watcher
+WATCH_INTERVAL = float(os.getenv("ARTIFACT_WATCH_INTERVAL", 30))
+# XGBoost threads per process; workers provide the parallelism, and a single
+# thread keeps the model safe to use in processes forked after preloading
+MODEL_THREADS = int(os.getenv("MODEL_THREADS", 1))
+
+Artifacts = namedtuple(
+    "Artifacts",
+    [
+        "model", "crop_name_to_code", "city_name_to_code", "combined_df", "series_index",
+        "monthly_stats", "forecast_grids", "model_version", "version", "loaded_at",
+        "baseline", "predictor", "degraded", "history_index",
+    ],
+)
+
+
+def file_digest(path, length: int = 12) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+# Function to build placeholder monthly history when the dataset cannot be loaded (lenient mode)
+def placeholder_dataset(crop_name_to_code, city_name_to_code, baseline=None, seed=0) -> pd.DataFrame:
+    dates = pd.date_range(start="2020-01-01", end="2024-12-31", freq="ME")
+    crops = np.array(list(crop_name_to_code), dtype=object)
+    cities = np.array(list(city_name_to_code), dtype=object)
+    n = len(crops) * len(cities) * len(dates)
+    crop_col = np.repeat(crops, len(cities) * len(dates))
+    city_col = np.tile(np.repeat(cities, len(dates)), len(crops))
+    date_col = np.tile(dates.to_numpy(), len(crops) * len(cities))
+
+    # Seeded, so every worker process shows the same numbers
+    rng = np.random.default_rng(seed)
+    prices = np.array([DEFAULT_BASE_PRICES.get(c, 2500) for c in crop_col], dtype=np.float64) + rng.integers(0, 1000, n)
+    if baseline is not None:
+        known = baseline.lookup_codes(
+            [crop_name_to_code[c] for c in crop_col],
+            [city_name_to_code[c] for c in city_col],
+            SEASON_BY_MONTH[pd.DatetimeIndex(date_col).month.to_numpy()],
+        )
+        prices = np.where(np.isfinite(known), np.round(known, 2), prices)
+    return pd.DataFrame({"Date": date_col, "Crop": crop_col, "City": city_col, "Price": prices})
+
+
+def _load_model(model_path, strict):
+    logger.info(f"Loading model from: {model_path}")
+    if strict:
+        return joblib.load(str(model_path))
+    try:
+        try:
+            return joblib.load(str(model_path))
+        except (KeyError, ValueError, pickle.UnpicklingError) as e:
+            logger.warning(f"Joblib loading failed with {type(e).__name__}: {e}; trying pickle.")
+            with open(model_path, "rb") as f:
+                return pickle.load(f)
+    except Exception as e:
+        logger.error(f"Failed to load model: {e}")
+        return None
+
+
+def _load_legacy(base_dir: Path, strict, degraded):
+    """(model, crop_name_to_code, city_name_to_code, baseline) from the separate pickle files."""
+    model_path = base_dir / MODEL_FILENAME
+    baseline_path = base_dir / BASELINE_FILENAME
+
+    model = _load_model(model_path, strict)
+    if model is None:
+        degraded.append("model")
+    elif hasattr(model, "set_params"):
+        model.set_params(n_jobs=MODEL_THREADS)
+
+    try:
+        crop_name_to_code = joblib.load(str(base_dir / CROP_MAP_FILENAME))
+        city_name_to_code = joblib.load(str(base_dir / CITY_MAP_FILENAME))
+    except Exception as e:
+        if strict:
+            raise
+        logger.error(f"Failed to load mapping files: {e}; using default crop and city mappings.")
+        crop_name_to_code = {name: code for code, name in enumerate(DEFAULT_CROPS)}
+        city_name_to_code = {name: code for code, name in enumerate(DEFAULT_CITIES)}
+        degraded.append("mappings")
+
+    # Baseline table saved next to the model; otherwise built from the data below
+    baseline = None
+    if baseline_path.exists():
+        try:
+            baseline = BaselineTable.load(baseline_path)
+        except Exception as e:
+            logger.warning(f"Could not load baseline table {baseline_path}: {e}; rebuilding it from the dataset.")
+
+    return model, crop_name_to_code, city_name_to_code, baseline
+
+
+def _load_bundle(bundle_path: Path, strict):
+    try:
+        return load_bundle(bundle_path)
+    except BundleError as e:
+        if strict:
+            raise
+        logger.error(f"Rejected model bundle {bundle_path}: {e}; trying the separate model files.")
+        return None
+
+
+def load_artifacts(base_dir=BASE_DIR, previous=None, strict=True) -> Artifacts:
+    """Load a complete bundle, reusing unchanged derived data from ``previous``.
+
+    With ``strict=False`` a missing or broken model, mapping file or dataset
+    is replaced by its degraded-mode stand-in instead of raising.
+    """
+    base_dir = Path(base_dir)
+    bundle_path = base_dir / BUNDLE_FILENAME
+    degraded = []
+
+    bundle = _load_bundle(bundle_path, strict) if bundle_path.exists() else None
+    if bundle is not None:
+        model, crop_name_to_code, city_name_to_code, baseline = (
+            bundle.model, bundle.crop_name_to_code, bundle.city_name_to_code, bundle.baseline,
+        )
+        model.set_params(n_jobs=MODEL_THREADS)
+        logger.info(f"Loaded model bundle {bundle.version} from {bundle_path}.")
+    else:
+        model, crop_name_to_code, city_name_to_code, baseline = _load_legacy(base_dir, strict, degraded)
+
+    try:
+        combined_df = open_store(base_dir / STORE_DIRNAME, base_dir / COMBINED_DF_FILENAME).read()
+    except Exception as e:
+        if strict:
+            raise
+        logger.error(f"Failed to load combined dataset: {e}; using placeholder history.")
+        combined_df = placeholder_dataset(crop_name_to_code, city_name_to_code, baseline)
+        degraded.append("dataset")
+    # Users see the validated history as stored: statistics, recent prices and charts
+    history_index = SeriesIndex.from_frame(combined_df).shared("history")
+    # Features get the same cleaning as training, so served Prev_Price values come from the data the model learned on
+    cleaned_df, cleaning_stats = data_pipeline.clean(combined_df)
+    logger.info(
+        f"Cleaned feature history to {len(cleaned_df)} rows in {sum(s.seconds for s in cleaning_stats) * 1e3:.0f} ms: "
+        + ", ".join(f"{s.name} -{s.rows_in - s.rows_out}" for s in cleaning_stats)
+    )
+    series_index = SeriesIndex.from_frame(cleaned_df).shared()
+    monthly_stats = MonthlyStatsCube.build(history_index, previous.monthly_stats if previous else None)
+    if baseline is None:
+        baseline = BaselineTable.from_series_index(series_index, crop_name_to_code, city_name_to_code)
+
+    # The model tier scores on the extracted booster (inference.BoosterPredictor)
+    tiers = [("model", as_predictor(model))] + ([] if strict else [("baseline", baseline)])
+    predictor = TieredPredictor(tiers)
+
+    if bundle is not None:
+        model_version = bundle.version
+    else:
+        model_version = file_digest(base_dir / MODEL_FILENAME) if model is not None else f"baseline-{baseline.version}"
+    maps_version = hashlib.sha256(repr((sorted(crop_name_to_code.items()), sorted(city_name_to_code.items()))).encode()).hexdigest()[:8]
+    version = f"{model_version}-{maps_version}-{history_index.version}"
+    logger.info(f"Loaded artifacts {version}: {len(series_index)} crop/city series, predictor tiers {predictor.names}.")
+    if degraded:
+        logger.warning(f"Serving in degraded mode; unavailable: {', '.join(degraded)}.")
+
+    return Artifacts(
+        model, crop_name_to_code, city_name_to_code, combined_df, series_index,
+        monthly_stats, ForecastGridBuilder(), model_version, version, time.time(),
+        baseline, predictor, tuple(degraded), history_index,
+    )
+
+
+def current_grid(artifacts: Artifacts):
+    """Return the bundle's forecast grid, rolling it forward when the day changes."""
+    artifacts.forecast_grids.refresh(
+        artifacts.predictor, artifacts.series_index, artifacts.crop_name_to_code,
+        artifacts.city_name_to_code, artifacts.model_version,
+    )
+    return artifacts.forecast_grids.current
+
+
+def smoke_test(artifacts: Artifacts):
+    """Raise unless the bundle can score at least one series end to end."""
+    for series in artifacts.series_index:
+        query = PredictionQuery(series.crop, series.city, series.latest_date + pd.Timedelta(days=1))
+        if check_query(query, artifacts.crop_name_to_code, artifacts.city_name_to_code, artifacts.series_index)[1] is None:
+            break
+    else:
+        raise ValueError("Bundle has no series the model can predict for.")
+
+    price, _, err = predict_batch(
+        artifacts.predictor, [query], artifacts.crop_name_to_code, artifacts.city_name_to_code, artifacts.series_index
+    )[0]
+    if err or price is None or not math.isfinite(price):
+        raise ValueError(f"Smoke prediction failed for {query}: {err or price}")
+
+
+class ArtifactRegistry:
+    def __init__(self, base_dir=BASE_DIR, strict=True):
+        self.base_dir = Path(base_dir)
+        self.strict = strict
+        self._current = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stamps = None
+        self.last_error = None
+        self.last_reload_at = None
+
+    def current(self) -> Artifacts:
+        # Load synchronously the first time; later reloads happen in the background
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._stamps = self._file_stamps()
+                    artifacts = load_artifacts(self.base_dir, strict=self.strict)
+                    self._warm(artifacts)
+                    self._current = artifacts
+        return self._current
+
+    def _warm(self, artifacts: Artifacts):
+        artifacts.forecast_grids.refresh(
+            artifacts.predictor, artifacts.series_index, artifacts.crop_name_to_code,
+            artifacts.city_name_to_code, artifacts.model_version, wait=True,
+        )
+
+    def reload(self, wait: bool = False) -> bool:
+        """Load, validate and swap in a new bundle; returns False if one is already loading."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        thread = threading.Thread(target=self._reload, name="artifact-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self):
+        # Record what we are loading up front so a bad bundle is not retried until the files change again
+        self._stamps = self._file_stamps()
+        try:
+            previous = self._current
+            artifacts = load_artifacts(self.base_dir, previous, strict=self.strict)
+            smoke_test(artifacts)
+            if previous is not None and artifacts.version == previous.version:
+                logger.info(f"Artifacts unchanged ({artifacts.version}); keeping current bundle.")
+            else:
+                self._warm(artifacts)
+                self._current = artifacts
+                logger.info(f"Swapped in artifacts {artifacts.version}.")
+            self.last_error = None
+        except Exception as e:
+            logger.exception("Artifact reload failed; keeping the current bundle.")
+            self.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            self.last_reload_at = time.time()
+            self._reload_lock.release()
+
+    def _file_stamps(self):
+        stamps = {}
+        for name in WATCHED_FILENAMES:
+            try:
+                st = (self.base_dir / name).stat()
+                stamps[name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamps[name] = None
+        return stamps
+
+    def start_watcher(self, interval: float = WATCH_INTERVAL):
+        """Poll the artifact files and reload when any of them changes."""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                if self._stamps is not None and self._file_stamps() != self._stamps:
+                    logger.info("Artifact files changed on disk; reloading.")
+                    self.reload(wait=True)
+
+        self._watcher = threading.Thread(target=watch, name="artifact-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self) -> dict:
+        artifacts = self._current
+        return {
+            "version": artifacts.version if artifacts else None,
+            "model_version": artifacts.model_version if artifacts else None,
+            "dataset_version": artifacts.history_index.version if artifacts else None,
+            "loaded_at": artifacts.loaded_at if artifacts else None,
+            "predictor_tiers": artifacts.predictor.names if artifacts else None,
+            "degraded": list(artifacts.degraded) if artifacts else None,
+            "reloading": self._reload_lock.locked(),
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+        }
+
+
+registry = ArtifactRegistry()
+
+
+def get_artifacts() -> Artifacts:
+    return registry.current()
@@ -0,0 +1,304 @@
+"""Batched price prediction for the city-wise XGBoost model.
+
+A page render needs predictions for the selected crop, every soil
+suggestion and the +30-day storage check. Instead of one ``model.predict``
+per row, callers collect ``PredictionQuery`` tuples and score them with a
+single call over one NumPy feature matrix. Results come back per row as the
+same ``(predicted_price, most_recent_price, error)`` triple that
+``predict_crop_price`` has always returned.
+
+Cells the forecast grid does not answer (past its end, series it lacks, or
+every cell while it is building) are scored by ``score_misses`` with the
+grid's own method. In ``autoregressive`` mode a future date continues the
+rollout from the grid's last value for the series, or from its last
+observation, and a past date is predicted one step ahead from the observed
+price before it (or from the first price, for dates before the series
+starts). Only ``last_price`` mode predicts from the latest price.
+No rollout on the request path runs past ``forecast_limit()``: queries after
+it are rejected by ``check_query``, and block cells after it stay NaN.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from metrics import CACHE_REQUESTS, ERRORS, MODEL_CALLS, MODEL_ROWS, current_route, stage
+
+logger = logging.getLogger(__name__)
+
+# Column order the model was trained with in prediction_model.py
+FEATURE_COLUMNS = ["Year", "Month", "Day", "DayOfWeek", "Crop", "City", "Season", "Prev_Price"]
+
+# Season code per month (index 0 unused): 1 = Monsoon, 2 = Winter, 3 = Summer
+SEASON_BY_MONTH = np.array([0, 2, 2, 3, 3, 3, 1, 1, 1, 1, 3, 3, 2], dtype=np.int8)
+
+# Cities the model is not trusted for
+UNAVAILABLE_CITIES = {
+    "thane": "Predictions for Thane are unavailable due to insufficient data.",
+}
+
+# How many days past the forecast grid's horizon a request may still roll forward
+MAX_DAYS_PAST_GRID = int(os.getenv("MAX_DAYS_PAST_GRID", 365))
+
+PredictionQuery = namedtuple("PredictionQuery", ["crop", "city", "date"])
+
+
+def get_season(month: int) -> int:
+    return int(SEASON_BY_MONTH[month])
+
+
+def date_parts(dates):
+    """Return (year, month, day, dayofweek) arrays for datetime64 input."""
+    days = np.asarray(dates, dtype="datetime64[D]")
+    months_since_epoch = days.astype("datetime64[M]")
+    years = months_since_epoch.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = months_since_epoch.astype(np.int64) % 12 + 1
+    day_of_month = (days - months_since_epoch).astype(np.int64) + 1
+    # 1970-01-01 was a Thursday; pandas numbers Monday as 0
+    day_of_week = (days.astype(np.int64) + 3) % 7
+    return years, months, day_of_month, day_of_week
+
+
+def build_feature_matrix(dates, crop_codes, city_codes, prev_prices) -> np.ndarray:
+    years, months, days, day_of_week = date_parts(dates)
+    X = np.empty((len(years), len(FEATURE_COLUMNS)), dtype=np.float64)
+    X[:, 0] = years
+    X[:, 1] = months
+    X[:, 2] = days
+    X[:, 3] = day_of_week
+    X[:, 4] = crop_codes
+    X[:, 5] = city_codes
+    X[:, 6] = SEASON_BY_MONTH[months]
+    X[:, 7] = prev_prices
+    return X
+
+
+def forecast_limit():
+    """Last day a forecast is served for: the grid's horizon from today plus ``MAX_DAYS_PAST_GRID``."""
+    from forecast_grid import DEFAULT_HORIZON_DAYS
+
+    return np.datetime64(date.today(), "D") + DEFAULT_HORIZON_DAYS + MAX_DAYS_PAST_GRID
+
+
+def check_query(query, crop_name_to_code, city_name_to_code, series_index):
+    """Return (series, error) for one query without touching the model."""
+    if query.city.lower() in UNAVAILABLE_CITIES:
+        return None, UNAVAILABLE_CITIES[query.city.lower()]
+    if crop_name_to_code.get(query.crop) is None:
+        return None, f"{query.crop} not found. Available crops: {list(crop_name_to_code.keys())}"
+    if city_name_to_code.get(query.city) is None:
+        return None, f"{query.city} not found. Available cities: {list(city_name_to_code.keys())}"
+    series = series_index.get(query.crop, query.city)
+    if series is None:
+        return None, f"No historical price data for {query.crop} in {query.city}."
+    limit = forecast_limit()
+    if np.datetime64(pd.Timestamp(query.date), "D") > limit:
+        return None, f"Forecasts reach up to {limit}; choose an earlier date."
+    return series, None
+
+
+def _forecast_mode(grid, mode):
+    if grid is not None:
+        return grid.mode
+    if mode is None:
+        from forecast_grid import DEFAULT_FORECAST_MODE
+
+        mode = DEFAULT_FORECAST_MODE
+    return mode
+
+
+def _price_before(series, day):
+    # Dates before a series' first observation start from its first price
+    price = series.price_on_or_before(day - 1)
+    return float(series.prices[0]) if price is None else price
+
+
+def score_misses(model, series, crop_codes, city_codes, dates, grid=None, mode=None) -> np.ndarray:
+    """Prices for cells the grid did not answer, forecast the way the grid would have been.
+
+    ``series`` holds the ``PriceSeries`` of each cell. Cells no predictor can
+    answer, and cells past ``forecast_limit()``, are NaN; an exception from
+    the model propagates.
+    """
+    from forecast_engine import rollout
+
+    mode = _forecast_mode(grid, mode)
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    crop_codes, city_codes = np.asarray(crop_codes), np.asarray(city_codes)
+    out = np.full(len(dates), np.nan)
+    if not len(dates):
+        return out
+
+    if mode == "last_price":
+        one_step = np.arange(len(dates))
+        prev = np.array([s.latest_price for s in series], dtype=np.float64)
+    else:
+        last_obs = np.array([np.datetime64(s.latest_date, "D") for s in series])
+        one_step = np.flatnonzero(dates <= last_obs)
+        # Past dates: one step ahead from the price observed before them
+        prev = np.array([_price_before(series[j], dates[j]) for j in one_step], dtype=np.float64)
+
+        # Future dates: keep rolling forward from the grid's last day, or from the last observation
+        future = {}
+        for j in np.flatnonzero((dates > last_obs) & (dates <= forecast_limit())):
+            future.setdefault((series[j].crop, series[j].city), []).append(j)
+        if future:
+            cells = [np.array(idx) for idx in future.values()]
+            starts, firsts = [], []
+            for idx in cells:
+                end = grid.end(series[idx[0]].crop, series[idx[0]].city) if grid is not None else None
+                # A grid that left some of these cells NaN is recomputed from the observation
+                if end is not None and (dates[idx] >= end[0]).all():
+                    start, first = end
+                else:
+                    start, first = last_obs[idx[0]] + 1, series[idx[0]].latest_price
+                starts.append(start)
+                firsts.append(first)
+            starts = np.array(starts, dtype="datetime64[D]")
+            steps = max(int((dates[idx] - start).astype(np.int64).max()) + 1 for idx, start in zip(cells, starts))
+            with stage("model_predict"):
+                path = rollout(
+                    model, [crop_codes[idx[0]] for idx in cells], [city_codes[idx[0]] for idx in cells],
+                    starts, firsts, steps,
+                )
+            for k, (idx, start) in enumerate(zip(cells, starts)):
+                out[idx] = path[k, (dates[idx] - start).astype(np.int64)]
+
+    known = np.isfinite(prev)
+    if known.any():
+        cells = one_step[known]
+        with stage("build_features"):
+            X = build_feature_matrix(dates[cells], crop_codes[cells], city_codes[cells], prev[known])
+        MODEL_CALLS.inc()
+        MODEL_ROWS.inc(len(cells))
+        with stage("model_predict"):
+            out[cells] = model.predict(X)
+    return out
+
+
+def predict_batch(model, queries, crop_name_to_code, city_name_to_code, series_index, grid=None, mode=None):
+    """Score every valid query in as few model calls as possible.
+
+    ``model`` is anything with ``predict(X)``: the XGBoost model itself or a
+    ``predictors.TieredPredictor``. Queries covered by a materialized
+    ``ForecastGrid`` are answered from it and never reach the model; the
+    rest go through ``score_misses`` in the grid's ``mode`` (or ``mode``
+    while there is no grid).
+    """
+    results = [None] * len(queries)
+    rows = []
+    for i, query in enumerate(queries):
+        series, err = check_query(query, crop_name_to_code, city_name_to_code, series_index)
+        if err:
+            results[i] = (None, None, err)
+            continue
+        cached = grid.lookup(query.crop, query.city, query.date) if grid is not None else None
+        if cached is not None:
+            results[i] = (cached[0], cached[1], None)
+        else:
+            rows.append((i, series))
+
+    if grid is not None:
+        misses = len(rows)
+        hits = sum(r is not None and r[2] is None for r in results)
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache="forecast_grid", result="hit")
+        if misses:
+            CACHE_REQUESTS.inc(misses, cache="forecast_grid", result="miss")
+
+    if not rows:
+        return results
+
+    positions = [i for i, _ in rows]
+    series = [s for _, s in rows]
+    try:
+        preds = score_misses(
+            model, series,
+            [crop_name_to_code[queries[i].crop] for i in positions],
+            [city_name_to_code[queries[i].city] for i in positions],
+            pd.to_datetime([queries[i].date for i in positions]).to_numpy(dtype="datetime64[D]"),
+            grid, mode,
+        )
+    except Exception:
+        logger.exception("Model prediction failed.")
+        ERRORS.inc(route=current_route(), kind="model_predict")
+        for i in positions:
+            results[i] = (None, None, "Model prediction error: verify model and feature alignment.")
+        return results
+
+    for i, pred, s in zip(positions, preds, series):
+        if np.isfinite(pred):
+            results[i] = (float(pred), s.latest_price, None)
+        else:
+            results[i] = (None, None, f"No price estimate available for {queries[i].crop} in {queries[i].city}.")
+    return results
+
+
+def predict_block(model, crop, cities, start, days, crop_name_to_code, city_name_to_code, series_index, grid=None, mode=None):
+    """Score one crop across ``cities`` x ``days`` consecutive days from ``start``.
+
+    Returns ``(prices, most_recent_prices, errors)``. ``prices`` is a
+    (len(cities), days) float array with NaN for rows that have an error or
+    that no predictor could answer. ``errors`` holds one message or None per
+    city. Cells covered by ``grid`` are sliced from it, and every other cell
+    goes through ``score_misses``. If the model fails there, only those cells
+    are blanked, and cities left with no price get the error.
+    """
+    start = np.datetime64(pd.Timestamp(start), "D")
+    prices = np.full((len(cities), days), np.nan)
+    latest = np.full(len(cities), np.nan)
+    errors = [None] * len(cities)
+    for i, city in enumerate(cities):
+        series, err = check_query(PredictionQuery(crop, city, start), crop_name_to_code, city_name_to_code, series_index)
+        if err:
+            errors[i] = err
+            continue
+        latest[i] = series.latest_price
+        cached = grid.values(crop, city, start, days) if grid is not None else None
+        if cached is not None:
+            prices[i] = cached
+
+    series = [series_index.get(crop, city) if err is None else None for city, err in zip(cities, errors)]
+    valid = np.array([err is None for err in errors], dtype=bool)
+    rows, offsets = np.nonzero(~np.isfinite(prices) & valid[:, None])
+    if grid is not None:
+        hits = int(valid.sum()) * days - len(rows)
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache="forecast_grid", result="hit")
+        if len(rows):
+            CACHE_REQUESTS.inc(len(rows), cache="forecast_grid", result="miss")
+    if not len(rows):
+        return prices, latest, errors
+
+    city_codes = np.array([city_name_to_code.get(city, -1) for city in cities])
+    try:
+        prices[rows, offsets] = score_misses(
+            model, [series[i] for i in rows], np.full(len(rows), crop_name_to_code[crop]), city_codes[rows],
+            start + offsets, grid, mode,
+        )
+    except Exception:
+        logger.exception("Model prediction failed.")
+        ERRORS.inc(route=current_route(), kind="model_predict")
+        prices[rows, offsets] = np.nan
+        for i in np.unique(rows):
+            if not np.isfinite(prices[i]).any():
+                errors[i] = "Model prediction error: verify model and feature alignment."
+    return prices, latest, errors
+
+
+def predict_days(model, crop, city, start, days, crop_name_to_code, city_name_to_code, series_index, grid=None, mode=None):
+    """Score ``days`` consecutive days from ``start`` for one crop and city.
+
+    Returns ``(prices, most_recent_price, error)``; see ``predict_block``.
+    """
+    prices, latest, errors = predict_block(
+        model, crop, [city], start, days, crop_name_to_code, city_name_to_code, series_index, grid, mode
+    )
+    if errors[0]:
+        return None, None, errors[0]
+    return prices[0], float(latest[0]), None
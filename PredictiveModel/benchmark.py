@@ -0,0 +1,458 @@
+"""Reproducible benchmark for the price prediction web app.
+
+Builds a synthetic price store (Date, Crop, City, Price; see
+``price_store.py``) plus a stub or real XGBoost model in a
+work directory, points ``app_with_webpage_fixed.py`` at it through
+``MYCROP_BASE_DIR`` and runs each scenario in a fresh subprocess, so cold
+paths are really cold and peak RSS belongs to that scenario alone.
+
+Scenarios (Flask test client, sequential requests):
+    startup_cold       first load in a fresh process (reads the price store)
+    startup_warm       the same load again; the store's files are in the page cache
+    single             form POST for a city with no crop suggestions
+    suggestions        form POST that also scores the soil suggestions
+    suggestions_model  same, but beyond the forecast grid so model.predict runs
+    chart_cold         trend chart request that has to render the PNG
+    chart_warm         trend chart request served from the chart cache
+
+With ``--server`` the form scenarios are also driven over HTTP against
+gunicorn (``gunicorn.conf.py``), with ``--concurrency`` parallel clients.
+
+Each scenario reports throughput, p50/p95/p99 latency, tracemalloc
+allocations per request (test client only) and peak RSS. Results are
+written to JSON; ``--compare`` prints the change against an earlier run.
+
+Usage:
+    python benchmark.py                        # stub model, all scenarios
+    python benchmark.py --model xgboost --server --concurrency 1,4,16
+    python benchmark.py --compare benchmark-20250101-120000.json
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+
+CROPS = ["Bengal Gram", "Jowar", "Maize", "Rice", "Wheat"]
+CITIES = ["Mumbai", "Nagpur", "Nashik", "Pune", "Raigad", "Thane"]
+BASE_PRICES = {"Bengal Gram": 5000, "Jowar": 3000, "Maize": 2000, "Rice": 3500, "Wheat": 2600}
+
+CLIENT_SCENARIOS = [
+    "startup_cold", "startup_warm", "single", "suggestions", "suggestions_model", "chart_cold", "chart_warm",
+]
+SERVER_SCENARIOS = ["single", "suggestions", "suggestions_model"]
+
+# Fraction of --requests run for the expensive scenarios
+REQUEST_SCALE = {"chart_cold": 0.1}
+ALLOC_SAMPLE = 50
+
+
+class StubModel:
+    """Cheap stand-in for the XGBoost model: seasonal swing around the previous price."""
+
+    def set_params(self, **params):
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return X[:, 7] * (1 + 0.04 * np.sin(2 * np.pi * X[:, 1] / 12)) + 0.5 * (X[:, 0] - 2020)
+
+
+# Function to generate a dataset with the combined workbook's schema
+def synthetic_dataset(start="2019-01-01", end="2025-01-31", coverage=0.8, seed=42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, end, freq="D")
+    frames = []
+    for crop in CROPS:
+        for city in CITIES:
+            keep = days[rng.random(len(days)) < coverage]
+            walk = np.cumsum(rng.normal(0, 0.01, len(keep)))
+            seasonal = 0.08 * np.sin(2 * np.pi * keep.dayofyear.to_numpy() / 365.25)
+            price = BASE_PRICES[crop] * (1 + 0.1 * rng.random()) * np.exp(walk + seasonal)
+            frames.append(pd.DataFrame({"Date": keep, "Crop": crop, "City": city, "Price": np.round(price)}))
+    return pd.concat(frames).sort_values(["Date", "Crop", "City"]).reset_index(drop=True)
+
+
+# Function to train a small XGBoost model on the synthetic data, as prediction_model.py does
+def train_xgboost(df, crop_name_to_code, city_name_to_code):
+    from xgboost import XGBRegressor
+
+    from batch_predict import build_feature_matrix
+
+    df = df.sort_values(["Crop", "City", "Date"])
+    prev = df.groupby(["Crop", "City"])["Price"].shift(1)
+    mask = prev.notna().to_numpy()
+    X = build_feature_matrix(
+        df["Date"].to_numpy()[mask],
+        df["Crop"].map(crop_name_to_code).to_numpy()[mask],
+        df["City"].map(city_name_to_code).to_numpy()[mask],
+        prev.to_numpy()[mask],
+    )
+    model = XGBRegressor(n_estimators=100, random_state=42, learning_rate=0.05, max_depth=4, reg_lambda=1.0, reg_alpha=0.1)
+    model.fit(X, df["Price"].to_numpy()[mask])
+    return model
+
+
+# Function to write the dataset, code maps and model the app expects into work_dir
+def prepare_work_dir(work_dir: Path, model_kind: str, rebuild: bool = False) -> dict:
+    from artifacts import CITY_MAP_FILENAME, CROP_MAP_FILENAME, MODEL_FILENAME
+    from price_store import STORE_DIRNAME, PriceStore
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    stamp = work_dir / "benchmark.json"
+    info = json.loads(stamp.read_text()) if stamp.exists() else {}
+    if not rebuild and info.get("model") == model_kind:
+        return info
+
+    start = time.perf_counter()
+    df = synthetic_dataset()
+    PriceStore.create(work_dir / STORE_DIRNAME, df)
+    crop_name_to_code = {c: i for i, c in enumerate(CROPS)}
+    city_name_to_code = {c: i for i, c in enumerate(CITIES)}
+    joblib.dump(crop_name_to_code, work_dir / CROP_MAP_FILENAME)
+    joblib.dump(city_name_to_code, work_dir / CITY_MAP_FILENAME)
+
+    if model_kind == "xgboost":
+        model = train_xgboost(df, crop_name_to_code, city_name_to_code)
+    else:
+        # Import by module name so the pickle does not point at __main__
+        import benchmark
+
+        model = benchmark.StubModel()
+    joblib.dump(model, work_dir / MODEL_FILENAME)
+
+    info = {"model": model_kind, "rows": len(df), "series": int(df.groupby(["Crop", "City"]).ngroups)}
+    stamp.write_text(json.dumps(info))
+    print(f"Prepared {info['rows']} rows and a {model_kind} model in {work_dir} ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    return info
+
+
+def form_data(scenario: str) -> dict:
+    today = date.today()
+    if scenario == "single":
+        # Raigad's soil has no suggested crops, so the page scores two queries
+        crop, city, ahead = "Rice", "Raigad", 60
+    elif scenario == "suggestions":
+        crop, city, ahead = "Wheat", "Pune", 60
+    else:
+        # Past the forecast grid horizon, so every query goes to the model
+        crop, city, ahead = "Wheat", "Pune", 3 * 365
+    return {
+        "crop_name": crop,
+        "city_name": city,
+        "planting_date": today.isoformat(),
+        "prediction_date": (today + timedelta(days=ahead)).isoformat(),
+        "yield_q": "10",
+    }
+
+
+def percentiles(latencies) -> dict:
+    lat = sorted(latencies)
+    pick = lambda p: round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 3)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "mean_ms": round(statistics.fmean(lat) * 1000, 3)}
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Function to run one test-client scenario in this process and return its result
+def run_client_scenario(scenario: str, requests: int, warmup: int) -> dict:
+    work_dir = Path(os.environ["MYCROP_BASE_DIR"])
+    start = time.perf_counter()
+    import app_with_webpage_fixed as web
+
+    if scenario.startswith("startup"):
+        web.create_app(watch=False)
+        elapsed = time.perf_counter() - start
+        return {"requests": 1, "total_s": round(elapsed, 4), **percentiles([elapsed]), "peak_rss_bytes": peak_rss_bytes()}
+
+    web.create_app(watch=False)
+    client = web.app.test_client()
+    chart_root = Path(tempfile.mkdtemp(prefix="charts-", dir=work_dir))
+    web.chart_cache = web.ChartCache(chart_root / "warm", max_bytes=web.CHART_CACHE_MAX_BYTES)
+    version = web.registry.current().history_index.version
+    chart_url = f"/charts/price_trend.png?crop=Wheat&city=Pune&v={version}"
+
+    def one(i):
+        if scenario == "chart_cold":
+            # A fresh cache directory per request forces a render
+            web.chart_cache = web.ChartCache(chart_root / f"cold-{i}", max_bytes=web.CHART_CACHE_MAX_BYTES)
+            response = client.get(chart_url)
+        elif scenario == "chart_warm":
+            response = client.get(chart_url)
+        else:
+            response = client.post("/", data=form_data(scenario))
+        assert response.status_code == 200, f"{scenario}: HTTP {response.status_code}"
+        response.get_data()
+
+    for i in range(warmup):
+        one(-i - 1)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        one(i)
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+
+    # Allocation profile in a separate pass; tracemalloc slows requests down
+    tracemalloc.start()
+    peaks = []
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(min(ALLOC_SAMPLE, requests)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        one(requests + i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    shutil.rmtree(chart_root, ignore_errors=True)
+
+    return {
+        "requests": requests,
+        "total_s": round(total, 4),
+        "throughput_rps": round(requests / total, 2),
+        **percentiles(latencies),
+        "alloc_peak_kib_per_request": round(statistics.median(peaks) / 1024, 1),
+        "alloc_retained_kib": round(retained / 1024, 1),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def median_result(runs) -> dict:
+    """Per-metric median over repeated runs, plus the spread of p50."""
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    if len(runs) > 1:
+        result["runs"] = len(runs)
+        result["p50_ms_range"] = [min(run["p50_ms"] for run in runs), max(run["p50_ms"] for run in runs)]
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree_rss(pid: int) -> int:
+    """Sum of peak RSS (VmHWM) of a process and its children; Linux only."""
+    total = 0
+    pids = [pid]
+    for child in Path(f"/proc/{pid}/task").glob("*/children"):
+        pids += [int(p) for p in child.read_text().split()]
+    for p in pids:
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def http_load(port: int, scenario: str, concurrency: int, duration: float) -> dict:
+    body = urllib.parse.urlencode(form_data(scenario))
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        mine, failed = [], 0
+        while time.perf_counter() < stop:
+            t = time.perf_counter()
+            conn.request("POST", "/", body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                failed += 1
+            mine.append(time.perf_counter() - t)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "total_s": round(total, 4),
+        "throughput_rps": round(len(latencies) / total, 2),
+        **percentiles(latencies),
+    }
+
+
+# Function to drive the form scenarios through gunicorn with concurrent clients
+def run_server(work_dir: Path, concurrency_levels, duration: float, workers: int) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "MYCROP_BASE_DIR": str(work_dir),
+        "MYCROP_SHARED_DIR": str(work_dir / "shared"),
+        "BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": str(workers),
+        "ARTIFACT_WATCH_INTERVAL": "0",
+    }
+    env.pop("MYCROP_METRICS_DIR", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                conn.request("GET", "/")
+                conn.getresponse().read()
+                break
+            except OSError:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("gunicorn did not start; run it by hand with gunicorn.conf.py to see why.")
+                time.sleep(0.5)
+
+        results = {}
+        for scenario in SERVER_SCENARIOS:
+            for level in concurrency_levels:
+                http_load(port, scenario, level, min(1.0, duration))  # warm up
+                result = http_load(port, scenario, level, duration)
+                result["peak_rss_bytes"] = process_tree_rss(server.pid)
+                results[f"server_{scenario}_c{level}"] = result
+                print(f"  server_{scenario}_c{level}: {summary(result)}", file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def summary(result: dict) -> str:
+    rps = result.get("throughput_rps")
+    rate = f"{rps:.1f} req/s, " if rps else ""
+    return f"{rate}p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+
+
+def compare(previous: dict, current: dict):
+    print(f"{'scenario':<32}{'metric':<28}{'before':>12}{'after':>12}{'change':>10}")
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p99_ms", "alloc_peak_kib_per_request", "peak_rss_bytes"):
+            if metric in result and old.get(metric):
+                change = (result[metric] - old[metric]) / old[metric] * 100
+                print(f"{name:<32}{metric:<28}{old[metric]:>12.6g}{result[metric]:>12.6g}{change:>+9.1f}%")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the price prediction web app.")
+    parser.add_argument("--model", choices=["stub", "xgboost"], default="stub")
+    parser.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir()) / "mycrop-benchmark")
+    parser.add_argument("--rebuild", action="store_true", help="regenerate the synthetic dataset and model")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1, help="fresh processes per scenario; the median is reported")
+    parser.add_argument("--scenarios", default=",".join(CLIENT_SCENARIOS))
+    parser.add_argument("--server", action="store_true", help="also load-test through gunicorn")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated client counts for --server")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per --server run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="gunicorn workers for --server")
+    parser.add_argument("--output", type=Path, default=Path(f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        # Child process: one scenario, result as JSON on stdout
+        result = run_client_scenario(args.run_scenario, args.requests, args.warmup)
+        print(json.dumps(result))
+        return
+
+    work_dir = args.work_dir.resolve()
+    info = prepare_work_dir(work_dir, args.model, args.rebuild)
+    env = {**os.environ, "MYCROP_BASE_DIR": str(work_dir), "MYCROP_SHARED_DIR": "", "ARTIFACT_WATCH_INTERVAL": "0"}
+    env.pop("MYCROP_METRICS_DIR", None)
+
+    scenarios = {}
+    for scenario in args.scenarios.split(","):
+        requests = max(1, int(args.requests * REQUEST_SCALE.get(scenario, 1.0)))
+        warmup = 0 if scenario.endswith("cold") else args.warmup
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--run-scenario", scenario,
+                 "--requests", str(requests), "--warmup", str(warmup)],
+                cwd=HERE, env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                raise SystemExit(f"Scenario {scenario} failed.")
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        scenarios[scenario] = median_result(runs)
+        print(f"  {scenario}: {summary(scenarios[scenario])}", file=sys.stderr)
+
+    if args.server:
+        levels = [int(c) for c in args.concurrency.split(",")]
+        scenarios.update(run_server(work_dir, levels, args.duration, args.workers))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": args.model,
+            "dataset_rows": info["rows"],
+            "dataset_series": info["series"],
+        },
+        "scenarios": scenarios,
+    }
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Content-addressed, thread-safe cache of price trend PNGs.
+
+Charts are keyed by (crop, city, dataset version, size) and written under a
+hash-derived file name, so concurrent users never overwrite each other's
+images and a cache hit is just a file send. Rendering uses the
+object-oriented ``Figure`` API, which keeps no global pyplot state, and the
+cache directory is held under a disk budget with least-recently-used
+eviction.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from matplotlib.figure import Figure
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = (10, 6)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def chart_key(crop: str, city: str, dataset_version: str, size=DEFAULT_SIZE) -> str:
+    raw = f"{crop}\x00{city}\x00{dataset_version}\x00{size[0]}x{size[1]}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:24]
+
+
+def render_price_trend(series, size=DEFAULT_SIZE) -> Figure:
+    fig = Figure(figsize=size)
+    ax = fig.subplots()
+    ax.plot(series.dates, series.prices, marker="o", linestyle="-", label=f"{series.crop} Price in {series.city}")
+    ax.set_title(f"Historical Price Trend for {series.crop} in {series.city}")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Price (INR/quintal)")
+    ax.grid(True)
+    ax.legend()
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+class ChartCache:
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+        # Adopt charts left by a previous run, oldest first
+        for path in sorted(self.directory.glob("trend_*.png"), key=lambda p: p.stat().st_mtime):
+            self._entries[path.name] = path.stat().st_size
+            self._total_bytes += path.stat().st_size
+        self._evict()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"trend_{key}.png"
+
+    def get_or_render(self, series, dataset_version: str, size=DEFAULT_SIZE):
+        """Return (path, key, hit) for the chart, rendering it on a miss."""
+        key = chart_key(series.crop, series.city, dataset_version, size)
+        path = self.path_for(key)
+        if self._touch(path):
+            return path, key, True
+
+        # Only one thread renders a given chart; the others wait and reuse it
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                if self._touch(path):
+                    return path, key, True
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                try:
+                    fig = render_price_trend(series, size)
+                    fig.savefig(str(tmp), format="png", bbox_inches="tight")
+                    os.replace(tmp, path)
+                except BaseException:
+                    # Leave no half-written file behind for a failed render
+                    tmp.unlink(missing_ok=True)
+                    raise
+                with self._lock:
+                    self._add(path)
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return path, key, False
+
+    def _touch(self, path: Path) -> bool:
+        with self._lock:
+            if path.name in self._entries:
+                self._entries.move_to_end(path.name)
+                if path.exists():
+                    return True
+                self._total_bytes -= self._entries.pop(path.name)
+                return False
+        # Another worker process may already have rendered it
+        if path.exists():
+            with self._lock:
+                self._add(path)
+            return True
+        return False
+
+    def _add(self, path: Path):
+        # Caller holds self._lock
+        if path.name in self._entries:
+            self._entries.move_to_end(path.name)
+            return
+        size = path.stat().st_size
+        self._entries[path.name] = size
+        self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock (or is __init__); keep the newest entry even if over budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self.directory / name).unlink()
+            except FileNotFoundError:
+                pass
+            logger.info(f"Evicted cached chart {name} ({size} bytes).")
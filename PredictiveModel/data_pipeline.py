@@ -0,0 +1,166 @@
+"""Cleaning and feature engineering shared by training and serving.
+
+``prediction_model.py`` cleans the combined dataset and builds its training
+features with these functions, and ``artifacts.load_artifacts`` cleans the
+served history the same way. The ``Prev_Price`` values and date features
+the model sees in production are therefore produced exactly as in
+training. Date features come from ``batch_predict.build_feature_matrix``,
+the same code that scores requests.
+
+Every stage is a whole-frame operation: group statistics use
+``groupby(...).transform``/``map`` instead of per-group loops, and seasons
+are an array lookup. ``run_stages`` times each stage and, when asked,
+records its peak traced memory.
+
+Rows from the price store have already been through ``validation.validate``,
+so the row-level stages usually find nothing to drop; they then return their
+input as it is rather than copying it.
+"""
+from __future__ import annotations
+
+import logging
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import FEATURE_COLUMNS, SEASON_BY_MONTH, build_feature_matrix, date_parts
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ["Crop", "City"]
+# Prices below this (INR/quintal) are data-entry errors
+MIN_PRICE = 1000
+# Prices outside [Q1 - k*IQR, Q3 + k*IQR] of their crop are dropped
+IQR_FACTOR = 1.5
+
+StageStats = namedtuple("StageStats", ["name", "seconds", "rows_in", "rows_out", "peak_bytes"])
+
+
+def drop_missing_keys(df: pd.DataFrame) -> pd.DataFrame:
+    missing = df[["Date", "Crop", "City"]].isna().any(axis=1)
+    return df[~missing] if missing.any() else df
+
+
+def fill_missing_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Fill missing prices with their (crop, city) mean; drop series with no prices at all."""
+    if df["Price"].isna().any():
+        df = df.assign(Price=df["Price"].fillna(df.groupby(KEY_COLUMNS, observed=True)["Price"].transform("mean")))
+    return df.dropna(subset=["Price"]) if df["Price"].isna().any() else df
+
+
+def drop_low_prices(df: pd.DataFrame, min_price: float = MIN_PRICE) -> pd.DataFrame:
+    keep = df["Price"] >= min_price
+    if keep.all() and df.index.equals(pd.RangeIndex(len(df))):
+        return df
+    return df[keep].reset_index(drop=True)
+
+
+def outlier_bounds(df: pd.DataFrame, factor: float = IQR_FACTOR) -> pd.DataFrame:
+    """Per-crop (lower, upper) IQR bounds."""
+    quartiles = df.groupby("Crop", observed=True)["Price"].quantile([0.25, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    return pd.DataFrame({"lower": quartiles[0.25] - factor * iqr, "upper": quartiles[0.75] + factor * iqr})
+
+
+def remove_outliers(df: pd.DataFrame, factor: float = IQR_FACTOR) -> pd.DataFrame:
+    bounds = outlier_bounds(df, factor)
+    lower = df["Crop"].map(bounds["lower"]).to_numpy(dtype=np.float64)
+    upper = df["Crop"].map(bounds["upper"]).to_numpy(dtype=np.float64)
+    prices = df["Price"].to_numpy(dtype=np.float64)
+    # Rows of a crop without bounds are kept, as comparisons with NaN are False
+    return df[~((prices > upper) | (prices < lower))]
+
+
+def find_gaps(df: pd.DataFrame, max_gap_days: int = 1) -> pd.DataFrame:
+    """(City, Crop, max_gap_days) for every series with a gap longer than ``max_gap_days``."""
+    ordered = df.sort_values(["City", "Crop", "Date"])
+    gaps = ordered.groupby(["City", "Crop"], observed=True, sort=False)["Date"].diff().dt.days
+    longest = gaps.groupby([ordered["City"], ordered["Crop"]], observed=True, sort=False).max()
+    longest = longest[longest > max_gap_days]
+    return longest.rename("max_gap_days").reset_index()
+
+
+def add_date_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Year, Month, Day, DayOfWeek and Season, computed as on the request path."""
+    years, months, days, day_of_week = date_parts(df["Date"].to_numpy(dtype="datetime64[ns]"))
+    return df.assign(Year=years, Month=months, Day=days, DayOfWeek=day_of_week, Season=SEASON_BY_MONTH[months])
+
+
+def add_prev_price(df: pd.DataFrame) -> pd.DataFrame:
+    """Previous observed price within each (crop, city) series; drops each series' first row."""
+    df = df.sort_values(["Crop", "City", "Date"])
+    # Shift the sorted prices by one and blank each series' first row
+    first = (df["Crop"].ne(df["Crop"].shift()) | df["City"].ne(df["City"].shift())).to_numpy()
+    prices = df["Price"].to_numpy(dtype=np.float64)
+    prev = np.empty_like(prices)
+    prev[1:] = prices[:-1]
+    prev[first] = np.nan
+    prev = pd.Series(prev, index=df.index)
+    # Only missing prices leave gaps after the shift; carry the last price forward within the series
+    if prev[~first].isna().any():
+        prev = prev.groupby([df["Crop"], df["City"]], observed=True).ffill()
+    return df.assign(Prev_Price=prev).dropna()
+
+
+def encode_categories(df: pd.DataFrame):
+    """Replace Crop and City with their alphabetical codes; returns (df, crop_name_to_code, city_name_to_code)."""
+    # Codes follow the crops and cities present, even when the columns come in as categoricals
+    crop_mapping = df["Crop"].astype("category").cat.remove_unused_categories()
+    city_mapping = df["City"].astype("category").cat.remove_unused_categories()
+    crop_name_to_code = dict(zip(crop_mapping, crop_mapping.cat.codes))
+    city_name_to_code = dict(zip(city_mapping, city_mapping.cat.codes))
+    return df.assign(Crop=crop_mapping.cat.codes, City=city_mapping.cat.codes), crop_name_to_code, city_name_to_code
+
+
+def feature_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Model input for encoded rows, built by the same function that scores requests."""
+    X = build_feature_matrix(
+        df["Date"].to_numpy(dtype="datetime64[ns]"), df["Crop"].to_numpy(), df["City"].to_numpy(), df["Prev_Price"].to_numpy()
+    )
+    return pd.DataFrame(X, columns=FEATURE_COLUMNS, index=df.index)
+
+
+# Cleaning applied to the dataset before training and before serving
+CLEANING_STAGES = [
+    ("drop_missing_keys", drop_missing_keys),
+    ("fill_missing_prices", fill_missing_prices),
+    ("drop_low_prices", drop_low_prices),
+    ("remove_outliers", remove_outliers),
+]
+
+
+def run_stages(df: pd.DataFrame, stages, profile_memory: bool = False):
+    """Apply ``(name, function)`` stages in order; returns (df, [StageStats])."""
+    stats = []
+    for name, function in stages:
+        rows_in = len(df)
+        tracing = profile_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif profile_memory:
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        df = function(df)
+        seconds = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] if profile_memory else None
+        if tracing:
+            tracemalloc.stop()
+        stats.append(StageStats(name, seconds, rows_in, len(df), peak))
+        logger.debug(f"{name}: {rows_in} -> {len(df)} rows in {seconds * 1e3:.1f} ms")
+    return df, stats
+
+
+def clean(df: pd.DataFrame, profile_memory: bool = False):
+    """Run ``CLEANING_STAGES``; returns (df, [StageStats])."""
+    return run_stages(df, CLEANING_STAGES, profile_memory)
+
+
+def format_stats(stats) -> str:
+    lines = [f"{'stage':<22}{'rows in':>10}{'rows out':>10}{'ms':>10}{'peak MiB':>10}"]
+    for s in stats:
+        peak = f"{s.peak_bytes / 2**20:.1f}" if s.peak_bytes is not None else "-"
+        lines.append(f"{s.name:<22}{s.rows_in:>10}{s.rows_out:>10}{s.seconds * 1e3:>10.1f}{peak:>10}")
+    return "\n".join(lines)
@@ -0,0 +1,173 @@
+"""Fast startup loading of combined_crop_data_citywise.xlsx.
+
+Parsing the workbook with openpyxl takes seconds and every worker used to
+pay it on start. The first read now also writes a columnar sidecar next to
+the workbook (``<name>.colcache/``) holding one ``.npy`` file per column,
+with Crop and City stored as small integer codes plus their category
+labels. Later loads memory-map those arrays and take milliseconds.
+
+The sidecar records the source file's mtime, size and SHA-256. A matching
+mtime and size is trusted directly; otherwise the hash decides whether the
+sidecar is still valid or has to be rebuilt.
+
+Daily prices that older versions of ``update_model.py`` appended to
+``<stem>.updates.csv`` next to the workbook are still honoured:
+``load_dataset`` returns the workbook plus those rows. It is what
+``price_store.open_store`` imports into the store on first use.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+CACHE_SUFFIX = ".colcache"
+UPDATES_SUFFIX = ".updates.csv"
+DATASET_COLUMNS = ["Date", "Crop", "City", "Price"]
+
+
+def sidecar_dir(source) -> Path:
+    source = Path(source)
+    return source.with_name(source.name + CACHE_SUFFIX)
+
+
+def sha256_file(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_meta(cache_dir: Path):
+    try:
+        with open(cache_dir / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format_version") != CACHE_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def _write_atomic(path: Path, write):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _frame_from_sidecar(cache_dir: Path, meta: dict, categorical: bool) -> pd.DataFrame:
+    columns = {name: np.load(cache_dir / f"{name}.npy", mmap_mode="r") for name in ("Date", "Crop", "City", "Price")}
+    if any(len(col) != meta["rows"] for col in columns.values()):
+        raise ValueError("Sidecar columns do not match the recorded row count.")
+
+    crop = pd.Categorical.from_codes(columns["Crop"], categories=meta["crop_categories"])
+    city = pd.Categorical.from_codes(columns["City"], categories=meta["city_categories"])
+    df = pd.DataFrame(
+        {
+            "Date": columns["Date"],
+            "Crop": crop if categorical else np.asarray(crop, dtype=object),
+            "City": city if categorical else np.asarray(city, dtype=object),
+            "Price": columns["Price"],
+        },
+        copy=False,
+    )
+    return df
+
+
+def write_sidecar(df: pd.DataFrame, source, fingerprint: dict) -> Path:
+    cache_dir = sidecar_dir(source)
+    cache_dir.mkdir(exist_ok=True)
+
+    crop = df["Crop"].astype("category")
+    city = df["City"].astype("category")
+    arrays = {
+        "Date": pd.to_datetime(df["Date"]).to_numpy(dtype="datetime64[ns]"),
+        "Crop": crop.cat.codes.to_numpy(),
+        "City": city.cat.codes.to_numpy(),
+        "Price": df["Price"].to_numpy(dtype=np.float64),
+    }
+    for name, values in arrays.items():
+        _write_atomic(cache_dir / f"{name}.npy", lambda f, v=values: np.save(f, np.ascontiguousarray(v)))
+
+    meta = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "source": fingerprint,
+        "rows": int(len(df)),
+        "crop_categories": [str(c) for c in crop.cat.categories],
+        "city_categories": [str(c) for c in city.cat.categories],
+    }
+    # meta.json goes last so readers never see it ahead of the columns it describes
+    _write_atomic(cache_dir / "meta.json", lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    return cache_dir
+
+
+def load_combined_dataset(source, categorical: bool = True) -> pd.DataFrame:
+    """Load the combined dataset, using (and maintaining) the columnar sidecar."""
+    source = Path(source)
+    stat = source.stat()
+    cache_dir = sidecar_dir(source)
+    meta = _read_meta(cache_dir)
+
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if meta is not None:
+        recorded = meta["source"]
+        valid = recorded["mtime_ns"] == stat.st_mtime_ns and recorded["size"] == stat.st_size
+        if not valid and recorded["size"] == stat.st_size:
+            # Touched but possibly unchanged (e.g. a fresh checkout): let the content decide
+            fingerprint["sha256"] = sha256_file(source)
+            valid = recorded["sha256"] == fingerprint["sha256"]
+            if valid:
+                meta["source"] = fingerprint
+                _write_atomic(cache_dir / "meta.json", lambda f: f.write(json.dumps(meta, indent=2).encode()))
+        if valid:
+            try:
+                df = _frame_from_sidecar(cache_dir, meta, categorical)
+                logger.info(f"Loaded {len(df)} rows from columnar cache {cache_dir}.")
+                return df
+            except Exception as e:
+                logger.warning(f"Columnar cache {cache_dir} unreadable ({e}); rebuilding.")
+
+    logger.info(f"Parsing {source} (no valid columnar cache).")
+    df = pd.read_excel(str(source))
+    df["Date"] = pd.to_datetime(df["Date"])
+    fingerprint.setdefault("sha256", sha256_file(source))
+    try:
+        write_sidecar(df, source, fingerprint)
+    except OSError as e:
+        logger.warning(f"Could not write columnar cache {cache_dir}: {e}")
+    if categorical:
+        df["Crop"] = df["Crop"].astype("category")
+        df["City"] = df["City"].astype("category")
+    return df
+
+
+def updates_path(source) -> Path:
+    source = Path(source)
+    return source.with_name(source.stem + UPDATES_SUFFIX)
+
+
+def load_dataset(source, categorical: bool = True) -> pd.DataFrame:
+    """The combined dataset plus any rows appended to its updates log."""
+    path = updates_path(source)
+    if not path.exists():
+        return load_combined_dataset(source, categorical)
+    df = load_combined_dataset(source, categorical=False)
+    updates = pd.read_csv(path, parse_dates=["Date"])
+    logger.info(f"Appending {len(updates)} rows from {path}.")
+    df = pd.concat([df[DATASET_COLUMNS], updates[DATASET_COLUMNS]], ignore_index=True)
+    # Rows already folded into the workbook win over their copy in the log
+    df = df.drop_duplicates(["Date", "Crop", "City"], keep="first", ignore_index=True)
+    if categorical:
+        df["Crop"] = df["Crop"].astype("category")
+        df["City"] = df["City"].astype("category")
+    return df
@@ -0,0 +1,99 @@
+"""Vectorized multi-step (autoregressive) price forecasting.
+
+The model predicts one day ahead from ``Prev_Price``. To forecast further
+out, ``rollout`` rolls it forward day by day from each series' last
+observation and feeds each day's prediction back in as the next day's
+``Prev_Price``. All series advance together, so an N-day rollout for every
+(crop, city) costs N ``predict`` calls of one row per series, rather than
+N x series single-row calls. Date features for the whole rollout are
+computed up front, and each step only refreshes the ``Prev_Price`` column
+of a preallocated feature matrix.
+
+``verify_rollout`` checks the batched rollout against ``rollout_reference``,
+one row per ``predict`` call, for a few series; ``inference.py --verify``
+runs it.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from batch_predict import FEATURE_COLUMNS, SEASON_BY_MONTH, date_parts
+from metrics import MODEL_CALLS, MODEL_ROWS
+
+
+def rollout(model, crop_codes, city_codes, start_dates, first_prev_prices, steps: int) -> np.ndarray:
+    """Forecast ``steps`` days for each series, starting at its ``start_dates`` entry.
+
+    Returns a (n_series, steps) float64 array; column k is the prediction
+    for ``start_dates + k`` days.
+    """
+    start_dates = np.asarray(start_dates, dtype="datetime64[D]")
+    n = len(start_dates)
+    out = np.empty((n, steps), dtype=np.float64)
+    if n == 0 or steps <= 0:
+        return out
+
+    # Date features for every (series, step) in one go
+    days = start_dates[:, None] + np.arange(steps)
+    years, months, day_of_month, day_of_week = (part.reshape(n, steps) for part in date_parts(days.ravel()))
+    seasons = SEASON_BY_MONTH[months]
+
+    # Same column layout as build_feature_matrix
+    X = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+    X[:, 4] = crop_codes
+    X[:, 5] = city_codes
+    X[:, 7] = first_prev_prices
+    for k in range(steps):
+        X[:, 0] = years[:, k]
+        X[:, 1] = months[:, k]
+        X[:, 2] = day_of_month[:, k]
+        X[:, 3] = day_of_week[:, k]
+        X[:, 6] = seasons[:, k]
+        out[:, k] = model.predict(X)
+        X[:, 7] = out[:, k]
+
+    MODEL_CALLS.inc(steps)
+    MODEL_ROWS.inc(n * steps)
+    return out
+
+
+def rollout_reference(model, crop_code, city_code, start_date, first_prev_price, steps: int) -> np.ndarray:
+    """One series, one row per ``predict`` call; the slow path ``rollout`` must match."""
+    from batch_predict import build_feature_matrix
+
+    prev = float(first_prev_price)
+    out = np.empty(steps)
+    start = np.datetime64(start_date, "D")
+    for k in range(steps):
+        X = build_feature_matrix(np.array([start + k]), [crop_code], [city_code], [prev])
+        prev = float(model.predict(X)[0])
+        out[k] = prev
+    return out
+
+
+# Function to compare the batched rollout with the one-row reference for a few series
+def verify_rollout(model, series_index, crop_name_to_code, city_name_to_code, n_series: int = 5, steps: int = 60) -> bool:
+    keys = [
+        key for key in series_index.keys()
+        if key[0] in crop_name_to_code and key[1] in city_name_to_code
+    ][:n_series]
+    if not keys:
+        print("rollout: no series to check")
+        return False
+    series = [series_index.get(*key) for key in keys]
+    crop_codes = [crop_name_to_code[crop] for crop, _ in keys]
+    city_codes = [city_name_to_code[city] for _, city in keys]
+    starts = np.array([np.datetime64(s.latest_date, "D") + 1 for s in series])
+    latest = [s.latest_price for s in series]
+
+    batched = rollout(model, crop_codes, city_codes, starts, latest, steps)
+    reference = np.array([
+        rollout_reference(model, crop, city, start, prev, steps)
+        for crop, city, start, prev in zip(crop_codes, city_codes, starts, latest)
+    ])
+    mismatches = int(np.count_nonzero(batched != reference))
+    print(
+        f"rollout ({len(keys)} series x {steps} days): {mismatches} mismatches, "
+        f"max abs diff {float(np.max(np.abs(batched - reference))):.6g}"
+    )
+    return mismatches == 0
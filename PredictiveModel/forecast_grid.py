@@ -0,0 +1,204 @@
+"""Materialized forecast grid for every (crop, city, day) in a horizon.
+
+The model's inputs are date parts, crop, city, season and ``Prev_Price``,
+so every answer for the next N days is enumerable. ``ForecastGrid`` stores
+the full (series x day) grid as a dense float32 array, and the request path
+becomes an array lookup. The grid is built in one of two modes
+(``FORECAST_MODE``):
+
+* ``autoregressive`` (default): ``forecast_engine.rollout`` rolls each series
+  forward from the day after its last observation, feeding each prediction
+  back as the next ``Prev_Price``.
+* ``last_price``: ``Prev_Price`` stays fixed at the latest observation, and
+  the grid is a single ``model.predict`` over every (series, day) from today.
+
+``ForecastGridBuilder`` keeps the grid current in a background thread and
+rebuilds it when the model, the data or the calendar day changes.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import PredictionQuery, check_query, predict_batch
+from forecast_engine import rollout
+from shared_arrays import share, version_tag
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = int(os.getenv("FORECAST_GRID_DAYS", 365))
+FORECAST_MODES = ("autoregressive", "last_price")
+DEFAULT_FORECAST_MODE = os.getenv("FORECAST_MODE", "autoregressive")
+
+
+class ForecastGrid:
+    """Row i holds the forecast for ``keys[i]`` from ``starts[i]`` onwards, one column per day."""
+
+    def __init__(self, keys, starts, prices: np.ndarray, latest_prices: np.ndarray, version: str, mode: str):
+        self._positions = {key: i for i, key in enumerate(keys)}
+        self.starts = np.asarray(starts, dtype="datetime64[D]")
+        self.prices = prices
+        self.latest_prices = latest_prices
+        self.version = version
+        self.mode = mode
+
+    @property
+    def horizon_days(self) -> int:
+        return self.prices.shape[1]
+
+    @classmethod
+    def build(cls, model, series_index, crop_name_to_code, city_name_to_code, start, horizon_days, version, mode=DEFAULT_FORECAST_MODE):
+        """Cover every servable series from ``start`` for ``horizon_days`` days."""
+        if mode not in FORECAST_MODES:
+            raise ValueError(f"Unknown forecast mode {mode!r}; expected one of {FORECAST_MODES}.")
+        start = np.datetime64(start, "D")
+
+        # Only series the model can answer for; the rest keep their per-row errors
+        keys = [
+            key for key in series_index.keys()
+            if check_query(PredictionQuery(key[0], key[1], start), crop_name_to_code, city_name_to_code, series_index)[1] is None
+        ]
+        latest = np.array([series_index.get(*key).latest_price for key in keys], dtype=np.float64)
+
+        if mode == "autoregressive":
+            # Roll forward from the day after each series' last observation to the end of the horizon
+            starts = np.array(
+                [np.datetime64(series_index.get(*key).latest_date, "D") + 1 for key in keys], dtype="datetime64[D]"
+            )
+            end = start + horizon_days
+            steps = max(int((end - starts.min()).astype(np.int64)), 1) if keys else 0
+            prices = rollout(
+                model,
+                [crop_name_to_code[crop] for crop, _ in keys],
+                [city_name_to_code[city] for _, city in keys],
+                starts, latest, steps,
+            ).astype(np.float32)
+        else:
+            starts = np.full(len(keys), start, dtype="datetime64[D]")
+            days = start + np.arange(horizon_days)
+            queries = [PredictionQuery(crop, city, d) for crop, city in keys for d in days]
+            results = predict_batch(model, queries, crop_name_to_code, city_name_to_code, series_index, mode=mode)
+            if any(err for _, _, err in results):
+                raise RuntimeError(next(err for _, _, err in results if err))
+            prices = np.array([price for price, _, _ in results], dtype=np.float32).reshape(len(keys), horizon_days)
+
+        prices.setflags(write=False)
+        return cls(keys, starts, share("forecast-grid", prices, version_tag(version)), latest, version, mode)
+
+    def lookup(self, crop: str, city: str, when):
+        """Return (predicted_price, most_recent_price), or None if not in the grid."""
+        pos = self._positions.get((crop, city))
+        if pos is None:
+            return None
+        offset = int((np.datetime64(pd.Timestamp(when), "D") - self.starts[pos]).astype(np.int64))
+        if not 0 <= offset < self.prices.shape[1]:
+            return None
+        price = float(self.prices[pos, offset])
+        # Rows a degraded predictor could not answer go back through predict_batch's score_misses
+        if not np.isfinite(price):
+            return None
+        return price, float(self.latest_prices[pos])
+
+    def values(self, crop: str, city: str, start, days: int):
+        """Prices for ``days`` consecutive days from ``start``, NaN where the grid has none.
+
+        Returns None if the series is not in the grid.
+        """
+        pos = self._positions.get((crop, city))
+        if pos is None:
+            return None
+        out = np.full(days, np.nan)
+        offset = int((np.datetime64(pd.Timestamp(start), "D") - self.starts[pos]).astype(np.int64))
+        lo, hi = max(0, -offset), min(days, self.prices.shape[1] - offset)
+        if hi > lo:
+            out[lo:hi] = self.prices[pos, offset + lo:offset + hi]
+        return out
+
+    def end(self, crop: str, city: str):
+        """(first day past the grid, last forecast) of a rolled-forward series, for continuing its rollout.
+
+        Returns None in ``last_price`` mode, for series not in the grid, and
+        when the last forecast is missing.
+        """
+        pos = self._positions.get((crop, city))
+        if self.mode != "autoregressive" or pos is None or not np.isfinite(self.prices[pos, -1]):
+            return None
+        return self.starts[pos] + self.horizon_days, float(self.prices[pos, -1])
+
+    def covered_days(self, crop: str, city: str, start, days: int) -> int:
+        """How many of the ``days`` days from ``start`` fall on or before the grid's last day for the series."""
+        pos = self._positions.get((crop, city))
+        if pos is None:
+            return 0
+        end = self.starts[pos] + self.horizon_days
+        return int(np.clip((end - np.datetime64(pd.Timestamp(start), "D")).astype(np.int64), 0, days))
+
+    def path(self, crop: str, city: str, start, days: int):
+        """Return (dates, prices) for up to ``days`` days from ``start``, or None if not in the grid."""
+        pos = self._positions.get((crop, city))
+        if pos is None:
+            return None
+        offset = max(int((np.datetime64(pd.Timestamp(start), "D") - self.starts[pos]).astype(np.int64)), 0)
+        prices = self.prices[pos, offset:offset + days]
+        return self.starts[pos] + offset + np.arange(len(prices)), prices
+
+
+class ForecastGridBuilder:
+    """Holds the current grid and rebuilds it off the request path."""
+
+    def __init__(self, horizon_days: int = DEFAULT_HORIZON_DAYS, mode: str = DEFAULT_FORECAST_MODE):
+        self.horizon_days = horizon_days
+        self.mode = mode
+        self._grid = None
+        self._building = None
+        self._failed = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._grid
+
+    def refresh(self, model, series_index, crop_name_to_code, city_name_to_code, model_version, start=None, wait=False):
+        """Start a rebuild if the model, data or start day changed since the last build."""
+        start = np.datetime64(start or date.today(), "D")
+        version = f"{model_version}:{series_index.version}:{start}:{self.horizon_days}:{self.mode}"
+        with self._lock:
+            if (self._grid is not None and self._grid.version == version) or version in (self._building, self._failed):
+                thread = None
+            else:
+                self._building = version
+                thread = threading.Thread(
+                    target=self._build,
+                    args=(model, series_index, crop_name_to_code, city_name_to_code, start, version),
+                    name="forecast-grid",
+                    daemon=True,
+                )
+                thread.start()
+        if wait and thread is not None:
+            thread.join()
+
+    def _build(self, model, series_index, crop_name_to_code, city_name_to_code, start, version):
+        t0 = time.perf_counter()
+        try:
+            grid = ForecastGrid.build(
+                model, series_index, crop_name_to_code, city_name_to_code, start, self.horizon_days, version, self.mode
+            )
+        except Exception:
+            logger.exception("Forecast grid build failed; predictions fall back to the model.")
+            with self._lock:
+                if self._building == version:
+                    self._building = None
+                self._failed = version
+            return
+        with self._lock:
+            # A newer build may have been requested meanwhile; keep only the latest
+            if self._building == version:
+                self._grid = grid
+                self._building = None
+        logger.info(f"Forecast grid {version} built: {grid.prices.shape} in {time.perf_counter() - t0:.2f}s.")
@@ -0,0 +1,44 @@
+# Gunicorn settings for the price prediction web app; see "Production Deployment" in the README
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# Load the model and data once in the master, then fork: workers share those pages
+preload_app = True
+
+# One worker per core; a few threads each cover I/O waits such as chart file sends
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+timeout = 60
+graceful_timeout = 30
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Immutable arrays (series index, forecast grid) are mmap'd from here so workers
+# share one copy even after a hot reload
+os.environ.setdefault("MYCROP_SHARED_DIR", "/dev/shm/mycrop" if os.path.isdir("/dev/shm") else "")
+
+# Workers write metric snapshots here so /metrics on any worker reports all of them
+os.environ.setdefault("MYCROP_METRICS_DIR", os.path.join(os.environ["MYCROP_SHARED_DIR"] or "/tmp", f"metrics-{bind.replace(':', '_')}"))
+os.environ.setdefault("GUNICORN_THREADS", str(threads))
+
+
+def on_starting(server):
+    # Drop snapshots left behind by a previous run
+    import glob
+
+    for path in glob.glob(os.path.join(os.environ["MYCROP_METRICS_DIR"], "worker-*.json")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, so each worker runs its own artifact watcher
+    import app_with_webpage_fixed
+    import metrics
+
+    app_with_webpage_fixed.registry.start_watcher()
+    # Work done while preloading in the master is not this worker's to report
+    metrics.REGISTRY.reset()
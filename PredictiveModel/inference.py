@@ -0,0 +1,184 @@
+"""Low-overhead inference on the city-wise XGBoost model.
+
+``XGBRegressor.predict`` validates its input, wraps it in a ``DMatrix`` and
+goes through the scikit-learn layer on every call. On the request path that
+costs far more than walking 100 depth-4 trees. ``BoosterPredictor`` pulls
+the booster out once and scores with ``Booster.inplace_predict``. Features
+are written into a preallocated, per-thread float32 buffer in the fixed
+``FEATURE_COLUMNS`` order. XGBoost evaluates trees in float32 anyway, so the
+results are bit-for-bit those of ``model.predict``.
+
+Verify against the scikit-learn path over the whole dataset (and the
+batched forecast rollout against its one-row reference) with:
+
+    python inference.py --verify [--base-dir DIR]
+
+It prints OK or MISMATCH and exits with status 1 on any mismatch, so it can
+gate a model release (see Contributing in the README). ``tests/test_inference.py``
+runs the same comparison on a small model trained on synthetic prices.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+
+from batch_predict import FEATURE_COLUMNS, SEASON_BY_MONTH
+
+logger = logging.getLogger(__name__)
+
+# Rows per thread-local buffer; larger batches grow it
+DEFAULT_BUFFER_ROWS = 1024
+
+
+class BoosterPredictor:
+    """``predict(X)`` straight on the booster of a fitted ``XGBRegressor``."""
+
+    def __init__(self, model, buffer_rows: int = DEFAULT_BUFFER_ROWS):
+        self.model = model
+        self.booster = model.get_booster()
+        names = self.booster.feature_names
+        if names is not None and list(names) != FEATURE_COLUMNS:
+            raise ValueError(f"Model features {names} do not match {FEATURE_COLUMNS}.")
+        self.missing = getattr(model, "missing", np.nan)
+        # Same trees the scikit-learn wrapper would use after early stopping
+        try:
+            self.iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range = (0, 0)
+        self.buffer_rows = buffer_rows
+        self._local = threading.local()
+
+    def _buffer(self, n: int) -> np.ndarray:
+        buf = getattr(self._local, "buf", None)
+        if buf is None or len(buf) < n:
+            buf = np.empty((max(n, self.buffer_rows), len(FEATURE_COLUMNS)), dtype=np.float32)
+            self._local.buf = buf
+        return buf[:n]
+
+    def _score(self, buf: np.ndarray) -> np.ndarray:
+        return self.booster.inplace_predict(
+            buf, iteration_range=self.iteration_range, missing=self.missing, validate_features=False
+        )
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X)
+        if len(X) == 0:
+            return np.empty(0, dtype=np.float32)
+        buf = self._buffer(len(X))
+        buf[...] = X
+        return self._score(buf)
+
+    def predict_one(self, year, month, day, day_of_week, crop_code, city_code, prev_price) -> float:
+        """Score a single row without building any intermediate arrays."""
+        buf = self._buffer(1)
+        row = buf[0]
+        row[0] = year
+        row[1] = month
+        row[2] = day
+        row[3] = day_of_week
+        row[4] = crop_code
+        row[5] = city_code
+        row[6] = SEASON_BY_MONTH[int(month)]
+        row[7] = prev_price
+        return float(self._score(buf)[0])
+
+
+def as_predictor(model):
+    """Wrap XGBoost models in a ``BoosterPredictor``; anything else is used as is."""
+    if model is None or not hasattr(model, "get_booster"):
+        return model
+    try:
+        return BoosterPredictor(model)
+    except Exception as e:
+        logger.warning(f"Falling back to model.predict: {e}")
+        return model
+
+
+# Function to compare the booster path with the scikit-learn path over every row of the dataset
+def verify(base_dir) -> bool:
+    from artifacts import load_artifacts
+
+    artifacts = load_artifacts(base_dir)
+    return verify_model(artifacts.model, artifacts.series_index, artifacts.crop_name_to_code, artifacts.city_name_to_code)
+
+
+# Function to compare the booster path with the scikit-learn path over every observation in a series index
+def verify_model(model, series_index, crop_name_to_code, city_name_to_code) -> bool:
+    import pandas as pd
+
+    from batch_predict import build_feature_matrix
+
+    # Every observation with its previous price, as in training
+    parts = []
+    for series in series_index:
+        crop_code = crop_name_to_code.get(series.crop)
+        city_code = city_name_to_code.get(series.city)
+        if crop_code is None or city_code is None or len(series) < 2:
+            continue
+        n = len(series) - 1
+        parts.append(build_feature_matrix(series.dates[1:], np.full(n, crop_code), np.full(n, city_code), series.prices[:-1]))
+    if not parts:
+        print("No series to score; nothing verified")
+        return False
+    X = np.concatenate(parts)
+    print(f"Scoring {len(X)} rows from {len(parts)} series")
+
+    # The scikit-learn path the apps used to take: a float DataFrame through XGBRegressor.predict
+    t0 = time.perf_counter()
+    expected = model.predict(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+    sklearn_seconds = time.perf_counter() - t0
+
+    predictor = BoosterPredictor(model)
+    t0 = time.perf_counter()
+    batch = predictor.predict(X)
+    batch_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    single = np.array([predictor.predict_one(*row[:6], row[7]) for row in X], dtype=np.float32)
+    single_seconds = time.perf_counter() - t0
+
+    # Single-row timing of the old path on a sample
+    sample = X[:: max(len(X) // 200, 1)]
+    frames = [pd.DataFrame([dict(zip(FEATURE_COLUMNS, row))]) for row in sample]
+    t0 = time.perf_counter()
+    old_single = np.array([model.predict(frame)[0] for frame in frames], dtype=np.float32)
+    old_single_seconds = time.perf_counter() - t0
+
+    ok = True
+    for name, got, want in [
+        ("batch", batch, expected),
+        ("single-row", single, expected),
+        ("single-row (sample, DataFrame path)", single[:: max(len(X) // 200, 1)], old_single),
+    ]:
+        mismatches = int(np.count_nonzero(got != want))
+        ok &= mismatches == 0
+        print(f"{name}: {mismatches} mismatches, max abs diff {float(np.max(np.abs(got - want))):.6g}")
+
+    # The multi-day forecasts feed predictions back in; the batched rollout must match one row per call
+    from forecast_engine import verify_rollout
+
+    ok &= verify_rollout(predictor, series_index, crop_name_to_code, city_name_to_code)
+
+    print(f"model.predict over all rows: {sklearn_seconds * 1e3:.1f} ms; inplace_predict: {batch_seconds * 1e3:.1f} ms")
+    print(f"per row: DataFrame path {old_single_seconds / len(sample) * 1e6:.0f} us, predict_one {single_seconds / len(X) * 1e6:.1f} us")
+    print("OK" if ok else "MISMATCH")
+    return ok
+
+
+if __name__ == "__main__":
+    from artifacts import BASE_DIR
+
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Booster inference for the crop price model.")
+    parser.add_argument("--verify", action="store_true", help="check equality with XGBRegressor.predict over the dataset")
+    parser.add_argument("--base-dir", default=BASE_DIR)
+    args = parser.parse_args()
+    if not args.verify:
+        parser.print_help()
+        sys.exit(0)
+    sys.exit(0 if verify(args.base_dir) else 1)
@@ -0,0 +1,299 @@
+"""Parallel, cached ingestion of the per-city price workbooks.
+
+``dataset/<City>/<Crop>_<years>.xlsx`` holds one crop's daily prices in one
+market. Parsing every workbook with openpyxl on every refresh is the slow
+part of rebuilding the combined dataset. Workbooks are streamed in bounded
+chunks by ``workbook_reader.py``. This command parses the workbooks
+in a process pool and keeps each file's parsed columns in a per-file cache
+under ``<dataset>/.ingest-cache``. Each cache entry records the file's
+path, mtime, size and SHA-256. A matching mtime and size reuses the entry
+directly; a file that was touched but has the same size is reused if its
+hash still matches. Only new or changed files are read again.
+
+The parsed files are combined and run through ``validation.validate``:
+rows with a bad date, key or price are quarantined (listed with their
+source file and the text of an unparsable date in
+``<output>/quarantine.csv``, counted in
+``<output>/validation.json``), and prices reported twice for the same
+date, crop and city are averaged, as ``Dataset_API.py`` always did. The
+result is written to the price store (``price_store.py``), which only rewrites
+the crop/city partitions whose data actually changed. The workbooks
+replace the series they cover, but stored rows dated after a series' last
+workbook row, such as ``update_model.py``'s daily prices, are kept. ``--excel`` also
+exports the old combined workbook for anything that still reads it. A
+per-file timing table is printed at the end.
+
+    python ingest.py [--dataset-dir dataset] [--output price_store] [--excel FILE] [--workers 8]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import sha256_file, write_sidecar
+from price_store import STORE_DIRNAME, PriceStore
+from validation import format_report, validate, write_report
+from workbook_reader import read_price_columns
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = ".ingest-cache"
+CACHE_FORMAT_VERSION = 2
+
+# Crop names for files whose name does not reduce to the crop (see crop_name)
+CROP_NAMES = {
+    "Maize_2016-2025.xlsx": "Maize",
+    "Rice_2016-2025.xlsx": "Rice",
+    "Jowar(Sorghum)_2016-2025.xlsx": "Jowar",
+    "Bengal+Gram(Gram)(Whole)_2016-2025.xlsx": "Bengal Gram",
+    "Wheat_2016-2025.xlsx": "Wheat",
+}
+
+FileResult = namedtuple("FileResult", ["path", "crop", "city", "status", "rows", "seconds", "error"])
+
+
+def crop_name(filename: str) -> str:
+    """Crop named by a workbook: ``Bengal+Gram(Gram)(Whole)_2016-2025.xlsx`` -> ``Bengal Gram``."""
+    if filename in CROP_NAMES:
+        return CROP_NAMES[filename]
+    stem = Path(filename).stem.split("_")[0]
+    return re.sub(r"\(.*?\)", "", stem).replace("+", " ").strip()
+
+
+def find_price_files(dataset_dir: Path):
+    """(path, crop, city) for every workbook under ``dataset_dir/<City>/``, in a stable order."""
+    files = []
+    for city_dir in sorted(p for p in dataset_dir.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        for path in sorted(city_dir.glob("*.xlsx")):
+            if not path.name.startswith("~$"):
+                files.append((path, crop_name(path.name), city_dir.name))
+    return files
+
+
+# Function to parse one workbook into dates, prices and its unparsable date cells; runs in the worker processes
+def parse_price_file(path):
+    t0 = time.perf_counter()
+    try:
+        # Streamed in typed chunks, parsing "19 Jan 2019" dates as it goes (workbook_reader)
+        dates, prices, bad_rows, bad_text = read_price_columns(path)
+        result = {
+            "dates": dates,
+            "prices": prices,
+            "bad_rows": bad_rows,
+            "bad_text": bad_text,
+            "sha256": sha256_file(path),
+            "error": None,
+        }
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = time.perf_counter() - t0
+    return result
+
+
+class ParsedFileCache:
+    """Parsed columns of each workbook, keyed by its path and validated by mtime, size and SHA-256."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+
+    def _entry(self, path: Path) -> Path:
+        return self.cache_dir / hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:20]
+
+    def get(self, path: Path):
+        """(dates, prices, bad_rows, bad_text) if the cached entry still describes ``path``; otherwise None."""
+        entry = self._entry(path)
+        try:
+            meta = json.loads(entry.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return None
+        stat = path.stat()
+        if meta.get("format_version") != CACHE_FORMAT_VERSION or meta["size"] != stat.st_size:
+            return None
+        if meta["mtime_ns"] != stat.st_mtime_ns:
+            # Touched but possibly unchanged (a fresh copy or checkout): let the content decide
+            if sha256_file(path) != meta["sha256"]:
+                return None
+            meta["mtime_ns"] = stat.st_mtime_ns
+            self._write(entry.with_suffix(".json"), json.dumps(meta).encode())
+        try:
+            with np.load(entry.with_suffix(".npz")) as data:
+                return data["dates"], data["prices"], data["bad_rows"], data["bad_text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, path: Path, stat: os.stat_result, parsed: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self._entry(path)
+        buf = io.BytesIO()
+        np.savez(buf, **{key: parsed[key] for key in ("dates", "prices", "bad_rows", "bad_text")})
+        self._write(entry.with_suffix(".npz"), buf.getvalue())
+        meta = {
+            "format_version": CACHE_FORMAT_VERSION,
+            "path": str(path),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": parsed["sha256"],
+            "rows": int(len(parsed["prices"])),
+        }
+        # Metadata last, so an entry is never valid before its data is complete
+        self._write(entry.with_suffix(".json"), json.dumps(meta).encode())
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+
+def ingest(dataset_dir, workers: int = None, cache_dir=None, force: bool = False):
+    """Parse (or reuse) every workbook; returns (``validation.Validation`` of the combined rows, [FileResult])."""
+    dataset_dir = Path(dataset_dir)
+    cache = ParsedFileCache(Path(cache_dir) if cache_dir else dataset_dir / CACHE_DIRNAME)
+    files = find_price_files(dataset_dir)
+
+    parsed, results, stale = {}, {}, []
+    for path, crop, city in files:
+        t0 = time.perf_counter()
+        hit = None if force else cache.get(path)
+        if hit is not None:
+            parsed[path] = hit
+            results[path] = FileResult(path, crop, city, "cached", len(hit[1]), time.perf_counter() - t0, None)
+        else:
+            stale.append((path, crop, city))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(stale)))
+    if stale:
+        logger.info(f"Parsing {len(stale)} of {len(files)} workbooks with {workers} worker(s).")
+        stats = {path: path.stat() for path, _, _ in stale}
+        if workers == 1:
+            outputs = map(parse_price_file, [path for path, _, _ in stale])
+        else:
+            # spawn: forking a process that has pandas and openpyxl loaded is not safe on every platform
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            outputs = pool.map(parse_price_file, [path for path, _, _ in stale])
+        try:
+            for (path, crop, city), out in zip(stale, outputs):
+                if out["error"]:
+                    logger.error(f"Error loading {path}: {out['error']}")
+                    results[path] = FileResult(path, crop, city, "error", 0, out["seconds"], out["error"])
+                    continue
+                cache.put(path, stats[path], out)
+                parsed[path] = (out["dates"], out["prices"], out["bad_rows"], out["bad_text"])
+                results[path] = FileResult(path, crop, city, "parsed", len(out["prices"]), out["seconds"], None)
+        finally:
+            if workers > 1:
+                pool.shutdown()
+
+    kept = [(path, crop, city) for path, crop, city in files if path in parsed]
+    file_codes = np.repeat(np.arange(len(kept)), [len(parsed[path][1]) for path, _, _ in kept])
+
+    def per_file(labels):
+        labels = pd.Categorical(labels)
+        return pd.Categorical.from_codes(labels.codes[file_codes], labels.categories)
+
+    # Text of the date cells that did not parse, so quarantine.csv shows what to fix
+    raw_dates = np.full(len(file_codes), None, dtype=object)
+    offset = 0
+    for path, _, _ in kept:
+        _, prices, bad_rows, bad_text = parsed[path]
+        raw_dates[offset + bad_rows] = bad_text
+        offset += len(prices)
+
+    combined = pd.DataFrame({
+        "Date": np.concatenate([parsed[path][0] for path, _, _ in kept]) if kept else np.empty(0, "datetime64[ns]"),
+        "Crop": per_file([crop for _, crop, _ in kept]),
+        "City": per_file([city for _, _, city in kept]),
+        "Price": np.concatenate([parsed[path][1] for path, _, _ in kept]) if kept else np.empty(0),
+        "Source": per_file([f"{city}/{path.name}" for path, _, city in kept]),
+        "RawDate": raw_dates,
+    })
+    return validate(combined), [results[path] for path, _, _ in files]
+
+
+def later_updates(store: PriceStore, validation) -> pd.DataFrame:
+    """Stored rows dated after the last workbook row of their series, such as ``update_model.py``'s daily prices."""
+    keys = ["Date", "Crop", "City"]
+    covered = pd.concat([validation.frame[keys], validation.quarantine[keys]]).astype({"Crop": str, "City": str})
+    last = covered.dropna().groupby(["Crop", "City"])["Date"].max().rename("Last").reset_index()
+    stored = store.read().astype({"Crop": str, "City": str})
+    stored = stored.merge(last, on=["Crop", "City"], how="left")
+    return stored.loc[stored["Last"].isna() | (stored["Date"] > stored["Last"]), ["Date", "Crop", "City", "Price"]]
+
+
+# Function to export the combined data as the legacy workbook, with its columnar sidecar
+def write_excel(df: pd.DataFrame, output):
+    output = Path(output)
+    tmp = output.with_name(f"{output.stem}.{os.getpid()}.tmp{output.suffix}")
+    df.to_excel(tmp, index=False)
+    os.replace(tmp, output)
+    stat = output.stat()
+    write_sidecar(df, output, {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256_file(output)})
+
+
+def format_results(results) -> str:
+    lines = [f"{'file':<50}{'status':>8}{'rows':>8}{'ms':>10}"]
+    for r in results:
+        name = f"{r.city}/{r.path.name}"
+        lines.append(f"{name:<50}{r.status:>8}{r.rows:>8}{r.seconds * 1e3:>10.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Combine the per-city price workbooks into the combined dataset.")
+    parser.add_argument("--dataset-dir", type=Path, default=Path("dataset"))
+    parser.add_argument("--output", type=Path, default=Path(STORE_DIRNAME), help="price store directory")
+    parser.add_argument("--excel", type=Path, help="also export the combined data to this workbook")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parser processes")
+    parser.add_argument("--cache-dir", type=Path, help=f"parsed-file cache (default: <dataset-dir>/{CACHE_DIRNAME})")
+    parser.add_argument("--force", action="store_true", help="ignore the cache and parse every file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    t0 = time.perf_counter()
+    validation, results = ingest(args.dataset_dir, args.workers, args.cache_dir, args.force)
+    df = validation.frame
+    if df.empty:
+        raise SystemExit("Error: No dataframes were loaded. Check your files and paths.")
+    ingest_seconds = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    if PriceStore.exists(args.output):
+        store = PriceStore(args.output)
+        previous = store.version
+        store.write(pd.concat([df, later_updates(store, validation)], ignore_index=True))
+        changed = store.version != previous
+    else:
+        store, changed = PriceStore.create(args.output, df), True
+    write_report(args.output, validation.report, validation.quarantine, source=args.dataset_dir)
+    if args.excel:
+        write_excel(df, args.excel)
+    write_seconds = time.perf_counter() - t1
+
+    print(format_results(results))
+    print(format_report(validation.report))
+    counts = {status: sum(r.status == status for r in results) for status in ("parsed", "cached", "error")}
+    print(
+        f"{len(results)} files ({counts['parsed']} parsed, {counts['cached']} cached, {counts['error']} failed), "
+        f"{len(df)} rows in {ingest_seconds:.2f}s; "
+        + (f"'{args.output}' updated to version {store.version}" if changed else f"'{args.output}' unchanged")
+        + (f", '{args.excel}' exported" if args.excel else "")
+        + f" in {write_seconds:.2f}s"
+    )
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+"""Best market for a crop across every city, net of transport.
+
+``rank_markets`` takes the (city x day) price block produced by
+``batch_predict.predict_block`` for one crop and a window of dates. It
+subtracts the cost of moving a quintal from the farmer's city to each
+market and ranks the markets by their best net price in the window.
+
+Transport costs come from a ``TransportCosts`` matrix in INR per quintal.
+The default is built from approximate road distances between the bundled
+mandis, with a fixed handling charge plus a per-km freight rate. A JSON file
+named by ``TRANSPORT_COSTS_FILE`` can replace or extend it:
+
+    {"fixed": 20, "per_km": 0.35,
+     "distances_km": {"Pune": {"Mumbai": 150}},
+     "costs": {"Pune": {"Raigad": 60}}}
+
+``distances_km`` and ``costs`` are symmetric, and explicit ``costs`` win
+over distances. Pairs with no entry have no known cost, and those markets
+are left out of the ranking rather than guessed.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_COSTS_FILE = os.getenv("TRANSPORT_COSTS_FILE")
+# Days from the prediction date scanned for each market's best price
+MARKET_WINDOW_DAYS = int(os.getenv("MARKET_WINDOW_DAYS", 7))
+
+# Handling charge and truck freight, in INR per quintal
+DEFAULT_FIXED_COST = 20.0
+DEFAULT_COST_PER_KM = 0.35
+
+# Approximate road distances between the bundled mandis
+DEFAULT_DISTANCES_KM = {
+    "Mumbai": {"Nagpur": 830, "Nashik": 170, "Pune": 150, "Raigad": 100, "Thane": 25},
+    "Nagpur": {"Nashik": 690, "Pune": 715, "Raigad": 880, "Thane": 810},
+    "Nashik": {"Pune": 210, "Raigad": 250, "Thane": 150},
+    "Pune": {"Raigad": 140, "Thane": 150},
+    "Raigad": {"Thane": 110},
+}
+
+
+class TransportCosts:
+    """Symmetric INR-per-quintal cost matrix between named markets; NaN where unknown."""
+
+    def __init__(self, names, matrix: np.ndarray):
+        self.names = list(names)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, distances_km=None, costs=None, fixed=DEFAULT_FIXED_COST, per_km=DEFAULT_COST_PER_KM):
+        distances_km = distances_km or {}
+        costs = costs or {}
+        names = sorted({a for table in (distances_km, costs) for a, row in table.items() for a in (a, *row)})
+        positions = {name: i for i, name in enumerate(names)}
+        matrix = np.full((len(names), len(names)), np.nan)
+        np.fill_diagonal(matrix, 0.0)
+        for table, to_cost in ((distances_km, lambda km: fixed + per_km * km), (costs, float)):
+            for a, row in table.items():
+                for b, value in row.items():
+                    matrix[positions[a], positions[b]] = matrix[positions[b], positions[a]] = to_cost(value)
+        return cls(names, matrix)
+
+    @classmethod
+    def default(cls) -> "TransportCosts":
+        return cls.build(DEFAULT_DISTANCES_KM)
+
+    @classmethod
+    def load(cls, path) -> "TransportCosts":
+        """Read a JSON cost file; its distances and costs extend the defaults."""
+        with open(path) as f:
+            config = json.load(f)
+        distances = {a: dict(row) for a, row in DEFAULT_DISTANCES_KM.items()}
+        for a, row in config.get("distances_km", {}).items():
+            distances.setdefault(a, {}).update(row)
+        return cls.build(
+            distances, config.get("costs"),
+            fixed=config.get("fixed", DEFAULT_FIXED_COST), per_km=config.get("per_km", DEFAULT_COST_PER_KM),
+        )
+
+    @classmethod
+    def from_env(cls) -> "TransportCosts":
+        if TRANSPORT_COSTS_FILE and Path(TRANSPORT_COSTS_FILE).exists():
+            return cls.load(TRANSPORT_COSTS_FILE)
+        if TRANSPORT_COSTS_FILE:
+            logger.warning(f"Transport cost file {TRANSPORT_COSTS_FILE} not found; using default distances.")
+        return cls.default()
+
+    def costs_from(self, origin: str, markets) -> np.ndarray:
+        """Cost of moving one quintal from ``origin`` to each market."""
+        i = self._positions.get(origin)
+        if i is None:
+            return np.where([m == origin for m in markets], 0.0, np.nan)
+        cols = np.array([self._positions.get(m, -1) for m in markets], dtype=np.int64)
+        out = self.matrix[i, np.maximum(cols, 0)] if len(cols) else np.empty(0)
+        out = np.where(cols >= 0, out, np.nan)
+        # A market is always free to reach from itself
+        return np.where(np.array([m == origin for m in markets], dtype=bool), 0.0, out)
+
+
+def rank_markets(prices, start, markets, latest_prices, transport_costs):
+    """Rank markets by their best net price within the window, best first.
+
+    ``prices[i, k]`` is the predicted price in ``markets[i]`` ``k`` days
+    after ``start``, and ``transport_costs[i]`` is the cost of getting a
+    quintal there. Markets with no price or no known transport cost are
+    skipped.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if prices.size == 0:
+        return []
+    net = prices - np.asarray(transport_costs, dtype=np.float64)[:, None]
+    # Fill the NaNs so argmax stays vectorized; rows without any value are dropped below
+    best_days = np.argmax(np.where(np.isfinite(net), net, -np.inf), axis=1)
+    rows = np.arange(len(markets))
+    best_net = net[rows, best_days]
+    start = pd.Timestamp(start).normalize()
+
+    ranked = []
+    for i in np.argsort(-np.where(np.isfinite(best_net), best_net, -np.inf), kind="stable"):
+        if not np.isfinite(best_net[i]):
+            break
+        ranked.append({
+            "city": markets[i],
+            "best_date": (start + pd.Timedelta(days=int(best_days[i]))).strftime("%Y-%m-%d"),
+            "predicted_price": round(float(prices[i, best_days[i]]), 2),
+            "transport_cost": round(float(transport_costs[i]), 2),
+            "net_price": round(float(best_net[i]), 2),
+            "most_recent_price": round(float(latest_prices[i]), 2),
+        })
+    return ranked
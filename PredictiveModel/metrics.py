@@ -0,0 +1,355 @@
+"""In-process request, stage and resource metrics in Prometheus text format.
+
+No external service or client library is needed: counters, gauges and
+histograms are kept in a thread-safe registry in this module and rendered
+at ``/metrics`` by ``instrument_app``. Request handlers time their stages
+with ``stage("name")``, which records into a histogram labelled with the
+current route.
+
+Under gunicorn each worker has its own registry. When ``MYCROP_METRICS_DIR``
+is set, every worker periodically writes a snapshot there, and whichever
+worker serves the scrape merges the snapshots of all live workers. Counters
+and histograms are summed, and gauges keep a ``pid`` label.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv("MYCROP_METRICS_DIR")
+SNAPSHOT_INTERVAL = 2.0
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def describe(self):
+        return {"type": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        return {**self.describe(), "values": [[list(k), v] for k, v in self._values.items()]}
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._registry.lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self):
+        return {**self.describe(), "values": [[list(k), v] for k, v in self._values.items()]}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        pos = bisect_left(self.buckets, value)
+        with self._registry.lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][pos] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        return {
+            **self.describe(),
+            "buckets": list(self.buckets),
+            "values": [[list(k), [list(v[0]), v[1], v[2]]] for k, v in self._values.items()],
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._metrics = {}
+        self._last_dump = 0.0
+        self._dumper_pid = None
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def reset(self):
+        """Zero counters and histograms, e.g. in a worker forked from a preloaded master."""
+        with self.lock:
+            for metric in self._metrics.values():
+                if metric.kind != "gauge":
+                    metric._values.clear()
+
+    def snapshot(self) -> dict:
+        _update_process_gauges()
+        with self.lock:
+            return {"pid": os.getpid(), "metrics": {name: m.snapshot() for name, m in self._metrics.items()}}
+
+    def dump(self, directory=None, force: bool = False):
+        """Write this process's snapshot for cross-worker aggregation (rate-limited)."""
+        directory = directory or METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self._last_dump < SNAPSHOT_INTERVAL):
+            return
+        if self._dumper_pid != os.getpid():
+            # Keep the snapshot fresh while this worker is idle; threads do not survive fork
+            self._dumper_pid = os.getpid()
+            threading.Thread(target=self._dump_forever, args=(directory,), name="metrics-dump", daemon=True).start()
+        self._last_dump = now
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"worker-{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+    def _dump_forever(self, directory):
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            try:
+                self.dump(directory)
+            except OSError as e:
+                logger.warning(f"Could not write metrics snapshot to {directory}: {e}")
+
+    def collect(self, directory=None) -> list:
+        """Snapshots of every live process (just this one without a metrics directory)."""
+        directory = directory or METRICS_DIR
+        if not directory:
+            return [self.snapshot()]
+        self.dump(directory, force=True)
+        snapshots = []
+        for path in Path(directory).glob("worker-*.json"):
+            pid = int(path.stem.split("-", 1)[1])
+            if not _pid_alive(pid):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, directory=None) -> str:
+        return render_snapshots(self.collect(directory))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [(n, v) for n, v in zip(names, values)] + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_snapshots(snapshots) -> str:
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap["metrics"].items():
+            entry = merged.setdefault(name, {**metric, "values": {}})
+            for labels, value in metric["values"]:
+                if metric["type"] == "gauge":
+                    # Gauges are per process; keep them apart
+                    entry["values"][tuple(labels) + (str(snap["pid"]),)] = value
+                elif metric["type"] == "counter":
+                    key = tuple(labels)
+                    entry["values"][key] = entry["values"].get(key, 0) + value
+                else:
+                    key = tuple(labels)
+                    counts, total, count = entry["values"].get(key, [[0] * len(value[0]), 0.0, 0])
+                    entry["values"][key] = [[a + b for a, b in zip(counts, value[0])], total + value[1], count + value[2]]
+
+    lines = []
+    for name, metric in sorted(merged.items()):
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["values"].items()):
+            if metric["type"] == "gauge":
+                lines.append(f"{name}{_format_labels(names, labels[:-1], [('pid', labels[-1])])} {_format_value(value)}")
+            elif metric["type"] == "counter":
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+            else:
+                counts, total, count = value
+                cumulative = 0
+                for bound, c in zip(list(metric["buckets"]) + [float("inf")], counts):
+                    cumulative += c
+                    le = _format_value(bound) if bound != float("inf") else "+Inf"
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "mycrop_request_duration_seconds", "Request latency by route.", ["route", "method", "status"]
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "mycrop_stage_duration_seconds", "Time spent in each request stage.", ["route", "stage"]
+)
+MODEL_CALLS = REGISTRY.counter("mycrop_model_predict_calls_total", "Calls to model.predict.")
+MODEL_ROWS = REGISTRY.counter("mycrop_model_predict_rows_total", "Rows scored by model.predict.")
+PREDICTIONS = REGISTRY.counter("mycrop_predictions_total", "Rows answered, by predictor tier.", ["tier"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "mycrop_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"]
+)
+ERRORS = REGISTRY.counter("mycrop_errors_total", "Errors by route and kind.", ["route", "kind"])
+INFLIGHT = REGISTRY.gauge("mycrop_inflight_requests", "Requests currently being handled.")
+WORKER_THREADS = REGISTRY.gauge("mycrop_worker_threads", "Request threads available in this worker.")
+WORKER_SATURATION = REGISTRY.gauge(
+    "mycrop_worker_saturation", "In-flight requests divided by request threads."
+)
+RSS_BYTES = REGISTRY.gauge("process_resident_memory_bytes", "Resident set size of this process.")
+MAX_RSS_BYTES = REGISTRY.gauge("process_max_resident_memory_bytes", "Peak resident set size of this process.")
+CPU_SECONDS = REGISTRY.gauge("process_cpu_seconds_total", "User and system CPU time of this process.")
+
+_local = threading.local()
+
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs (e.g. macOS): fall back to the peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _update_process_gauges():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    RSS_BYTES.set(_current_rss())
+    MAX_RSS_BYTES.set(usage.ru_maxrss * 1024)
+    CPU_SECONDS.set(usage.ru_utime + usage.ru_stime)
+    threads = WORKER_THREADS._values.get((), 0)
+    if threads:
+        WORKER_SATURATION.set(INFLIGHT._values.get((), 0) / threads)
+
+
+def current_route() -> str:
+    # Work outside a request, such as a background grid build
+    return getattr(_local, "route", None) or "background"
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of request work into ``mycrop_stage_duration_seconds``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, route=current_route(), stage=name)
+
+
+def instrument_app(app, threads: int = None):
+    """Record per-route latency, in-flight requests and errors, and serve ``/metrics``."""
+    from flask import Response, request
+
+    WORKER_THREADS.set(threads or int(os.getenv("GUNICORN_THREADS", 1)))
+
+    @app.before_request
+    def _start_timer():
+        if request.endpoint == "metrics":
+            # Keep scrapes out of the latency and saturation figures
+            return
+        _local.route = request.url_rule.rule if request.url_rule else "unmatched"
+        _local.start = time.perf_counter()
+        INFLIGHT.inc()
+
+    @app.after_request
+    def _record_request(response):
+        start = getattr(_local, "start", None)
+        if start is not None:
+            labels = {"route": current_route(), "method": request.method, "status": response.status_code}
+            if response.is_streamed:
+                # A streamed body is rendered while it is sent; time the request when the server closes it
+                response.call_on_close(lambda: REQUEST_SECONDS.observe(time.perf_counter() - start, **labels))
+            else:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+            if response.status_code >= 500:
+                ERRORS.inc(route=current_route(), kind=f"http_{response.status_code}")
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        if exc is not None:
+            ERRORS.inc(route=current_route(), kind=type(exc).__name__)
+        if getattr(_local, "start", None) is not None:
+            _local.start = None
+            INFLIGHT.dec()
+        _local.route = None
+        REGISTRY.dump()
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
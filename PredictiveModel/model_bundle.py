@@ -0,0 +1,249 @@
+"""Single-file, versioned model bundle.
+
+Training used to publish three joblib pickles (model and code maps) plus a
+pickled baseline table. Pickles tie the artifacts to the library versions
+that wrote them, and a mismatch only shows up as an obscure error halfway
+through loading. A bundle is one uncompressed zip file holding:
+
+* ``model.ubj``: the booster in XGBoost's native UBJSON format, which any
+  later XGBoost release can read;
+* ``baseline.npy``: the (crop, city, season) baseline price table;
+* ``manifest.json``: the format version, the feature names and dtypes the
+  booster expects, the crop and city code maps, the model's training
+  parameters, SHA-256 hashes of the data it was trained on and of every
+  other member, and library versions.
+
+``load_bundle`` reads the manifest first and rejects a bundle with an
+unknown format version or a feature schema other than
+``batch_predict.FEATURE_COLUMNS`` before touching the booster. Members are
+checked against their recorded hashes, and the bundle's version is a
+digest of its contents. Bundles are written to a temporary file and renamed into place, so readers
+never see half a bundle.
+
+Build a bundle from existing pickles, or show a bundle's manifest, with:
+
+    python model_bundle.py --convert [--base-dir DIR]
+    python model_bundle.py --inspect crop_price_model.bundle
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import sys
+import zipfile
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import FEATURE_COLUMNS
+from dataset_cache import sha256_file
+from predictors import BaselineTable
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FILENAME = "crop_price_model.bundle"
+BUNDLE_FORMAT = "mycrop-model-bundle"
+BUNDLE_FORMAT_VERSION = 1
+# Dtype the features are scored in (inference.BoosterPredictor)
+FEATURE_DTYPE = "float32"
+
+MANIFEST_MEMBER = "manifest.json"
+MODEL_MEMBER = "model.ubj"
+BASELINE_MEMBER = "baseline.npy"
+
+ModelBundle = namedtuple("ModelBundle", ["model", "crop_name_to_code", "city_name_to_code", "baseline", "manifest", "version"])
+
+
+class BundleError(ValueError):
+    """The bundle is unreadable, corrupt or was built for another feature schema."""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def data_fingerprints(paths) -> list:
+    """(file, size, sha256) of the training data files that exist."""
+    fingerprints = []
+    for path in map(Path, paths):
+        if path.exists():
+            fingerprints.append({"file": path.name, "size": path.stat().st_size, "sha256": sha256_file(path)})
+    return fingerprints
+
+
+def model_params(model) -> dict:
+    """The model's explicitly set, JSON-representable training parameters."""
+    params = {}
+    for name, value in model.get_params().items():
+        if value is None or not isinstance(value, (bool, int, float, str)):
+            continue
+        if isinstance(value, float) and math.isnan(value):
+            continue
+        params[name] = value
+    return params
+
+
+def _model_bytes(model) -> bytes:
+    import tempfile
+
+    # save_model picks the format from the suffix; UBJSON needs a real file
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / MODEL_MEMBER
+        model.save_model(path)
+        return path.read_bytes()
+
+
+def save_bundle(path, model, crop_name_to_code, city_name_to_code, baseline: BaselineTable,
+                data_files=(), training=None) -> dict:
+    """Write a bundle atomically; returns its manifest."""
+    import xgboost
+
+    path = Path(path)
+    booster = model.get_booster()
+    names = booster.feature_names
+    if names is not None and list(names) != FEATURE_COLUMNS:
+        raise BundleError(f"Model features {names} do not match {FEATURE_COLUMNS}.")
+
+    members = {MODEL_MEMBER: _model_bytes(model)}
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(baseline.prices, dtype=np.float64))
+    members[BASELINE_MEMBER] = buf.getvalue()
+    crops = {str(name): int(code) for name, code in crop_name_to_code.items()}
+    cities = {str(name): int(code) for name, code in city_name_to_code.items()}
+
+    files = {name: _sha256(data) for name, data in members.items()}
+    version_source = json.dumps([files, sorted(crops.items()), sorted(cities.items())], sort_keys=True).encode()
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "version": _sha256(version_source)[:12],
+        "created_at": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+        "features": [{"name": name, "dtype": FEATURE_DTYPE} for name in FEATURE_COLUMNS],
+        "target": "Price",
+        "model": {
+            "member": MODEL_MEMBER,
+            "format": "ubjson",
+            "trees": int(booster.num_boosted_rounds()),
+            "params": model_params(model),
+        },
+        "crop_name_to_code": crops,
+        "city_name_to_code": cities,
+        "baseline": {"member": BASELINE_MEMBER, "shape": list(np.shape(baseline.prices))},
+        "training_data": data_fingerprints(data_files),
+        "training": training or {},
+        "libraries": {"xgboost": xgboost.__version__, "numpy": np.__version__, "pandas": pd.__version__},
+        "files": files,
+    }
+
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED) as zf:
+        # Manifest first, so a reader can check the schema before reading anything else
+        zf.writestr(MANIFEST_MEMBER, json.dumps(manifest, indent=2))
+        for name, data in members.items():
+            zf.writestr(name, data)
+    os.replace(tmp, path)
+    logger.info(f"Wrote model bundle {path} (version {manifest['version']}).")
+    return manifest
+
+
+def check_manifest(manifest: dict, feature_columns=FEATURE_COLUMNS):
+    """Raise ``BundleError`` unless the manifest describes a bundle this code can serve."""
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Not a model bundle (format {manifest.get('format')!r}).")
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format version {manifest.get('format_version')}; expected {BUNDLE_FORMAT_VERSION}.")
+    features = [(f.get("name"), f.get("dtype")) for f in manifest.get("features", [])]
+    expected = [(name, FEATURE_DTYPE) for name in feature_columns]
+    if features != expected:
+        raise BundleError(f"Bundle feature schema {features} does not match {expected}.")
+
+
+def load_bundle(path, feature_columns=FEATURE_COLUMNS) -> ModelBundle:
+    """Load and verify a bundle; raises ``BundleError`` on any mismatch."""
+    from xgboost import XGBRegressor
+
+    try:
+        with zipfile.ZipFile(path) as zf:
+            manifest = json.loads(zf.read(MANIFEST_MEMBER))
+            check_manifest(manifest, feature_columns)
+            members = {name: zf.read(name) for name in manifest["files"]}
+    except BundleError:
+        raise
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise BundleError(f"Cannot read model bundle {path}: {e}") from e
+
+    for name, digest in manifest["files"].items():
+        if _sha256(members[name]) != digest:
+            raise BundleError(f"Bundle member {name} does not match its recorded hash.")
+
+    model = XGBRegressor()
+    try:
+        model.load_model(bytearray(members[manifest["model"]["member"]]))
+    except Exception as e:
+        raise BundleError(f"Cannot load booster from {path}: {e}") from e
+    # UBJSON keeps the trees; the scikit-learn parameters come from the manifest
+    model.set_params(**manifest["model"]["params"])
+    names = model.get_booster().feature_names
+    if names is not None and list(names) != list(feature_columns):
+        raise BundleError(f"Booster features {names} do not match the manifest.")
+
+    baseline = BaselineTable(np.load(io.BytesIO(members[manifest["baseline"]["member"]])))
+    return ModelBundle(
+        model, dict(manifest["crop_name_to_code"]), dict(manifest["city_name_to_code"]),
+        baseline, manifest, manifest["version"],
+    )
+
+
+# Function to build a bundle from the legacy pickles in a directory
+def convert(base_dir) -> dict:
+    import joblib
+
+    from artifacts import BASELINE_FILENAME, CITY_MAP_FILENAME, CROP_MAP_FILENAME, MODEL_FILENAME
+    from price_store import MANIFEST_FILENAME, open_prices
+
+    base_dir = Path(base_dir)
+    store = open_prices(base_dir)
+    model = joblib.load(base_dir / MODEL_FILENAME)
+    crop_name_to_code = joblib.load(base_dir / CROP_MAP_FILENAME)
+    city_name_to_code = joblib.load(base_dir / CITY_MAP_FILENAME)
+    if (base_dir / BASELINE_FILENAME).exists():
+        baseline = BaselineTable.load(base_dir / BASELINE_FILENAME)
+    else:
+        # Older directories have no baseline table; build it from the data as the apps do
+        import data_pipeline
+        from series_index import SeriesIndex
+
+        df, _ = data_pipeline.clean(store.read())
+        baseline = BaselineTable.from_series_index(SeriesIndex.from_frame(df), crop_name_to_code, city_name_to_code)
+    return save_bundle(
+        base_dir / BUNDLE_FILENAME, model, crop_name_to_code, city_name_to_code, baseline,
+        data_files=[store.root / MANIFEST_FILENAME],
+        training={"producer": "model_bundle.py --convert"},
+    )
+
+
+if __name__ == "__main__":
+    from artifacts import BASE_DIR
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Build or inspect a model bundle.")
+    parser.add_argument("--convert", action="store_true", help="bundle the legacy pickles in --base-dir")
+    parser.add_argument("--inspect", metavar="BUNDLE", help="print a bundle's manifest after verifying it")
+    parser.add_argument("--base-dir", default=BASE_DIR)
+    args = parser.parse_args()
+    try:
+        if args.convert:
+            print(json.dumps(convert(args.base_dir), indent=2))
+        elif args.inspect:
+            print(json.dumps(load_bundle(args.inspect).manifest, indent=2))
+        else:
+            parser.print_help()
+    except BundleError as e:
+        sys.exit(f"Invalid bundle: {e}")
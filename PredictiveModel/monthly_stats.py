@@ -0,0 +1,84 @@
+"""Precomputed (crop x city x month) historical price statistics.
+
+The prediction page shows the mean, min and max price of the prediction
+month for the selected series. ``MonthlyStatsCube`` computes count, mean,
+min, max and quartiles for every series and calendar month once, so a
+request is a single array lookup. Rebuilding against a new ``SeriesIndex``
+only recomputes the series whose prices actually changed.
+"""
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+
+STAT_NAMES = ("count", "mean", "min", "max", "p25", "p50", "p75")
+MONTH_NAMES = (
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+)
+
+
+def _series_digest(series) -> str:
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(series.dates).view(np.int64).tobytes())
+    h.update(np.ascontiguousarray(series.prices).tobytes())
+    return h.hexdigest()
+
+
+def _series_stats(series) -> np.ndarray:
+    stats = np.full((12, len(STAT_NAMES)), np.nan)
+    stats[:, 0] = 0
+    for month in range(1, 13):
+        prices = series.month_prices(month)
+        if prices.size:
+            p25, p50, p75 = np.percentile(prices, [25, 50, 75])
+            stats[month - 1] = (prices.size, prices.mean(), prices.min(), prices.max(), p25, p50, p75)
+    return stats
+
+
+class MonthlyStatsCube:
+    def __init__(self, keys, stats: np.ndarray, digests: dict):
+        self._positions = {key: i for i, key in enumerate(keys)}
+        self.stats = stats
+        self._digests = digests
+
+    @classmethod
+    def build(cls, series_index, previous=None) -> "MonthlyStatsCube":
+        """Build from ``series_index``, reusing unchanged series from ``previous``."""
+        keys = list(series_index.keys())
+        stats = np.empty((len(keys), 12, len(STAT_NAMES)))
+        digests = {}
+        for i, key in enumerate(keys):
+            series = series_index.get(*key)
+            digest = _series_digest(series)
+            digests[key] = digest
+            if previous is not None and previous._digests.get(key) == digest:
+                stats[i] = previous.stats[previous._positions[key]]
+            else:
+                stats[i] = _series_stats(series)
+        stats.setflags(write=False)
+        return cls(keys, stats, digests)
+
+    def get(self, crop: str, city: str, month: int):
+        """Return a dict of statistics, or None if the month has no observations."""
+        pos = self._positions.get((crop, city))
+        if pos is None:
+            return None
+        row = self.stats[pos, month - 1]
+        if row[0] == 0:
+            return None
+        return {name: (int(value) if name == "count" else float(value)) for name, value in zip(STAT_NAMES, row)}
+
+    def records(self, crop=None, city=None, month=None):
+        """Flatten the cube to JSON-friendly rows, optionally filtered."""
+        rows = []
+        months = range(1, 13) if month is None else [month]
+        for (c, t), pos in self._positions.items():
+            if (crop is not None and c != crop) or (city is not None and t != city):
+                continue
+            for m in months:
+                stats = self.get(c, t, m)
+                if stats is not None:
+                    rows.append({"crop": c, "city": t, "month": m, "month_name": MONTH_NAMES[m - 1], **stats})
+        return rows
@@ -2,39 +2,29 @@ import pandas as pd
 from sklearn.model_selection import train_test_split
 from xgboost import XGBRegressor
 from sklearn.metrics import mean_squared_error, r2_score
-import joblib
 
+import data_pipeline
+from batch_predict import get_season
+from model_bundle import BUNDLE_FILENAME, save_bundle
+from predictors import BaselineTable
+from price_store import MANIFEST_FILENAME, STORE_DIRNAME, open_store
 
-combined_df = pd.read_excel('combined_crop_data_citywise.xlsx')
-combined_df['Date'] = pd.to_datetime(combined_df['Date'])
+
+# The partitioned price store; the first run imports combined_crop_data_citywise.xlsx into it
+price_store = open_store(STORE_DIRNAME, 'combined_crop_data_citywise.xlsx')
+combined_df = price_store.read()
 print("Loaded combined dataset with City column:\n", combined_df.head())
 
 
 print("Missing values before cleaning:\n", combined_df.isnull().sum())
 
-combined_df = combined_df.dropna(subset=['Date', 'Crop', 'City'])
-
-combined_df['Price'] = combined_df.groupby(['Crop', 'City'])['Price'].transform(lambda x: x.fillna(x.mean()))
-
-combined_df = combined_df.dropna(subset=['Price'])
-
-
-combined_df = combined_df[combined_df['Price'] >= 1000]
-
-combined_df = combined_df.reset_index(drop=True)
-
+# Cleaning shared with the web apps (data_pipeline.CLEANING_STAGES): drop rows without keys,
+# fill missing prices with the series mean, drop prices below 1000 and per-crop IQR outliers
+combined_df, cleaning_stats = data_pipeline.clean(combined_df, profile_memory=True)
 
-for crop in combined_df['Crop'].unique():
-    crop_mask = combined_df['Crop'] == crop
-    q1 = combined_df[crop_mask]['Price'].quantile(0.25)
-    q3 = combined_df[crop_mask]['Price'].quantile(0.75)
-    iqr = q3 - q1
-    upper_bound = q3 + 1.5 * iqr
-    lower_bound = q1 - 1.5 * iqr
-    combined_df = combined_df[~((crop_mask) & ((combined_df['Price'] > upper_bound) | (combined_df['Price'] < lower_bound)))]
-
-    crop_mask = combined_df['Crop'] == crop
-    print(f"Removed outliers for {crop}. New price range: {combined_df[crop_mask]['Price'].min()} to {combined_df[crop_mask]['Price'].max()}")
+price_ranges = combined_df.groupby('Crop', observed=True)['Price'].agg(['min', 'max'])
+for crop, row in price_ranges.iterrows():
+    print(f"Removed outliers for {crop}. New price range: {row['min']} to {row['max']}")
 
 print("Missing values after cleaning:\n", combined_df.isnull().sum())
 print("Price statistics (all crops):\n", combined_df['Price'].describe())
@@ -49,52 +39,25 @@ print(combined_df['City'].value_counts())
 
 
 print("\nChecking for data gaps:")
-for city in combined_df['City'].unique():
-    for crop in combined_df['Crop'].unique():
-        subset = combined_df[(combined_df['City'] == city) & (combined_df['Crop'] == crop)].sort_values('Date')
-        date_diffs = subset['Date'].diff().dt.days
-        if date_diffs.max() > 1:
-            print(f"Data gaps for {crop} in {city}: Max gap = {date_diffs.max()} days")
-
-
-combined_df['Year'] = combined_df['Date'].dt.year
-combined_df['Month'] = combined_df['Date'].dt.month
-combined_df['Day'] = combined_df['Date'].dt.day
-combined_df['DayOfWeek'] = combined_df['Date'].dt.dayofweek
-
-def get_season(month):
-    if month in [6, 7, 8, 9]:  # Monsoon in India
-        return 1
-    elif month in [12, 1, 2]:  # Winter
-        return 2
-    else:  # Summer (includes March)
-        return 3
-
-combined_df['Season'] = combined_df['Month'].apply(get_season)
-
-
-combined_df = combined_df.sort_values(['Crop', 'City', 'Date'])
-combined_df['Prev_Price'] = combined_df.groupby(['Crop', 'City'])['Price'].shift(1)
-combined_df['Prev_Price'] = combined_df.groupby(['Crop', 'City'])['Prev_Price'].ffill()
-combined_df = combined_df.dropna()
-
-crop_mapping = combined_df['Crop'].astype('category')
-crop_codes = crop_mapping.cat.codes
-crop_name_to_code = dict(zip(crop_mapping, crop_codes))
-print("Crop name to code mapping:", crop_name_to_code)
+for gap in data_pipeline.find_gaps(combined_df).itertuples(index=False):
+    print(f"Data gaps for {gap.Crop} in {gap.City}: Max gap = {gap.max_gap_days} days")
 
-city_mapping = combined_df['City'].astype('category')
-city_codes = city_mapping.cat.codes
-city_name_to_code = dict(zip(city_mapping, city_codes))
-print("City name to code mapping:", city_name_to_code)
 
-combined_df['Crop'] = crop_codes
-combined_df['City'] = city_codes
+# Date features, season and Prev_Price, computed exactly as on the request path
+combined_df, feature_stats = data_pipeline.run_stages(combined_df, [
+    ("add_date_features", data_pipeline.add_date_features),
+    ("add_prev_price", data_pipeline.add_prev_price),
+], profile_memory=True)
+print("\nPipeline stages:\n" + data_pipeline.format_stats(cleaning_stats + feature_stats))
+
+combined_df, crop_name_to_code, city_name_to_code = data_pipeline.encode_categories(combined_df)
+print("Crop name to code mapping:", crop_name_to_code)
+print("City name to code mapping:", city_name_to_code)
 
 print("Data after feature engineering:\n", combined_df.head())
 
 
-X = combined_df[['Year', 'Month', 'Day', 'DayOfWeek', 'Crop', 'City', 'Season', 'Prev_Price']]
+X = data_pipeline.feature_frame(combined_df)
 y = combined_df['Price']
 print("Features shape:", X.shape)
 print("Target shape:", y.shape)
@@ -158,7 +121,20 @@ predicted_price = model.predict(new_data)
 print("Predicted price for Maize in Pune on 15th March 2024:", predicted_price[0])
 
 
-joblib.dump(model, 'crop_price_model_xgboost_citywise.pkl')
-joblib.dump(crop_name_to_code, 'crop_name_to_code.pkl')
-joblib.dump(city_name_to_code, 'city_name_to_code.pkl')
-print("Model and mappings saved to 'crop_price_model_xgboost_citywise.pkl', 'crop_name_to_code.pkl', and 'city_name_to_code.pkl'")
\ No newline at end of file
+# Degraded-mode fallback: mean price per (crop, city, season) over the cleaned training data
+baseline = BaselineTable.build(combined_df['Crop'], combined_df['City'], combined_df['Season'], combined_df['Price'])
+
+# One versioned bundle: native booster, code maps, feature schema, baseline table and training data hashes
+manifest = save_bundle(
+    BUNDLE_FILENAME, model, crop_name_to_code, city_name_to_code, baseline,
+    data_files=[f"{STORE_DIRNAME}/{MANIFEST_FILENAME}"],
+    training={
+        "producer": "prediction_model.py",
+        "store_version": price_store.version,
+        "rows": int(len(X_train)),
+        "date_range": [str(combined_df['Date'].min().date()), str(combined_df['Date'].max().date())],
+        "test_mse": float(mse),
+        "test_r2": float(r2),
+    },
+)
+print(f"Model bundle version {manifest['version']} saved to '{BUNDLE_FILENAME}'")
@@ -0,0 +1,136 @@
+"""Predictor tiers for crop price prediction.
+
+Every tier answers ``predict(X)`` over the feature matrix built by
+``batch_predict.build_feature_matrix``, just like the XGBoost model.
+``TieredPredictor`` asks each tier in turn: the city-wise model first, then
+a ``BaselineTable`` of mean prices per (crop, city, season). Later tiers
+only fill rows the earlier ones could not answer, either because the tier
+raised or because it returned a non-finite value.
+
+The baseline table is computed once, by ``prediction_model.py`` next to the
+model or at load time from the dataset. Degraded mode is therefore a single
+array lookup per row, and no slower than the model.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+
+import joblib
+import numpy as np
+
+from batch_predict import FEATURE_COLUMNS, SEASON_BY_MONTH
+from metrics import PREDICTIONS
+
+logger = logging.getLogger(__name__)
+
+CROP_COL = FEATURE_COLUMNS.index("Crop")
+CITY_COL = FEATURE_COLUMNS.index("City")
+SEASON_COL = FEATURE_COLUMNS.index("Season")
+# Season codes are 1..3; index 0 holds the all-season mean
+N_SEASONS = 4
+
+
+class BaselineTable:
+    """Mean price per (crop code, city code, season)."""
+
+    def __init__(self, prices: np.ndarray):
+        self.prices = prices
+        self.version = hashlib.sha256(prices.tobytes()).hexdigest()[:12]
+
+    @classmethod
+    def build(cls, crop_codes, city_codes, seasons, prices) -> "BaselineTable":
+        crop_codes = np.asarray(crop_codes, dtype=np.int64)
+        city_codes = np.asarray(city_codes, dtype=np.int64)
+        seasons = np.asarray(seasons, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        shape = (crop_codes.max() + 1, city_codes.max() + 1, N_SEASONS) if len(prices) else (0, 0, N_SEASONS)
+
+        flat = np.ravel_multi_index((crop_codes, city_codes, seasons), shape)
+        sums = np.bincount(flat, weights=prices, minlength=int(np.prod(shape))).reshape(shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+        sums[:, :, 0] = sums[:, :, 1:].sum(axis=2)
+        counts[:, :, 0] = counts[:, :, 1:].sum(axis=2)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            table = sums / counts
+        # A season with no history falls back to the series' all-season mean
+        table[:, :, 1:] = np.where(counts[:, :, 1:] > 0, table[:, :, 1:], table[:, :, :1])
+        return cls(table)
+
+    @classmethod
+    def from_series_index(cls, series_index, crop_name_to_code, city_name_to_code) -> "BaselineTable":
+        crop_codes, city_codes, seasons, prices = [], [], [], []
+        for series in series_index:
+            crop_code = crop_name_to_code.get(series.crop)
+            city_code = city_name_to_code.get(series.city)
+            if crop_code is None or city_code is None:
+                continue
+            months = series.dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+            crop_codes.append(np.full(len(months), crop_code))
+            city_codes.append(np.full(len(months), city_code))
+            seasons.append(SEASON_BY_MONTH[months])
+            prices.append(series.prices)
+        if not prices:
+            return cls(np.full((0, 0, N_SEASONS), np.nan))
+        return cls.build(np.concatenate(crop_codes), np.concatenate(city_codes), np.concatenate(seasons), np.concatenate(prices))
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X)
+        return self.lookup_codes(X[:, CROP_COL], X[:, CITY_COL], X[:, SEASON_COL])
+
+    def lookup_codes(self, crops, cities, seasons) -> np.ndarray:
+        """Baseline prices for code arrays; NaN where the table has no entry."""
+        crops = np.asarray(crops).astype(np.int64)
+        cities = np.asarray(cities).astype(np.int64)
+        seasons = np.asarray(seasons).astype(np.int64)
+        n_crops, n_cities, _ = self.prices.shape
+        known = (crops >= 0) & (crops < n_crops) & (cities >= 0) & (cities < n_cities) & (seasons >= 0) & (seasons < N_SEASONS)
+        out = np.full(len(crops), np.nan)
+        out[known] = self.prices[crops[known], cities[known], seasons[known]]
+        return out
+
+    def save(self, path):
+        joblib.dump({"prices": self.prices}, str(path))
+
+    @classmethod
+    def load(cls, path) -> "BaselineTable":
+        return cls(np.asarray(joblib.load(str(path))["prices"], dtype=np.float64))
+
+
+class TieredPredictor:
+    """Try each ``(name, predictor)`` tier in order, filling the rows the previous tiers missed."""
+
+    def __init__(self, tiers):
+        self.tiers = [(name, predictor) for name, predictor in tiers if predictor is not None]
+        if not self.tiers:
+            raise ValueError("At least one predictor tier is required.")
+
+    @property
+    def names(self):
+        return [name for name, _ in self.tiers]
+
+    def predict(self, X) -> np.ndarray:
+        preds = None
+        missing = None
+        for name, predictor in self.tiers:
+            try:
+                out = np.asarray(predictor.predict(X), dtype=np.float64)
+            except Exception:
+                if len(self.tiers) == 1:
+                    raise
+                logger.exception(f"The {name} predictor failed; trying the next tier.")
+                continue
+            if preds is None:
+                preds = out
+                answered = np.isfinite(out)
+            else:
+                answered = missing & np.isfinite(out)
+                preds[answered] = out[answered]
+            PREDICTIONS.inc(int(answered.sum()), tier=name)
+            missing = ~np.isfinite(preds)
+            if not missing.any():
+                break
+        if preds is None:
+            raise RuntimeError(f"Every predictor tier failed: {', '.join(self.names)}.")
+        return preds
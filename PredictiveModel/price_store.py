@@ -0,0 +1,408 @@
+"""Crop/city-partitioned columnar price store.
+
+The store replaces ``combined_crop_data_citywise.xlsx`` as the hand-off
+format between ingestion, training, the daily updates and the web apps.
+Every (crop, city) series is one partition holding two ``.npy`` columns:
+dates as ``datetime64[ns]`` sorted ascending, and prices as ``float32``.
+``manifest.json`` lists the partitions with their row counts, date ranges
+and content digests:
+
+    price_store/
+        manifest.json
+        Bengal%20Gram/Mumbai/date-<digest>.npy
+        Bengal%20Gram/Mumbai/price-<digest>.npy
+        ...
+
+``read`` memory-maps only the partitions matching the requested crops,
+cities and date range. It returns a frame with categorical Crop and City
+columns, which takes 14 bytes per row against about 140 for the object
+columns read from the workbook. ``append`` and ``write`` rewrite only the
+partitions whose content changed. ``writer`` takes rows chunk by chunk,
+spooling them to disk, so an input larger than memory can be streamed in
+(``workbook_reader.py``).
+
+Column files are named by their content digest and the manifest is
+replaced atomically after them, so a reader always sees a complete
+version. Files the new manifest no longer references are removed
+afterwards. Concurrent writers of the same content (such as several
+workers importing the workbook on first start) produce identical files.
+Different content should come from a single writer (``ingest.py``,
+``update_model.py``).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STORE_DIRNAME = "price_store"
+# Imported into the store the first time a directory without one is opened
+LEGACY_WORKBOOK = "combined_crop_data_citywise.xlsx"
+MANIFEST_FILENAME = "manifest.json"
+STORE_FORMAT_VERSION = 1
+PRICE_DTYPE = np.float32
+
+Partition = namedtuple("Partition", ["crop", "city", "path", "rows", "start", "end", "digest"])
+
+
+def _digest(dates: np.ndarray, prices: np.ndarray) -> str:
+    h = hashlib.sha256()
+    # Byte views rather than tobytes(), so memory-mapped columns are not copied
+    h.update(np.ascontiguousarray(dates).view(np.uint8))
+    h.update(np.ascontiguousarray(prices).view(np.uint8))
+    return h.hexdigest()[:16]
+
+
+def _write_atomic(path: Path, write):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _columns(df: pd.DataFrame):
+    """Group a Date/Crop/City/Price frame into {(crop, city): (sorted dates, prices)}."""
+    df = df.dropna(subset=["Date", "Crop", "City"])
+    if df.empty:
+        return {}
+    crops = df["Crop"].astype(str).to_numpy()
+    cities = df["City"].astype(str).to_numpy()
+    dates = pd.to_datetime(df["Date"]).to_numpy(dtype="datetime64[ns]")
+    prices = df["Price"].to_numpy(dtype=PRICE_DTYPE)
+    keys = pd.MultiIndex.from_arrays([crops, cities])
+    codes, uniques = pd.factorize(keys)
+    order = np.lexsort((dates, codes))
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    groups = {}
+    for idx in np.split(order, bounds):
+        crop, city = uniques[codes[idx[0]]]
+        groups[(crop, city)] = (np.ascontiguousarray(dates[idx]), np.ascontiguousarray(prices[idx]))
+    return groups
+
+
+def _has_repeats(dates: np.ndarray, block: int = 1 << 20) -> bool:
+    """Whether sorted ``dates`` repeat a value, checked a block at a time."""
+    stamps = dates.view(np.int64)
+    for start in range(0, len(stamps) - 1, block):
+        if (np.diff(stamps[start:start + block + 1]) == 0).any():
+            return True
+    return False
+
+
+class PriceStore:
+    """A partitioned price store at ``root``."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._load_manifest()
+
+    def _load_manifest(self):
+        with open(self.root / MANIFEST_FILENAME) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported price store format {manifest.get('format_version')} in {self.root}.")
+        self.manifest = manifest
+        self._partitions = {(p["crop"], p["city"]): Partition(**p) for p in manifest["partitions"]}
+
+    @staticmethod
+    def exists(root) -> bool:
+        return (Path(root) / MANIFEST_FILENAME).exists()
+
+    @classmethod
+    def create(cls, root, df: pd.DataFrame) -> "PriceStore":
+        """Write ``df`` as the store's entire content."""
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        if not cls.exists(root):
+            cls._commit(root, {})
+        store = cls(root)
+        store.write(df)
+        return store
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def crops(self):
+        return sorted({crop for crop, _ in self._partitions})
+
+    @property
+    def cities(self):
+        return sorted({city for _, city in self._partitions})
+
+    def __len__(self) -> int:
+        return sum(p.rows for p in self._partitions.values())
+
+    def partitions(self, crops=None, cities=None):
+        crops = None if crops is None else set([crops] if isinstance(crops, str) else crops)
+        cities = None if cities is None else set([cities] if isinstance(cities, str) else cities)
+        return [
+            p for key, p in sorted(self._partitions.items())
+            if (crops is None or p.crop in crops) and (cities is None or p.city in cities)
+        ]
+
+    def read_partition(self, crop: str, city: str, start=None, end=None):
+        """(dates, prices) of one series, memory-mapped; ``start``/``end`` are inclusive."""
+        p = self._partitions.get((crop, city))
+        if p is None:
+            return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=PRICE_DTYPE)
+        folder = self.root / p.path
+        dates = np.load(folder / f"date-{p.digest}.npy", mmap_mode="r")
+        prices = np.load(folder / f"price-{p.digest}.npy", mmap_mode="r")
+        lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "ns"), "left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "ns"), "right"))
+        return dates[lo:hi], prices[lo:hi]
+
+    def read(self, crops=None, cities=None, start=None, end=None) -> pd.DataFrame:
+        """Date, Crop, City and Price rows of the matching partitions, ordered by crop, city and date."""
+        try:
+            return self._read(crops, cities, start, end)
+        except FileNotFoundError:
+            # A writer replaced the partitions since the manifest was read
+            self._load_manifest()
+            return self._read(crops, cities, start, end)
+
+    def _read(self, crops, cities, start, end) -> pd.DataFrame:
+        parts = self.partitions(crops, cities)
+        columns = [self.read_partition(p.crop, p.city, start, end) for p in parts]
+        n = sum(len(d) for d, _ in columns)
+        dates = np.empty(n, dtype="datetime64[ns]")
+        prices = np.empty(n, dtype=PRICE_DTYPE)
+        crop_names, city_names = self.crops, self.cities
+        crop_codes = np.empty(n, dtype=np.int8 if len(crop_names) < 128 else np.int32)
+        city_codes = np.empty(n, dtype=np.int16 if len(city_names) < 2**15 else np.int32)
+        crop_pos = {name: i for i, name in enumerate(crop_names)}
+        city_pos = {name: i for i, name in enumerate(city_names)}
+        offset = 0
+        for p, (d, v) in zip(parts, columns):
+            stop = offset + len(d)
+            dates[offset:stop] = d
+            prices[offset:stop] = v
+            crop_codes[offset:stop] = crop_pos[p.crop]
+            city_codes[offset:stop] = city_pos[p.city]
+            offset = stop
+        return pd.DataFrame({
+            "Date": dates,
+            "Crop": pd.Categorical.from_codes(crop_codes, categories=crop_names),
+            "City": pd.Categorical.from_codes(city_codes, categories=city_names),
+            "Price": prices,
+        })
+
+    def _merge(self, key, dates, prices, overwrite: bool):
+        """(dates, prices, rows added) of a series merged with ``dates``/``prices`` (sorted, unique)."""
+        if key not in self._partitions:
+            return dates, prices, len(dates)
+        old_dates, old_prices = self.read_partition(*key)
+        new = ~np.isin(dates, old_dates)
+        if overwrite:
+            # Incoming prices win: keep only the old dates the input does not have
+            keep = ~np.isin(old_dates, dates)
+            dates = np.concatenate([old_dates[keep], dates])
+            prices = np.concatenate([old_prices[keep], prices])
+        else:
+            dates = np.concatenate([old_dates, dates[new]])
+            prices = np.concatenate([old_prices, prices[new]])
+        order = np.argsort(dates, kind="stable")
+        return dates[order], prices[order], int(new.sum())
+
+    def append(self, df: pd.DataFrame, overwrite: bool = False) -> int:
+        """Add rows for dates a series does not have yet; returns the number of rows added.
+
+        With ``overwrite`` the prices in ``df`` also replace those already stored for the same dates.
+        """
+        changed, added = {}, 0
+        for key, (dates, prices) in _columns(df).items():
+            dates, prices, new = self._merge(key, dates, prices, overwrite)
+            added += new
+            changed[key] = (dates, prices)
+        if changed:
+            self._update(changed.items(), replace=False)
+        return added
+
+    def write(self, df: pd.DataFrame) -> int:
+        """Replace the store's content with ``df``; returns the number of partitions rewritten."""
+        return self._update(_columns(df).items(), replace=True)
+
+    def writer(self, overwrite: bool = False) -> "StoreWriter":
+        """A ``StoreWriter`` appending to this store, as ``append`` would."""
+        return StoreWriter(self, overwrite)
+
+    def _update(self, series, replace: bool) -> int:
+        """Write ((crop, city), (dates, prices)) pairs, one series at a time, then commit the manifest."""
+        partitions = {} if replace else dict(self._partitions)
+        rewritten = 0
+        for (crop, city), (dates, prices) in series:
+            if _has_repeats(dates):
+                raise ValueError(f"Duplicate dates in the {crop}/{city} series.")
+            digest = _digest(dates, prices)
+            old = self._partitions.get((crop, city))
+            if old is not None and old.digest == digest:
+                partitions[(crop, city)] = old
+                continue
+            path = f"{quote(crop, safe='')}/{quote(city, safe='')}"
+            folder = self.root / path
+            folder.mkdir(parents=True, exist_ok=True)
+            for name, values in (("date", dates), ("price", prices)):
+                target = folder / f"{name}-{digest}.npy"
+                if not target.exists():
+                    _write_atomic(target, lambda f, v=values: np.save(f, v))
+            partitions[(crop, city)] = Partition(
+                crop, city, path, int(len(dates)), str(pd.Timestamp(dates[0]).date()) if len(dates) else None,
+                str(pd.Timestamp(dates[-1]).date()) if len(dates) else None, digest,
+            )
+            rewritten += 1
+        if rewritten or len(partitions) != len(self._partitions):
+            self._commit(self.root, partitions)
+            self._load_manifest()
+            self._remove_unreferenced()
+        return rewritten
+
+    @staticmethod
+    def _commit(root: Path, partitions: dict):
+        entries = [p._asdict() for _, p in sorted(partitions.items())]
+        manifest = {
+            "format_version": STORE_FORMAT_VERSION,
+            "version": hashlib.sha256(json.dumps(entries).encode()).hexdigest()[:12],
+            "rows": sum(p.rows for p in partitions.values()),
+            "partitions": entries,
+        }
+        _write_atomic(root / MANIFEST_FILENAME, lambda f: f.write(json.dumps(manifest, indent=1).encode()))
+
+    def _remove_unreferenced(self):
+        keep = {
+            self.root / p.path / f"{name}-{p.digest}.npy" for p in self._partitions.values() for name in ("date", "price")
+        }
+        for path in self.root.glob("*/*/*.npy"):
+            if path not in keep:
+                path.unlink(missing_ok=True)
+        for folder in sorted(self.root.glob("*/*"), reverse=True) + sorted(self.root.glob("*")):
+            # Leave StoreWriter spools (".spool-*") to their writers
+            if folder.relative_to(self.root).parts[0].startswith("."):
+                continue
+            if folder.is_dir() and not any(folder.iterdir()):
+                folder.rmdir()
+
+
+class StoreWriter:
+    """Chunk-at-a-time appends to a ``PriceStore``.
+
+    ``add`` spools each chunk's columns to raw files under the store root and
+    keeps nothing else in memory. ``commit`` (run when a ``with`` block exits
+    cleanly) builds one series at a time: a series spooled in date order
+    without repeated dates and not yet in the store is written straight from
+    its memory-mapped spool; otherwise its rows are sorted and merged with the
+    stored partition in memory, which costs about 24 bytes per row of that
+    series. Prices given more than once for a date are averaged, as
+    ``validation.validate`` does.
+    """
+
+    def __init__(self, store: PriceStore, overwrite: bool = False):
+        self.store = store
+        self.overwrite = overwrite
+        self.rows = 0
+        self.added = 0
+        self.duplicates = 0
+        self._spool = Path(tempfile.mkdtemp(prefix=".spool-", dir=store.root))
+        # (crop, city) -> [spool folder, rows, last date, in date order without repeats]
+        self._series = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Spool a Date/Crop/City/Price chunk; returns the number of rows taken."""
+        taken = 0
+        for key, (dates, prices) in _columns(df).items():
+            state = self._series.get(key)
+            if state is None:
+                folder = self._spool / str(len(self._series))
+                folder.mkdir()
+                state = self._series[key] = [folder, 0, None, True]
+            folder, rows, last, ordered = state
+            stamps = dates.view(np.int64)
+            ordered = ordered and (last is None or stamps[0] > last) and not (np.diff(stamps) == 0).any()
+            state[1:] = [rows + len(dates), int(stamps[-1]) if last is None else max(last, int(stamps[-1])), ordered]
+            with open(folder / "date.bin", "ab") as f:
+                f.write(dates.tobytes())
+            with open(folder / "price.bin", "ab") as f:
+                f.write(prices.tobytes())
+            taken += len(dates)
+        self.rows += taken
+        return taken
+
+    def _spooled(self):
+        """((crop, city), (dates, prices)) for each spooled series, built one at a time."""
+        self.added = self.duplicates = 0
+        for key, (folder, rows, _, ordered) in sorted(self._series.items()):
+            dates = np.memmap(folder / "date.bin", dtype="datetime64[ns]", mode="r", shape=(rows,))
+            prices = np.memmap(folder / "price.bin", dtype=PRICE_DTYPE, mode="r", shape=(rows,))
+            if ordered and key not in self.store._partitions:
+                self.added += rows
+                yield key, (dates, prices)
+                continue
+            order = np.argsort(dates, kind="stable")
+            dates, prices = np.asarray(dates)[order], np.asarray(prices)[order]
+            starts = np.flatnonzero(np.concatenate(([True], np.diff(dates.view(np.int64)) != 0)))
+            if len(starts) < len(dates):
+                self.duplicates += len(dates) - len(starts)
+                counts = np.diff(np.append(starts, len(dates)))
+                prices = (np.add.reduceat(prices.astype(np.float64), starts) / counts).astype(PRICE_DTYPE)
+                dates = dates[starts]
+            dates, prices, added = self.store._merge(key, dates, prices, self.overwrite)
+            self.added += added
+            yield key, (dates, prices)
+
+    def commit(self) -> int:
+        """Write the spooled rows into the store; returns the number of rows added."""
+        try:
+            if self._series:
+                self.store._update(self._spooled(), replace=False)
+            return self.added
+        finally:
+            self.discard()
+
+    def discard(self):
+        shutil.rmtree(self._spool, ignore_errors=True)
+        self._series = {}
+
+
+def open_store(root, workbook=None) -> PriceStore:
+    """Open the store at ``root``, importing ``workbook`` (and its updates log) the first time."""
+    root = Path(root)
+    if PriceStore.exists(root):
+        return PriceStore(root)
+    if workbook is None or not Path(workbook).exists():
+        raise FileNotFoundError(f"No price store at {root}" + (f" and no workbook {workbook}" if workbook else ""))
+    from dataset_cache import load_dataset
+    from validation import validate
+
+    logger.info(f"Importing {workbook} into the price store at {root}.")
+    return PriceStore.create(root, validate(load_dataset(workbook, categorical=False)).frame)
+
+
+def open_prices(path) -> PriceStore:
+    """Open a store given its directory, the directory holding it, or the workbook to import into it."""
+    path = Path(path)
+    if path.suffix in (".xlsx", ".xls"):
+        return open_store(path.with_name(STORE_DIRNAME), workbook=path)
+    if path.name != STORE_DIRNAME and not PriceStore.exists(path):
+        path = path / STORE_DIRNAME
+    return open_store(path, workbook=path.parent / LEGACY_WORKBOOK)
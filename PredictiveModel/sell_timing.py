@@ -0,0 +1,107 @@
+"""Best time to sell a harvest.
+
+``plan_sale`` takes a predicted price curve with one entry per day from the
+prediction date onwards. It applies the same 5% annualized inflation
+adjustment as the prediction page and subtracts a per-day storage cost,
+then returns the day that maximizes the net price. Days whose net prices
+are within ``TIE_TOLERANCE`` of each other count as a tie, and the earliest
+one wins. The curve itself comes from ``batch_predict.predict_days``. The
+callers cut it to the days the forecast grid covers
+(``ForecastGrid.covered_days``), so the search never runs on cells scored
+outside the grid, and they report how far it reaches.
+
+``python sell_timing.py --check`` runs ``plan_sale`` on a hand-built curve
+and exits with status 1 if it picks the wrong day.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Days after the prediction date considered for a sale
+SELL_WINDOW_DAYS = int(os.getenv("SELL_WINDOW_DAYS", 365))
+# Default storage cost in INR per quintal per day
+STORAGE_COST_PER_DAY = float(os.getenv("STORAGE_COST_PER_DAY", 1.0))
+ANNUAL_INFLATION = 0.05
+# Net prices closer than this (INR/quintal) are a tie; the earlier day wins
+TIE_TOLERANCE = 0.005
+
+SellPlan = namedtuple(
+    "SellPlan",
+    ["dates", "prices", "values", "best_offset", "best_date", "best_value", "sell_now_value", "gain"],
+)
+
+
+def inflation_factor(days_since_planting):
+    """Simplified annualized inflation with 30-day months, as on the prediction page."""
+    return 1 + ANNUAL_INFLATION * (np.asarray(days_since_planting) / 30 / 12)
+
+
+def plan_sale(prices, start, planting_date, storage_cost_per_day=STORAGE_COST_PER_DAY):
+    """Pick the sale day with the highest inflation-adjusted price net of storage.
+
+    ``prices[k]`` is the predicted price ``k`` days after ``start``, so day 0
+    means selling on the prediction date. Days without a price are skipped.
+    Returns None if no day has a price.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    start = np.datetime64(pd.Timestamp(start), "D")
+    offsets = np.arange(len(prices))
+    dates = start + offsets
+    since_planting = (dates - np.datetime64(pd.Timestamp(planting_date), "D")).astype(np.int64)
+    values = prices * inflation_factor(since_planting) - storage_cost_per_day * offsets
+    if not np.isfinite(values).any():
+        return None
+
+    best = int(np.flatnonzero(values >= np.nanmax(values) - TIE_TOLERANCE)[0])
+    sell_now = float(values[0])
+    return SellPlan(
+        dates, prices, values, best, pd.Timestamp(dates[best]), float(values[best]), sell_now,
+        float(values[best]) - sell_now if np.isfinite(sell_now) else None,
+    )
+
+
+# Function to check plan_sale on a hand-built curve; returns True if every case picks the expected day
+def check() -> bool:
+    start, planting = pd.Timestamp("2025-01-01"), pd.Timestamp("2024-01-07")
+    # Planting was 360 days before the start, so day k is inflated by 1.05 + 0.05 * k / 360
+    factor = 1.05 + ANNUAL_INFLATION * np.arange(6) / 360
+    cases = []
+
+    # Inflation alone makes a flat curve worth more every day
+    cases.append(("inflation", plan_sale(np.full(6, 1000.0), start, planting, storage_cost_per_day=0).best_offset, 5))
+    # A storage cost above the daily inflation gain (about 0.15 INR here) makes selling at once best
+    cases.append(("storage cost", plan_sale(np.full(6, 1000.0), start, planting, storage_cost_per_day=1).best_offset, 0))
+    # A peak pays if it beats the storage held for it
+    prices = np.array([1000.0, 1000, 1010, 1000, 1000, 1000])
+    cases.append(("peak", plan_sale(prices, start, planting, storage_cost_per_day=1).best_offset, 2))
+    # Days without a price are skipped, even on day 0
+    prices = np.array([np.nan, 1000, np.nan, 1020, np.nan, np.nan])
+    cases.append(("missing days", plan_sale(prices, start, planting, storage_cost_per_day=1).best_offset, 3))
+    cases.append(("no price", plan_sale(np.full(6, np.nan), start, planting), None))
+    # Day 4 nets exactly what day 1 does: the earlier day wins
+    prices = np.full(6, 900.0)
+    prices[1] = 1000.0
+    prices[4] = (1000.0 * factor[1] - 1 + 4) / factor[4]
+    cases.append(("tie", plan_sale(prices, start, planting, storage_cost_per_day=1).best_offset, 1))
+
+    ok = True
+    for name, got, want in cases:
+        ok &= got == want
+        print(f"{name}: best day {got}, expected {want}{'' if got == want else ' MISMATCH'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Best time to sell a harvest.")
+    parser.add_argument("--check", action="store_true", help="check plan_sale on a hand-built curve")
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        sys.exit(0)
+    sys.exit(0 if check() else 1)
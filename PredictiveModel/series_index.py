@@ -0,0 +1,139 @@
+"""Per-(crop, city) price series index built once from the combined dataset.
+
+The web app used to filter the whole ``combined_df`` with boolean masks for
+every prediction, suggestion, statistic and graph. ``SeriesIndex`` sorts the
+frame once by (Crop, City, Date) into a single contiguous block of NumPy
+arrays and hands out ``PriceSeries`` views into it, so a request only ever
+touches the rows of the series it asks for.
+"""
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from shared_arrays import share
+
+
+class PriceSeries:
+    """Date-sorted price history for one (crop, city) pair."""
+
+    __slots__ = ("crop", "city", "dates", "prices", "latest_price", "latest_date", "_month_positions")
+
+    def __init__(self, crop: str, city: str, dates: np.ndarray, prices: np.ndarray):
+        self.crop = crop
+        self.city = city
+        self.dates = dates
+        self.prices = prices
+        self.latest_price = float(prices[-1])
+        self.latest_date = pd.Timestamp(dates[-1])
+
+        # Precompute the positions of every calendar month once
+        months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        self._month_positions = {m: np.flatnonzero(months == m) for m in range(1, 13)}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def month_prices(self, month: int) -> np.ndarray:
+        return self.prices[self._month_positions.get(month, np.empty(0, dtype=np.intp))]
+
+    def between(self, start=None, end=None):
+        # Binary search on the sorted dates; both bounds are inclusive
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start)), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end)), side="right"))
+        return self.dates[lo:hi], self.prices[lo:hi]
+
+    def price_on_or_before(self, date):
+        pos = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date)), side="right"))
+        if pos == 0:
+            return None
+        return float(self.prices[pos - 1])
+
+    def recent(self, n: int = 5):
+        # Newest first, formatted the way the page template expects
+        dates = self.dates[-n:][::-1]
+        prices = self.prices[-n:][::-1]
+        return [
+            {"Date": str(d.astype("datetime64[D]")), "Price": float(p)}
+            for d, p in zip(dates, prices)
+        ]
+
+
+class SeriesIndex:
+    """Lookup table from (crop, city) to its ``PriceSeries``."""
+
+    def __init__(self, dates: np.ndarray, prices: np.ndarray, bounds: dict):
+        self.dates = dates
+        self.prices = prices
+        self.bounds = bounds
+        self._series = {
+            key: PriceSeries(key[0], key[1], dates[start:stop], prices[start:stop])
+            for key, (start, stop) in bounds.items()
+        }
+        self.version = self._content_version(dates, prices, bounds)
+
+    @staticmethod
+    def _content_version(dates, prices, bounds) -> str:
+        # Short content hash used to key caches derived from this data
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(dates).view(np.int64).tobytes())
+        h.update(np.ascontiguousarray(prices).tobytes())
+        h.update(repr(sorted(bounds.items())).encode())
+        return h.hexdigest()[:16]
+
+    def shared(self, name: str = "series") -> "SeriesIndex":
+        """Return this index backed by memory-mapped arrays other processes can share, filed under ``name``."""
+        dates = share(f"{name}-dates", self.dates, self.version)
+        prices = share(f"{name}-prices", self.prices, self.version)
+        if dates is self.dates and prices is self.prices:
+            return self
+        return SeriesIndex(dates, prices, self.bounds)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SeriesIndex":
+        df = df.dropna(subset=["Date", "Crop", "City", "Price"])
+        crops = df["Crop"].astype("category")
+        cities = df["City"].astype("category")
+        dates = df["Date"].to_numpy(dtype="datetime64[ns]")
+
+        # Stable sort by (crop, city, date) so each series is one contiguous run
+        order = np.lexsort((dates, cities.cat.codes.to_numpy(), crops.cat.codes.to_numpy()))
+        crop_codes = crops.cat.codes.to_numpy()[order]
+        city_codes = cities.cat.codes.to_numpy()[order]
+        sorted_dates = np.ascontiguousarray(dates[order])
+        prices = df["Price"].to_numpy(dtype=np.float64)
+        if df["Price"].dtype == np.float32:
+            # Widened float32 store prices read like 2739.199951171875; prices are quoted to the paisa
+            prices = prices.round(2)
+        sorted_prices = np.ascontiguousarray(prices[order])
+
+        if len(order):
+            changes = np.flatnonzero((np.diff(crop_codes) != 0) | (np.diff(city_codes) != 0)) + 1
+        else:
+            changes = np.empty(0, dtype=np.intp)
+        starts = np.concatenate(([0], changes)).astype(np.intp)
+        stops = np.concatenate((changes, [len(order)])).astype(np.intp)
+
+        bounds = {}
+        for start, stop in zip(starts, stops):
+            if stop > start:
+                key = (crops.cat.categories[crop_codes[start]], cities.cat.categories[city_codes[start]])
+                bounds[key] = (int(start), int(stop))
+        return cls(sorted_dates, sorted_prices, bounds)
+
+    def get(self, crop: str, city: str):
+        return self._series.get((crop, city))
+
+    def __contains__(self, key) -> bool:
+        return key in self._series
+
+    def __iter__(self):
+        return iter(self._series.values())
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def keys(self):
+        return self._series.keys()
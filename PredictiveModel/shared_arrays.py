@@ -0,0 +1,52 @@
+"""Share immutable NumPy arrays between worker processes via mmap'd files.
+
+With ``MYCROP_SHARED_DIR`` set (``gunicorn.conf.py`` points it at
+``/dev/shm/mycrop``), large read-only arrays such as the series index and
+the forecast grid are written once to ``<dir>/<name>-<version>.npy`` and
+every process memory-maps that file instead of holding a private copy. N
+workers therefore share one physical copy, including after a hot reload in
+an already-forked worker, where copy-on-write sharing from a preloaded
+master no longer applies. Without the variable, arrays stay in process
+memory.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHARED_DIR = os.getenv("MYCROP_SHARED_DIR")
+
+
+def version_tag(*parts) -> str:
+    return hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def share(name: str, array: np.ndarray, version: str, directory=None) -> np.ndarray:
+    """Return a read-only, memory-mapped copy of ``array`` (or ``array`` itself if sharing is off)."""
+    directory = directory or SHARED_DIR
+    if not directory:
+        return array
+
+    directory = Path(directory)
+    path = directory / f"{name}-{version}.npy"
+    try:
+        if not path.exists():
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, path)
+            # Older versions can go: processes that mapped them keep their mapping
+            for stale in directory.glob(f"{name}-*.npy"):
+                if stale != path:
+                    stale.unlink(missing_ok=True)
+        return np.load(path, mmap_mode="r")
+    except OSError as e:
+        logger.warning(f"Could not share {name} via {directory}: {e}; keeping a private copy.")
+        return array
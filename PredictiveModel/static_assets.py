@@ -0,0 +1,103 @@
+"""Fingerprinted static assets with long cache lifetimes.
+
+Templates call ``asset_url("css/prediction.css")`` and get
+``/assets/css/prediction.<hash>.css``. The hash is taken from the file's
+content, so the URL changes whenever the file does and browsers may cache
+each URL for a year. Assets are read once into memory together with
+precompressed gzip (and, if available, brotli) copies, and are re-read
+when the file's mtime changes.
+"""
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from compression import brotli, choose_encoding, compress
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+Asset = namedtuple("Asset", ["filename", "fingerprinted", "digest", "mtime_ns", "mimetype", "bodies"])
+
+
+def fingerprint(filename: str, digest: str) -> str:
+    path = Path(filename)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+class StaticAssets:
+    def __init__(self, static_folder, endpoint: str = "fingerprinted_asset"):
+        self.static_folder = Path(static_folder)
+        self.endpoint = endpoint
+        self._assets = {}
+        self._by_fingerprint = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Asset:
+        path = self.static_folder / filename
+        mtime_ns = path.stat().st_mtime_ns
+        asset = self._assets.get(filename)
+        if asset is None or asset.mtime_ns != mtime_ns:
+            asset = self._load(filename, path, mtime_ns)
+        return asset
+
+    def _load(self, filename, path, mtime_ns) -> Asset:
+        body = path.read_bytes()
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        bodies = {None: body, "gzip": compress(body, "gzip")}
+        if brotli is not None:
+            bodies["br"] = compress(body, "br")
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        asset = Asset(filename, fingerprint(filename, digest), digest, mtime_ns, mimetype, bodies)
+        with self._lock:
+            self._assets[filename] = asset
+            self._by_fingerprint[asset.fingerprinted] = asset
+        return asset
+
+    def resolve(self, fingerprinted: str):
+        """Return the asset served at a fingerprinted name, or None."""
+        asset = self._by_fingerprint.get(fingerprinted)
+        if asset is not None:
+            return asset
+        # Not requested through asset_url() in this process yet
+        path = Path(fingerprinted)
+        stem, _, digest = path.stem.rpartition(".")
+        filename = path.with_name(f"{stem}{path.suffix}")
+        root = self.static_folder.resolve()
+        if not stem or root not in (root / filename).resolve().parents or not (root / filename).is_file():
+            return None
+        asset = self.get(str(filename))
+        return asset if asset.digest == digest else None
+
+    def url(self, filename: str) -> str:
+        from flask import url_for
+
+        return url_for(self.endpoint, filename=self.get(filename).fingerprinted)
+
+    def init_app(self, app):
+        from flask import Response, abort, request
+
+        app.add_template_global(self.url, "asset_url")
+
+        @app.route("/assets/<path:filename>", endpoint=self.endpoint)
+        def fingerprinted_asset(filename):
+            asset = self.resolve(filename)
+            if asset is None:
+                abort(404)
+            if request.if_none_match.contains(asset.digest):
+                response = Response(status=304)
+            else:
+                encoding = choose_encoding(request.accept_encodings)
+                response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+                if encoding:
+                    response.headers["Content-Encoding"] = encoding
+            response.set_etag(asset.digest)
+            response.vary.add("Accept-Encoding")
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSET_MAX_AGE
+            response.cache_control.immutable = True
+            return response
+
+        return app
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules are flat scripts in PredictiveModel/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,57 @@
+"""BoosterPredictor must score exactly like XGBRegressor.predict."""
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBRegressor
+
+import inference
+from batch_predict import FEATURE_COLUMNS, build_feature_matrix
+from series_index import SeriesIndex
+
+CROPS = {"Rice": 0, "Wheat": 1}
+CITIES = {"Mumbai": 0, "Pune": 1, "Nagpur": 2}
+
+
+@pytest.fixture(scope="module")
+def series_index():
+    # A year of seasonal daily prices per (crop, city), with a few days missing
+    rng = np.random.default_rng(0)
+    frames = []
+    for crop, crop_code in CROPS.items():
+        for city, city_code in CITIES.items():
+            dates = pd.date_range("2022-01-01", periods=365, freq="D")
+            dates = dates[rng.random(len(dates)) > 0.1]
+            base = 2000 + 800 * crop_code + 150 * city_code
+            season = 300 * np.sin(2 * np.pi * dates.dayofyear.to_numpy() / 365)
+            prices = (base + season + rng.normal(0, 40, len(dates))).round(2)
+            frames.append(pd.DataFrame({"Date": dates, "Crop": crop, "City": city, "Price": prices}))
+    return SeriesIndex.from_frame(pd.concat(frames, ignore_index=True))
+
+
+@pytest.fixture(scope="module")
+def model(series_index):
+    # Trained the way prediction_model.py trains, on every observation with its previous price
+    X, y = [], []
+    for series in series_index:
+        n = len(series) - 1
+        X.append(build_feature_matrix(
+            series.dates[1:], np.full(n, CROPS[series.crop]), np.full(n, CITIES[series.city]), series.prices[:-1]
+        ))
+        y.append(series.prices[1:])
+    model = XGBRegressor(n_estimators=30, random_state=42, learning_rate=0.1, max_depth=4)
+    model.fit(pd.DataFrame(np.concatenate(X), columns=FEATURE_COLUMNS), np.concatenate(y))
+    return model
+
+
+def test_booster_path_matches_sklearn_path(model, series_index):
+    assert inference.verify_model(model, series_index, CROPS, CITIES)
+
+
+def test_mismatch_is_reported(model, series_index, monkeypatch):
+    score = inference.BoosterPredictor._score
+    monkeypatch.setattr(inference.BoosterPredictor, "_score", lambda self, buf: score(self, buf) + 1)
+    assert not inference.verify_model(model, series_index, CROPS, CITIES)
+
+
+def test_nothing_to_score_fails(model, series_index):
+    assert not inference.verify_model(model, series_index, {}, {})
@@ -0,0 +1,327 @@
+"""Walk-forward cross-validation and hyperparameter search for the price model.
+
+``prediction_model.py`` fits one hard-coded configuration on a random split,
+which lets future prices leak into training. This tool instead scores every
+candidate configuration on walk-forward folds. Each fold trains on
+everything before a cutoff date, early-stops on the last
+``--early-stopping-days`` of that training window, and is scored on the
+``--horizon-days`` that follow the cutoff. Every fold is therefore evaluated
+strictly out of time.
+
+Cleaning and features come from ``data_pipeline``, as in training and
+serving. The feature matrix is built once, sorted by date and written as
+``.npy`` files that every worker memory-maps, so folds are contiguous
+slices. Each worker also caches its fold ``DMatrix`` objects between
+candidates. (candidate, fold) tasks run in a process pool of ``--workers``
+processes, each using ``--threads`` XGBoost threads, so
+workers x threads never exceeds the cores.
+
+Results go to ``--output-dir``:
+
+* ``leaderboard.csv`` / ``leaderboard.json``: candidates ranked by mean
+  validation RMSE, next to the current default configuration and a
+  last-price baseline.
+* The winner refitted on all data, saved as the model bundle the web apps
+  load (``model_bundle.py``) plus ``tuning.json``. Point
+  ``MYCROP_BASE_DIR`` at the directory, together with the price store, to
+  serve it.
+
+Example:
+
+    python tune_model.py --data price_store --workers 8 --threads 2 --candidates 40
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_pipeline
+from batch_predict import FEATURE_COLUMNS
+from model_bundle import BUNDLE_FILENAME, save_bundle
+from predictors import BaselineTable
+from price_store import MANIFEST_FILENAME, STORE_DIRNAME, open_prices
+
+logger = logging.getLogger(__name__)
+
+# Configuration prediction_model.py trains today
+DEFAULT_PARAMS = {"n_estimators": 100, "learning_rate": 0.05, "max_depth": 4, "reg_lambda": 1.0, "reg_alpha": 0.1}
+
+# Search space; --candidates samples from its product
+PARAM_GRID = {
+    "n_estimators": [2000],
+    "learning_rate": [0.03, 0.05, 0.1],
+    "max_depth": [4, 6, 8],
+    "min_child_weight": [1, 5],
+    "subsample": [0.8, 1.0],
+    "colsample_bytree": [0.8, 1.0],
+    "reg_lambda": [1.0, 5.0],
+    "reg_alpha": [0.1, 1.0],
+}
+
+SEED = 42
+
+
+# Function to clean the dataset and build the date-sorted feature matrix the folds slice
+def prepare_matrices(store, cache_dir: Path):
+    """Return (paths, crop_name_to_code, city_name_to_code, cleaned_df); matrices are cached by data hash."""
+    df = store.read()
+    df, stats = data_pipeline.clean(df)
+    df, feature_stats = data_pipeline.run_stages(df, [
+        ("add_date_features", data_pipeline.add_date_features),
+        ("add_prev_price", data_pipeline.add_prev_price),
+    ])
+    logger.info("Pipeline stages:\n" + data_pipeline.format_stats(stats + feature_stats))
+    df, crop_name_to_code, city_name_to_code = data_pipeline.encode_categories(df)
+    df = df.sort_values("Date", kind="stable")
+
+    X = data_pipeline.feature_frame(df).to_numpy(dtype=np.float32)
+    y = df["Price"].to_numpy(dtype=np.float32)
+    dates = df["Date"].to_numpy(dtype="datetime64[D]")
+
+    digest = hashlib.sha256(X.tobytes() + y.tobytes()).hexdigest()[:12]
+    target = cache_dir / f"features-{digest}"
+    paths = {name: target / f"{name}.npy" for name in ("X", "y", "dates")}
+    if not all(p.exists() for p in paths.values()):
+        target.mkdir(parents=True, exist_ok=True)
+        for name, array in (("X", X), ("y", y), ("dates", dates.astype(np.int64))):
+            np.save(paths[name], array)
+        logger.info(f"Cached {X.shape} feature matrix in {target}.")
+    return paths, crop_name_to_code, city_name_to_code, df
+
+
+def walk_forward_folds(dates: np.ndarray, n_folds: int, horizon_days: int, early_stopping_days: int):
+    """(es_start, cutoff, stop) row offsets into date-sorted arrays, oldest fold first.
+
+    Rows ``[:es_start]`` train, ``[es_start:cutoff]`` drive early stopping and
+    ``[cutoff:stop]`` are scored. Each fold's validation window directly
+    follows its cutoff date, and the last window ends at the latest date.
+    """
+    last = dates[-1]
+    folds = []
+    for k in range(n_folds, 0, -1):
+        cutoff_date = last - k * horizon_days + 1
+        cutoff = int(np.searchsorted(dates, cutoff_date, side="left"))
+        stop = int(np.searchsorted(dates, cutoff_date + horizon_days, side="left"))
+        es_start = int(np.searchsorted(dates, cutoff_date - early_stopping_days, side="left"))
+        if es_start == 0 or cutoff == es_start or stop == cutoff:
+            logger.warning(f"Skipping fold at {cutoff_date}: not enough history.")
+            continue
+        folds.append((es_start, cutoff, stop))
+    return folds
+
+
+def sample_candidates(n: int, seed: int = SEED):
+    grid = [dict(zip(PARAM_GRID, values)) for values in itertools.product(*PARAM_GRID.values())]
+    random.Random(seed).shuffle(grid)
+    return [dict(DEFAULT_PARAMS)] + grid[:max(n - 1, 0)]
+
+
+def xgb_params(params: dict, threads: int) -> dict:
+    """Native ``xgb.train`` parameters for a scikit-learn style candidate."""
+    native = {k: v for k, v in params.items() if k != "n_estimators"}
+    native.update({"objective": "reg:squarederror", "tree_method": "hist", "nthread": threads, "seed": SEED})
+    if "learning_rate" in native:
+        native["eta"] = native.pop("learning_rate")
+    if "reg_lambda" in native:
+        native["lambda"] = native.pop("reg_lambda")
+    if "reg_alpha" in native:
+        native["alpha"] = native.pop("reg_alpha")
+    return native
+
+
+# Per-process state for pool workers: memory-mapped matrices and cached fold DMatrices
+_worker = {}
+
+
+def _init_worker(paths, threads):
+    _worker["X"] = np.load(paths["X"], mmap_mode="r")
+    _worker["y"] = np.load(paths["y"], mmap_mode="r")
+    _worker["threads"] = threads
+    _worker["dmatrices"] = {}
+
+
+def _fold_dmatrices(fold):
+    import xgboost as xgb
+
+    cache = _worker["dmatrices"]
+    if fold not in cache:
+        es_start, cutoff, _ = fold
+        X, y = _worker["X"], _worker["y"]
+        train = xgb.DMatrix(X[:es_start], label=y[:es_start], feature_names=FEATURE_COLUMNS, nthread=_worker["threads"])
+        early = xgb.DMatrix(X[es_start:cutoff], label=y[es_start:cutoff], feature_names=FEATURE_COLUMNS, nthread=_worker["threads"])
+        cache[fold] = (train, early)
+    return cache[fold]
+
+
+def run_task(task):
+    """Train one candidate on one fold; returns its validation metrics."""
+    import xgboost as xgb
+
+    candidate_id, params, fold, early_stopping_rounds = task
+    _, cutoff, stop = fold
+    t0 = time.perf_counter()
+    train, early = _fold_dmatrices(fold)
+    booster = xgb.train(
+        xgb_params(params, _worker["threads"]), train, num_boost_round=params.get("n_estimators", 100),
+        evals=[(early, "early")], early_stopping_rounds=early_stopping_rounds, verbose_eval=False,
+    )
+    best_iteration = booster.best_iteration
+    X_val = np.ascontiguousarray(_worker["X"][cutoff:stop])
+    pred = booster.inplace_predict(X_val, iteration_range=(0, best_iteration + 1))
+    err = pred.astype(np.float64) - _worker["y"][cutoff:stop]
+    return {
+        "candidate": candidate_id,
+        "fold": fold,
+        "rmse": float(np.sqrt(np.mean(err ** 2))),
+        "mae": float(np.mean(np.abs(err))),
+        "best_iteration": int(best_iteration),
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def last_price_scores(paths, folds):
+    """RMSE/MAE of predicting each price as the previous one, per fold."""
+    X = np.load(paths["X"], mmap_mode="r")
+    y = np.load(paths["y"], mmap_mode="r")
+    prev_col = FEATURE_COLUMNS.index("Prev_Price")
+    scores = []
+    for _, cutoff, stop in folds:
+        err = X[cutoff:stop, prev_col].astype(np.float64) - y[cutoff:stop]
+        scores.append((float(np.sqrt(np.mean(err ** 2))), float(np.mean(np.abs(err)))))
+    return scores
+
+
+def build_leaderboard(candidates, results, baseline_scores):
+    rows = []
+    for candidate_id, params in enumerate(candidates):
+        runs = [r for r in results if r["candidate"] == candidate_id]
+        rmse = np.array([r["rmse"] for r in runs])
+        rows.append({
+            "candidate": candidate_id,
+            "label": "default" if candidate_id == 0 else f"candidate-{candidate_id}",
+            "mean_rmse": float(rmse.mean()),
+            "std_rmse": float(rmse.std()),
+            "mean_mae": float(np.mean([r["mae"] for r in runs])),
+            "best_iteration": int(np.median([r["best_iteration"] for r in runs])),
+            "fit_seconds": float(sum(r["seconds"] for r in runs)),
+            "params": params,
+        })
+    rows.append({
+        "candidate": None,
+        "label": "last-price",
+        "mean_rmse": float(np.mean([s[0] for s in baseline_scores])),
+        "std_rmse": float(np.std([s[0] for s in baseline_scores])),
+        "mean_mae": float(np.mean([s[1] for s in baseline_scores])),
+        "best_iteration": None,
+        "fit_seconds": 0.0,
+        "params": {},
+    })
+    rows.sort(key=lambda row: row["mean_rmse"])
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+    return rows
+
+
+# Function to refit the winning configuration on all data and save it the way the apps load it
+def save_winner(winner, df, crop_name_to_code, city_name_to_code, output_dir: Path, threads: int, summary: dict):
+    from xgboost import XGBRegressor
+
+    params = dict(winner["params"])
+    # Early stopping picked the round count; refit on everything for that many rounds
+    params["n_estimators"] = winner["best_iteration"] + 1
+    model = XGBRegressor(random_state=SEED, n_jobs=threads, tree_method="hist", **params)
+    model.fit(data_pipeline.feature_frame(df), df["Price"])
+
+    baseline = BaselineTable.build(df["Crop"], df["City"], df["Season"], df["Price"])
+    save_bundle(
+        output_dir / BUNDLE_FILENAME, model, crop_name_to_code, city_name_to_code, baseline,
+        data_files=[Path(summary["data"]) / MANIFEST_FILENAME],
+        training={"producer": "tune_model.py", "rows": int(len(df)), "cv_rmse": winner["mean_rmse"]},
+    )
+    (output_dir / "tuning.json").write_text(json.dumps({**summary, "winner": winner, "refit_params": params}, indent=2, default=str))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward CV and hyperparameter search for the price model.")
+    parser.add_argument(
+        "--data", type=Path, default=Path(STORE_DIRNAME), help="price store, its parent directory, or a workbook to import"
+    )
+    parser.add_argument("--output-dir", type=Path, default=Path(f"tuning-{pd.Timestamp.now():%Y%m%d-%H%M%S}"))
+    parser.add_argument("--cache-dir", type=Path, default=Path(".tuning-cache"), help="where feature matrices are cached")
+    parser.add_argument("--candidates", type=int, default=20, help="configurations to try, including the current default")
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--horizon-days", type=int, default=90, help="validation window after each cutoff")
+    parser.add_argument("--early-stopping-days", type=int, default=90, help="tail of each training window used for early stopping")
+    parser.add_argument("--early-stopping-rounds", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes in the pool")
+    parser.add_argument("--threads", type=int, help="XGBoost threads per worker (default: cores / workers)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    cores = os.cpu_count() or 1
+    workers = max(1, min(args.workers, cores))
+    threads = args.threads or max(1, cores // workers)
+    if workers * threads > cores:
+        logger.warning(f"{workers} workers x {threads} threads oversubscribes {cores} cores.")
+
+    t0 = time.perf_counter()
+    store = open_prices(args.data)
+    paths, crop_name_to_code, city_name_to_code, df = prepare_matrices(store, args.cache_dir)
+    dates = np.load(paths["dates"]).astype("datetime64[D]")
+    folds = walk_forward_folds(dates, args.folds, args.horizon_days, args.early_stopping_days)
+    if not folds:
+        raise SystemExit("Not enough history for any walk-forward fold; reduce --folds or --horizon-days.")
+    for es_start, cutoff, stop in folds:
+        logger.info(f"Fold: train {es_start} rows to {dates[es_start - 1]}, early-stop {cutoff - es_start}, validate {dates[cutoff]}..{dates[stop - 1]} ({stop - cutoff} rows)")
+
+    candidates = sample_candidates(args.candidates, args.seed)
+    # Fold-major order keeps each worker on the same folds, so its cached DMatrices get reused
+    tasks = [(i, params, fold, args.early_stopping_rounds) for fold in folds for i, params in enumerate(candidates)]
+    logger.info(f"Running {len(tasks)} fits ({len(candidates)} candidates x {len(folds)} folds) on {workers} workers x {threads} threads.")
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(paths, threads)) as pool:
+        for result in pool.map(run_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+            results.append(result)
+    search_seconds = time.perf_counter() - t0
+
+    leaderboard = build_leaderboard(candidates, results, last_price_scores(paths, folds))
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame([{**row, "params": json.dumps(row["params"])} for row in leaderboard]).to_csv(args.output_dir / "leaderboard.csv", index=False)
+    (args.output_dir / "leaderboard.json").write_text(json.dumps(leaderboard, indent=2))
+
+    print(f"{'rank':>4}  {'label':<14}{'rmse':>10}{'± std':>9}{'mae':>10}{'rounds':>8}")
+    for row in leaderboard[:10]:
+        rounds = row["best_iteration"] if row["best_iteration"] is not None else "-"
+        print(f"{row['rank']:>4}  {row['label']:<14}{row['mean_rmse']:>10.1f}{row['std_rmse']:>9.1f}{row['mean_mae']:>10.1f}{rounds:>8}")
+
+    winner = next(row for row in leaderboard if row["candidate"] is not None)
+    summary = {
+        "data": str(store.root),
+        "store_version": store.version,
+        "rows": len(df),
+        "folds": [{"es_start": f[0], "cutoff": f[1], "stop": f[2], "validate_from": str(dates[f[1]])} for f in folds],
+        "workers": workers,
+        "threads": threads,
+        "search_seconds": search_seconds,
+    }
+    save_winner(winner, df, crop_name_to_code, city_name_to_code, args.output_dir, cores, summary)
+    print(f"Winner {winner['label']} (RMSE {winner['mean_rmse']:.1f}) saved to {args.output_dir} in {time.perf_counter() - t0:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
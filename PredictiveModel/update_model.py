@@ -0,0 +1,317 @@
+"""Incremental model updates as new daily prices arrive.
+
+Retraining from scratch redoes the whole history for a few dozen new
+observations. ``update_model.py`` takes only the rows that are new (by
+``(Date, Crop, City)``), after ``validation.validate`` has dropped bad rows and
+averaged repeated prices, and appends them to the price store, which
+rewrites only the affected (crop, city) partitions. It then recomputes ``Prev_Price`` for the affected series only and continues
+boosting the existing booster for ``--rounds`` trees via XGBoost's
+``xgb_model`` continuation. The new trees are fitted on the last
+``--window-days`` of every series, new rows included, so one day of prices
+does not pull the whole model towards it.
+
+Before training on a batch, the current model is scored on it, which gives
+an honest out-of-sample RMSE/MAE for every update. A full retrain is the
+safeguard against drift and ever-growing tree counts. It runs every
+``--full-every`` updates, when a batch brings a crop or city the model has
+never seen, on ``--full``, and on drift: when the served model's error on
+the batches since the last full retrain exceeds the full retrains' error by
+more than ``--drift-tolerance``. On those runs the full retrain is first
+fitted on the history without the batch and scored on it next to the
+incrementally updated model, so the report shows what incremental training
+costs in accuracy. The served model is then
+refitted on everything. Incremental runs report the same
+``incremental_rmse_gap`` against the RMSE the full retrains scored on their
+batches so far, and every run scores the last-price baseline on its batch.
+
+Each run appends its report to ``model_updates.jsonl`` and keeps its
+counters in ``model_updates.json``, both in the base directory. The
+updated model is published as a new model bundle (``model_bundle.py``),
+which the web apps pick up through their file watcher.
+
+    python update_model.py --new prices-2025-02-02.csv [--base-dir DIR]
+    python update_model.py --full
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import data_pipeline
+from artifacts import CITY_MAP_FILENAME, CROP_MAP_FILENAME, MODEL_FILENAME
+from dataset_cache import DATASET_COLUMNS
+from model_bundle import BUNDLE_FILENAME, load_bundle, model_params, save_bundle
+from predictors import BaselineTable
+from price_store import MANIFEST_FILENAME, open_prices
+from validation import validate
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = "model_updates.json"
+REPORTS_FILENAME = "model_updates.jsonl"
+
+# Trees added per incremental update
+DEFAULT_ROUNDS = 10
+# Days of every series the new trees are fitted on
+DEFAULT_WINDOW_DAYS = 30
+# Incremental updates between full retrains
+DEFAULT_FULL_EVERY = 7
+# Relative RMSE excess over the full retrains' that brings the next one forward
+DEFAULT_DRIFT_TOLERANCE = 0.25
+# Scored rows needed since the last full retrain before drift is judged; single days are too noisy
+DRIFT_MIN_ROWS = 100
+
+
+# Function to read a CSV or Excel file of new observations
+def read_new_rows(path) -> pd.DataFrame:
+    path = Path(path)
+    df = pd.read_excel(path) if path.suffix in (".xlsx", ".xls") else pd.read_csv(path)
+    missing = [c for c in DATASET_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"{path} is missing columns {missing}.")
+    return df[DATASET_COLUMNS]
+
+
+def new_observations(history: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """Rows whose (Date, Crop, City) is not in ``history`` yet, first occurrence only."""
+    rows = data_pipeline.drop_missing_keys(rows).drop_duplicates(["Date", "Crop", "City"])
+    keys = ["Date", "Crop", "City"]
+    known = pd.MultiIndex.from_frame(history[keys].astype({"Crop": object, "City": object}))
+    mask = ~pd.MultiIndex.from_frame(rows[keys].astype({"Crop": object, "City": object})).isin(known)
+    return rows[mask].reset_index(drop=True)
+
+
+def affected_rows(df: pd.DataFrame, since) -> pd.DataFrame:
+    """Feature rows dated ``since`` or later, with ``Prev_Price`` recomputed from each series' preceding row."""
+    df = df.sort_values(["Crop", "City", "Date"])
+    recent = (df["Date"] >= since).to_numpy()
+    same_series = (df["Crop"].eq(df["Crop"].shift(-1)) & df["City"].eq(df["City"].shift(-1))).to_numpy()
+    # The row just before each series' window supplies the first Prev_Price and is dropped by add_prev_price
+    lookback = np.zeros_like(recent)
+    lookback[:-1] = ~recent[:-1] & recent[1:] & same_series[:-1]
+    subset = df[recent | lookback]
+    return data_pipeline.add_prev_price(data_pipeline.add_date_features(subset))
+
+
+def encode(df: pd.DataFrame, crop_name_to_code: dict, city_name_to_code: dict) -> pd.DataFrame:
+    return df.assign(Crop=df["Crop"].map(crop_name_to_code), City=df["City"].map(city_name_to_code))
+
+
+def score(model, X: pd.DataFrame, y) -> dict:
+    if len(X) == 0:
+        return {"rows": 0, "rmse": None, "mae": None}
+    errors = model.predict(X).astype(np.float64) - np.asarray(y, dtype=np.float64)
+    return {"rows": int(len(X)), "rmse": float(np.sqrt(np.mean(errors ** 2))), "mae": float(np.mean(np.abs(errors)))}
+
+
+def score_last_price(rows: pd.DataFrame) -> dict:
+    """Error of predicting each row's price with its ``Prev_Price``."""
+    if rows.empty:
+        return {"rows": 0, "rmse": None, "mae": None}
+    errors = rows["Prev_Price"].to_numpy(dtype=np.float64) - rows["Price"].to_numpy(dtype=np.float64)
+    return {"rows": int(len(rows)), "rmse": float(np.sqrt(np.mean(errors ** 2))), "mae": float(np.mean(np.abs(errors)))}
+
+
+def feature_rows(cleaned: pd.DataFrame) -> pd.DataFrame:
+    """Date features and Prev_Price for every cleaned row, as in prediction_model.py."""
+    return data_pipeline.add_prev_price(data_pipeline.add_date_features(cleaned))
+
+
+# Function to fit a fresh model on every cleaned row; returns (model, crop_name_to_code, city_name_to_code, encoded rows)
+def train_full(cleaned: pd.DataFrame, params: dict):
+    from xgboost import XGBRegressor
+
+    df = feature_rows(cleaned)
+    df, crop_name_to_code, city_name_to_code = data_pipeline.encode_categories(df)
+    model = XGBRegressor(**params)
+    model.fit(data_pipeline.feature_frame(df), df["Price"])
+    return model, crop_name_to_code, city_name_to_code, df
+
+
+def continue_training(model, X: pd.DataFrame, y, rounds: int):
+    """Add ``rounds`` trees to a copy of ``model``'s booster, fitted on (X, y)."""
+    from xgboost import XGBRegressor
+
+    params = {**model.get_params(), "n_estimators": rounds}
+    updated = XGBRegressor(**params)
+    updated.fit(X, y, xgb_model=model.get_booster())
+    return updated
+
+
+def load_model_files(base_dir: Path):
+    """(model, crop_name_to_code, city_name_to_code) from the bundle, or from the pickles it replaced."""
+    if (base_dir / BUNDLE_FILENAME).exists():
+        bundle = load_bundle(base_dir / BUNDLE_FILENAME)
+        return bundle.model, bundle.crop_name_to_code, bundle.city_name_to_code
+    return (
+        joblib.load(base_dir / MODEL_FILENAME),
+        joblib.load(base_dir / CROP_MAP_FILENAME),
+        joblib.load(base_dir / CITY_MAP_FILENAME),
+    )
+
+
+def load_state(base_dir: Path) -> dict:
+    try:
+        return json.loads((base_dir / STATE_FILENAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(base_dir: Path, state: dict):
+    tmp = base_dir / f"{STATE_FILENAME}.tmp"
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, base_dir / STATE_FILENAME)
+
+
+def _rmse(state: dict, prefix: str) -> float:
+    return float(np.sqrt(state[f"{prefix}_sse"] / state[f"{prefix}_rows"]))
+
+
+def update(base_dir, new_path=None, rounds=DEFAULT_ROUNDS, window_days=DEFAULT_WINDOW_DAYS,
+           full_every=DEFAULT_FULL_EVERY, drift_tolerance=DEFAULT_DRIFT_TOLERANCE, force_full=False) -> dict:
+    """Apply one batch of new prices to the model in ``base_dir``; returns the run's report."""
+    base_dir = Path(base_dir)
+    timings = {}
+    t0 = time.perf_counter()
+
+    store = open_prices(base_dir)
+    history = store.read()
+    model, crop_name_to_code, city_name_to_code = load_model_files(base_dir)
+    state = load_state(base_dir)
+    if "full_params" not in state:
+        # The model as trained by prediction_model.py / tune_model.py sets the full-retrain configuration
+        state["full_params"] = {**model_params(model), "n_estimators": int(model.get_booster().num_boosted_rounds())}
+    timings["load"] = time.perf_counter() - t0
+
+    if new_path:
+        # Bad rows are quarantined and repeated prices averaged, as on ingestion
+        validation = validate(read_new_rows(new_path))
+        new = new_observations(history, validation.frame)
+    else:
+        validation, new = None, history.iloc[:0]
+    report = {
+        "time": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "source": str(new_path) if new_path else None,
+        "new_rows": int(len(new)),
+    }
+    if validation is not None and validation.report["quarantined"]:
+        report["quarantined"] = validation.report["quarantined"]
+        logger.warning(f"Quarantined rows of {new_path}: {validation.report['quarantined']}")
+    if new.empty and not force_full:
+        report["mode"] = "none"
+        logger.info("No new observations; model unchanged.")
+        return _finish(base_dir, state, report, timings, t0)
+
+    t1 = time.perf_counter()
+    combined = pd.concat([history[DATASET_COLUMNS].assign(New=False), new.assign(New=True)], ignore_index=True)
+    cleaned, _ = data_pipeline.clean(combined)
+    since = new["Date"].min() if not new.empty else cleaned["Date"].max()
+    recent = affected_rows(cleaned, since - pd.Timedelta(days=window_days))
+    batch = recent[recent["New"].to_numpy()]
+    unseen = sorted(set(new["Crop"]) - set(crop_name_to_code)) + sorted(set(new["City"]) - set(city_name_to_code))
+    report["cleaned_new_rows"] = int(cleaned["New"].sum())
+    report["unseen_categories"] = unseen
+    timings["features"] = time.perf_counter() - t1
+
+    # Prequential score: the model as served, on rows it has not been trained on
+    if not unseen:
+        batch_X = data_pipeline.feature_frame(encode(batch, crop_name_to_code, city_name_to_code))
+        report["served_model"] = score(model, batch_X, batch["Price"])
+    served = report.get("served_model")
+    # Predicting yesterday's price is the floor any model has to beat
+    report["last_price"] = score_last_price(batch)
+    if served and served["rows"]:
+        state["served_sse"] = state.get("served_sse", 0.0) + served["rmse"] ** 2 * served["rows"]
+        state["served_rows"] = state.get("served_rows", 0) + served["rows"]
+    drifted = (
+        state.get("served_rows", 0) >= DRIFT_MIN_ROWS and state.get("full_rows", 0) > 0
+        and _rmse(state, "served") > _rmse(state, "full") * (1 + drift_tolerance)
+    )
+
+    updates_since_full = state.get("updates_since_full", 0) + 1
+    reasons = [name for name, hit in (
+        ("requested", force_full), ("unseen categories", bool(unseen)),
+        ("schedule", updates_since_full >= full_every), ("drift", drifted),
+    ) if hit]
+
+    t1 = time.perf_counter()
+    if reasons:
+        report["mode"] = "full"
+        report["full_reasons"] = reasons
+        full_params = state["full_params"]
+        if not batch.empty:
+            # The full retrain the batch would have met, for comparison with the incremental model
+            holdout_model, crops, cities, _ = train_full(cleaned[~cleaned["New"].to_numpy()], full_params)
+            holdout = encode(batch, crops, cities)
+            known = holdout[["Crop", "City"]].notna().all(axis=1)
+            report["full_retrain"] = score(holdout_model, data_pipeline.feature_frame(holdout[known]), holdout["Price"][known])
+            full = report["full_retrain"]
+            if served and full["rows"]:
+                report["incremental_rmse_gap"] = served["rmse"] / full["rmse"] - 1
+                state["full_sse"] = state.get("full_sse", 0.0) + full["rmse"] ** 2 * full["rows"]
+                state["full_rows"] = state.get("full_rows", 0) + full["rows"]
+        model, crop_name_to_code, city_name_to_code, encoded = train_full(cleaned, full_params)
+        state.update(updates_since_full=0, served_sse=0.0, served_rows=0, last_full_retrain=report["time"])
+    else:
+        report["mode"] = "incremental"
+        window = encode(recent, crop_name_to_code, city_name_to_code)
+        model = continue_training(model, data_pipeline.feature_frame(window), window["Price"], rounds)
+        report["window_rows"] = int(len(window))
+        if served and served["rows"] and state.get("full_rows", 0) > 0:
+            # No full retrain on this batch; compare with what the full retrains scored on theirs
+            report["full_retrain_rmse"] = _rmse(state, "full")
+            report["incremental_rmse_gap"] = served["rmse"] / report["full_retrain_rmse"] - 1
+        state["updates_since_full"] = updates_since_full
+        encoded = encode(feature_rows(cleaned), crop_name_to_code, city_name_to_code)
+    report["trees"] = int(model.get_booster().num_boosted_rounds())
+    timings["train"] = time.perf_counter() - t1
+
+    t1 = time.perf_counter()
+    if not new.empty:
+        store.append(new)
+    baseline = BaselineTable.build(encoded["Crop"], encoded["City"], encoded["Season"], encoded["Price"])
+    # The bundle goes last: the apps reload when it changes and should find the new rows in place
+    manifest = save_bundle(
+        base_dir / BUNDLE_FILENAME, model, crop_name_to_code, city_name_to_code, baseline,
+        data_files=[store.root / MANIFEST_FILENAME],
+        training={"producer": "update_model.py", "mode": report["mode"], "new_rows": report["new_rows"]},
+    )
+    report["bundle_version"] = manifest["version"]
+    timings["save"] = time.perf_counter() - t1
+    return _finish(base_dir, state, report, timings, t0)
+
+
+def _finish(base_dir: Path, state: dict, report: dict, timings: dict, t0: float) -> dict:
+    report["seconds"] = {name: round(s, 3) for name, s in {**timings, "total": time.perf_counter() - t0}.items()}
+    save_state(base_dir, state)
+    with open(base_dir / REPORTS_FILENAME, "a") as f:
+        f.write(json.dumps(report, default=str) + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    from artifacts import BASE_DIR
+
+    parser = argparse.ArgumentParser(description="Incrementally update the crop price model with new daily prices.")
+    parser.add_argument("--base-dir", default=BASE_DIR)
+    parser.add_argument("--new", help="CSV or Excel file with Date, Crop, City and Price columns")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="trees added per update")
+    parser.add_argument("--window-days", type=int, default=DEFAULT_WINDOW_DAYS)
+    parser.add_argument("--full-every", type=int, default=DEFAULT_FULL_EVERY, help="updates between full retrains")
+    parser.add_argument("--drift-tolerance", type=float, default=DEFAULT_DRIFT_TOLERANCE)
+    parser.add_argument("--full", action="store_true", help="retrain from scratch now")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not args.new and not args.full:
+        parser.error("nothing to do: pass --new or --full")
+    result = update(args.base_dir, args.new, args.rounds, args.window_days, args.full_every, args.drift_tolerance, args.full)
+    print(json.dumps(result, indent=2, default=str))
@@ -0,0 +1,162 @@
+"""Typed validation and deduplication of price rows before they enter the store.
+
+Every row headed for the price store (``ingest.py``, ``workbook_reader.py``,
+``update_model.py`` and the first import of a legacy workbook) goes through
+``validate``, so the row-level checks that every training run used to repeat
+happen once. Rows are checked in one vectorized pass, and each failing row is
+quarantined with the first rule it breaks:
+
+    bad_date       date missing or not parsable
+    missing_key    crop or city empty
+    missing_price  no price
+    bad_price      price not a finite number
+    low_price      price below ``data_pipeline.MIN_PRICE`` (a data-entry error)
+
+The surviving rows are sorted by crop, city and date, and prices reported more
+than once for the same key are averaged, found as runs of equal keys in the
+sorted order rather than with a group-by. The result uses the store's compact
+dtypes: categorical Crop and City, ``datetime64[ns]`` dates and ``float32``
+prices. Outlier removal stays in ``data_pipeline``, because its bounds come from
+the whole dataset and move as new prices arrive.
+
+``write_report`` saves the counts per reason as ``validation.json`` and the
+quarantined rows, with their reason, as ``quarantine.csv``.
+"""
+from __future__ import annotations
+
+import json
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import MIN_PRICE
+from workbook_reader import DATE_FORMAT
+
+REPORT_FILENAME = "validation.json"
+QUARANTINE_FILENAME = "quarantine.csv"
+COLUMNS = ["Date", "Crop", "City", "Price"]
+PRICE_DTYPE = np.float32
+# Quarantine reasons, in the order the rules are checked
+REASONS = ["bad_date", "missing_key", "missing_price", "bad_price", "low_price"]
+
+Validation = namedtuple("Validation", ["frame", "quarantine", "report"])
+
+
+def _dates(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]")
+    text = values.astype(object).where(values.notna()).astype(str).str.strip()
+    dates = pd.to_datetime(text, format=DATE_FORMAT, errors="coerce")
+    # Anything else (update batches use ISO dates) gets a second, stricter pass
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(text[retry], format="ISO8601", errors="coerce")
+    return dates.to_numpy(dtype="datetime64[ns]")
+
+
+def _names(values: pd.Series) -> pd.Categorical:
+    text = values.astype(object)
+    text = text.where(text.isna(), text.astype(str).str.strip())
+    return pd.Categorical(text.mask(text == ""))
+
+
+def validate(df: pd.DataFrame, min_price: float = MIN_PRICE, dedup: bool = True) -> Validation:
+    """Check, deduplicate and compact Date/Crop/City/Price rows; returns ``Validation(frame, quarantine, report)``.
+
+    Columns other than the four above are dropped from ``frame`` but kept in
+    ``quarantine``, next to ``Reason``. ``ingest.py`` adds the source file,
+    and both readers add ``RawDate``, the text of a date cell that did not parse.
+    """
+    t0 = time.perf_counter()
+    missing = [c for c in COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Price rows are missing columns {missing}.")
+    df = df.reset_index(drop=True)
+    dates = _dates(df["Date"])
+    crops = _names(df["Crop"])
+    cities = _names(df["City"])
+    raw_prices = df["Price"]
+    if isinstance(raw_prices.dtype, pd.CategoricalDtype):
+        raw_prices = raw_prices.astype(object)
+    prices = pd.to_numeric(raw_prices, errors="coerce").to_numpy(dtype=np.float64)
+
+    checks = [
+        np.isnat(dates),
+        (crops.codes < 0) | (cities.codes < 0),
+        raw_prices.isna().to_numpy(),
+        ~np.isfinite(prices),
+        prices < min_price,
+    ]
+    reason = np.select(checks, np.arange(1, len(REASONS) + 1), 0)
+    ok = reason == 0
+    counts = np.bincount(reason, minlength=len(REASONS) + 1)
+    quarantine = df[~ok].assign(Reason=np.asarray(REASONS, dtype=object)[reason[~ok] - 1])
+
+    crop_codes, city_codes = crops.codes[ok], cities.codes[ok]
+    dates, prices = dates[ok], prices[ok]
+    order = np.lexsort((dates.view(np.int64), city_codes, crop_codes))
+    crop_codes, city_codes, dates, prices = crop_codes[order], city_codes[order], dates[order], prices[order]
+    duplicates = 0
+    if dedup and len(dates):
+        stamps = dates.view(np.int64)
+        starts = np.flatnonzero(np.concatenate((
+            [True], (np.diff(stamps) != 0) | (np.diff(crop_codes) != 0) | (np.diff(city_codes) != 0),
+        )))
+        duplicates = len(dates) - len(starts)
+        if duplicates:
+            counts_per_key = np.diff(np.append(starts, len(dates)))
+            prices = np.add.reduceat(prices, starts) / counts_per_key
+            crop_codes, city_codes, dates = crop_codes[starts], city_codes[starts], dates[starts]
+
+    frame = pd.DataFrame({
+        "Date": dates,
+        "Crop": pd.Categorical.from_codes(crop_codes, crops.categories).remove_unused_categories(),
+        "City": pd.Categorical.from_codes(city_codes, cities.categories).remove_unused_categories(),
+        "Price": prices.astype(PRICE_DTYPE),
+    })
+    report = {
+        "rows_in": int(len(df)),
+        "rows_out": int(len(frame)),
+        "quarantined": {name: int(n) for name, n in zip(REASONS, counts[1:]) if n},
+        "duplicates_merged": int(duplicates),
+        # The same four columns on both sides; tracing columns such as Source are not compacted
+        "bytes_in": int(df[COLUMNS].memory_usage(deep=True).sum()),
+        "bytes_out": int(frame.memory_usage(deep=True).sum()),
+        "seconds": round(time.perf_counter() - t0, 4),
+    }
+    return Validation(frame, quarantine, report)
+
+
+def merge_reports(reports) -> dict:
+    """Sum the counts of several ``validate`` reports (one per chunk of a stream)."""
+    total = {"rows_in": 0, "rows_out": 0, "quarantined": {}, "duplicates_merged": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+    for report in reports:
+        for key, value in report.items():
+            if key == "quarantined":
+                for reason, n in value.items():
+                    total["quarantined"][reason] = total["quarantined"].get(reason, 0) + n
+            else:
+                total[key] += value
+    total["seconds"] = round(total["seconds"], 4)
+    return total
+
+
+def format_report(report: dict) -> str:
+    quarantined = ", ".join(f"{n} {reason}" for reason, n in report["quarantined"].items()) or "none"
+    return (
+        f"validated {report['rows_in']} rows -> {report['rows_out']} "
+        f"({report['duplicates_merged']} duplicates merged; quarantined: {quarantined})"
+    )
+
+
+# Function to write the validation report and quarantined rows into a directory
+def write_report(directory, report: dict, quarantine: pd.DataFrame = None, source=None):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    record = {"time": pd.Timestamp.now().isoformat(timespec="seconds"), "source": source and str(source), **report}
+    (directory / REPORT_FILENAME).write_text(json.dumps(record, indent=2))
+    if quarantine is not None:
+        quarantine.to_csv(directory / QUARANTINE_FILENAME, index=False)
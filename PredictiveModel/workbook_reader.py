@@ -0,0 +1,290 @@
+"""Bounded-memory streaming reader for price workbooks.
+
+``pd.read_excel`` builds every row of every sheet as Python objects before
+the frame exists, so a multi-hundred-MB export from a mandi board needs
+several GB of memory. ``iter_chunks`` opens the workbook with openpyxl in
+read-only mode instead and yields typed frames of at most ``chunk_rows``
+rows, sheet after sheet:
+
+* date columns (``Date`` by default) become ``datetime64[ns]``; text cells
+  are parsed with ``DATE_FORMAT`` (``"19 Jan 2019"``), date cells are taken
+  as they are and bare numbers are read as Excel serial dates. With
+  ``raw_dates=True`` a ``Raw<column>`` column keeps the text of every cell
+  that did not parse, so quarantined rows can be traced to the source;
+* columns whose first chunk holds only numbers become ``float64``;
+* other text columns become categoricals.
+
+``stream_to_store`` validates each chunk (``validation.py``) and feeds it
+to a ``price_store.StoreWriter``, so memory stays at a few chunks however
+large the workbook is. Quarantined rows and the validation report are
+written next to the store:
+
+    python workbook_reader.py export.xlsx [--store price_store] [--crop Maize --city Pune]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import resource
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Dates in the source workbooks look like "19 Jan 2019"
+DATE_FORMAT = "%d %b %Y"
+CHUNK_ROWS = 50_000
+# Prefix of the column holding the text of date cells that did not parse
+RAW_PREFIX = "Raw"
+# Day zero of Excel's serial dates (including its 1900 leap-year bug)
+EXCEL_EPOCH = np.datetime64("1899-12-30", "ns")
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def parse_dates(values, date_format: str = DATE_FORMAT) -> np.ndarray:
+    """``datetime64[ns]`` of a chunk of date cells; unparsable cells become NaT."""
+    values = np.asarray(values, dtype=object)
+    out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+    is_text = np.fromiter((isinstance(v, str) for v in values), bool, len(values))
+    is_date = np.fromiter((isinstance(v, (datetime, date)) for v in values), bool, len(values))
+    is_number = np.fromiter((_is_number(v) for v in values), bool, len(values))
+    if is_text.any():
+        text = pd.Series(values[is_text], dtype=object).str.strip()
+        out[is_text] = pd.to_datetime(text, format=date_format, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    if is_date.any():
+        out[is_date] = pd.to_datetime(pd.Series(values[is_date], dtype=object)).to_numpy(dtype="datetime64[ns]")
+    if is_number.any():
+        days = values[is_number].astype(np.float64)
+        out[is_number] = EXCEL_EPOCH + np.round(days * 86_400).astype("timedelta64[s]").astype("timedelta64[ns]")
+    return out
+
+
+def unparsed_text(values, dates: np.ndarray) -> np.ndarray:
+    """Text of the non-empty cells that parsed to NaT, None elsewhere."""
+    values = np.asarray(values, dtype=object)
+    out = np.full(len(values), None, dtype=object)
+    failed = np.flatnonzero(np.isnat(dates))
+    for i in failed:
+        if values[i] is not None and str(values[i]).strip():
+            out[i] = str(values[i]).strip()
+    return out
+
+
+def _typed_frame(header, rows, date_columns, numeric, raw_dates=False) -> pd.DataFrame:
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    data = {}
+    for name, values in zip(header, columns):
+        if name in date_columns:
+            data[name] = parse_dates(values)
+            if raw_dates:
+                data[RAW_PREFIX + name] = unparsed_text(values, data[name])
+        elif name in numeric:
+            data[name] = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        elif all(v is None or isinstance(v, str) for v in values):
+            data[name] = pd.Categorical([None if v is None else v.strip() for v in values])
+        else:
+            data[name] = pd.Series(values, dtype=object).to_numpy()
+    return pd.DataFrame(data)
+
+
+def _open_workbook(path):
+    """openpyxl's workbook reader with strings, sheet list and styles loaded, but no worksheets.
+
+    ``load_workbook(read_only=True)`` sizes every sheet up front; a sheet
+    without a ``<dimension>`` element (common in generated exports) is parsed
+    in full just for that. Rows are read by ``_sheet_rows`` instead.
+    """
+    from openpyxl.reader.excel import ExcelReader
+    from openpyxl.styles.stylesheet import apply_stylesheet
+
+    reader = ExcelReader(path, read_only=True, data_only=True)
+    reader.read_manifest()
+    reader.read_strings()
+    reader.read_workbook()
+    apply_stylesheet(reader.archive, reader.wb)
+    return reader
+
+
+def _sheet_rows(reader, sheet_path):
+    """Cell values of each non-missing row of a worksheet.
+
+    ``ReadOnlyWorksheet.iter_rows`` clears each parsed ``<row>`` but leaves it
+    attached to ``<sheetData>``, so memory still grows by about 90 bytes per
+    row. This is the same loop over openpyxl's own cell parser (types, shared
+    strings, date styles) that also detaches every row once it is read.
+    """
+    from openpyxl.worksheet._reader import DATA_TAG, ROW_TAG, WorkSheetParser
+    from openpyxl.xml.functions import iterparse
+
+    src = reader.archive.open(sheet_path)
+    try:
+        parser = WorkSheetParser(
+            src, reader.shared_strings, data_only=True, epoch=reader.wb.epoch, date_formats=reader.wb._date_formats,
+        )
+        sheet_data = None
+        for event, element in iterparse(src, events=("start", "end")):
+            if event == "start":
+                if element.tag == DATA_TAG:
+                    sheet_data = element
+            elif element.tag == ROW_TAG:
+                _, cells = parser.parse_row(element)
+                if sheet_data is not None:
+                    sheet_data.clear()
+                values = [None] * (cells[-1]["column"] if cells else 0)
+                for cell in cells:
+                    values[cell["column"] - 1] = cell["value"]
+                yield tuple(values)
+    finally:
+        src.close()
+
+
+def iter_chunks(path, columns=None, chunk_rows: int = CHUNK_ROWS, date_columns=("Date",), raw_dates=False):
+    """Typed frames of at most ``chunk_rows`` rows from every sheet of a workbook.
+
+    Each sheet's first non-empty row is its header. ``columns`` keeps only those
+    columns; a sheet without all of them is skipped.
+    """
+    reader = _open_workbook(path)
+    try:
+        for sheet, rel in reader.parser.find_sheets():
+            if rel.target not in reader.valid_files or "chartsheet" in rel.Type:
+                continue
+            rows = _sheet_rows(reader, rel.target)
+            header = None
+            for row in rows:
+                if any(v is not None for v in row):
+                    header = [str(v).strip() if v is not None else f"Unnamed: {i}" for i, v in enumerate(row)]
+                    break
+            if header is None:
+                continue
+            wanted = list(columns) if columns is not None else header
+            missing = [c for c in wanted if c not in header]
+            if missing:
+                logger.warning(f"Skipping sheet {sheet.name!r} of {path}: no column(s) {missing}.")
+                continue
+            positions = [header.index(c) for c in wanted]
+            numeric = None
+            batch = []
+            for row in rows:
+                if not any(v is not None for v in row):
+                    continue
+                batch.append(tuple(row[i] if i < len(row) else None for i in positions))
+                if len(batch) == chunk_rows:
+                    if numeric is None:
+                        numeric = _numeric_columns(wanted, batch, date_columns)
+                    yield _typed_frame(wanted, batch, date_columns, numeric, raw_dates)
+                    batch = []
+            if batch:
+                if numeric is None:
+                    numeric = _numeric_columns(wanted, batch, date_columns)
+                yield _typed_frame(wanted, batch, date_columns, numeric, raw_dates)
+    finally:
+        reader.archive.close()
+
+
+def _numeric_columns(header, rows, date_columns) -> set:
+    """Columns whose non-empty cells in ``rows`` are all numbers; fixed for the rest of the sheet."""
+    numeric = set()
+    for name, values in zip(header, zip(*rows)):
+        present = [v for v in values if v is not None and v != ""]
+        if name not in date_columns and present and all(_is_number(v) for v in present):
+            numeric.add(name)
+    return numeric
+
+
+# Function to read one crop/city workbook's Date and Price columns, plus the position and text of unparsable dates
+def read_price_columns(path, chunk_rows: int = CHUNK_ROWS):
+    dates, prices, bad_rows, bad_text = [], [], [], []
+    offset = 0
+    for chunk in iter_chunks(path, ["Date", "Price"], chunk_rows, raw_dates=True):
+        raw = chunk[RAW_PREFIX + "Date"].to_numpy()
+        failed = np.flatnonzero(pd.notna(raw))
+        bad_rows.append(failed + offset)
+        bad_text.extend(raw[failed])
+        dates.append(chunk["Date"].to_numpy(dtype="datetime64[ns]"))
+        prices.append(pd.to_numeric(chunk["Price"].astype(object), errors="coerce").to_numpy(dtype=np.float64))
+        offset += len(chunk)
+    if not dates:
+        raise ValueError(f"No sheet in {path} has Date and Price columns.")
+    return np.concatenate(dates), np.concatenate(prices), np.concatenate(bad_rows), np.array(bad_text, dtype=str)
+
+
+def stream_to_store(path, store, crop=None, city=None, overwrite=False, chunk_rows: int = CHUNK_ROWS,
+                    quarantine_path=None) -> dict:
+    """Validate a workbook's rows and append them to a ``PriceStore`` chunk by chunk; returns the validation report.
+
+    The workbook needs Date and Price columns, plus Crop and City unless
+    ``crop``/``city`` name the single series it holds. Quarantined rows are
+    appended to ``quarantine_path`` as they are found.
+    """
+    from validation import merge_reports, validate
+
+    columns = ["Date", "Price"] + [name for name, fixed in (("Crop", crop), ("City", city)) if fixed is None]
+    reports = []
+    if quarantine_path is not None:
+        Path(quarantine_path).unlink(missing_ok=True)
+    with store.writer(overwrite=overwrite) as writer:
+        for chunk in iter_chunks(path, columns, chunk_rows, raw_dates=True):
+            if crop is not None:
+                chunk["Crop"] = crop
+            if city is not None:
+                chunk["City"] = city
+            # Duplicates can span chunks, so the writer merges them once all rows are spooled
+            result = validate(chunk, dedup=False)
+            writer.add(result.frame)
+            reports.append(result.report)
+            if quarantine_path is not None and len(result.quarantine):
+                with open(quarantine_path, "a", newline="") as f:
+                    result.quarantine.to_csv(f, header=f.tell() == 0, index=False)
+    report = merge_reports(reports)
+    report.update(chunks=len(reports), duplicates_merged=writer.duplicates, added=writer.added)
+    report["rows_out"] -= writer.duplicates
+    return report
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def main(argv=None):
+    from price_store import STORE_DIRNAME, PriceStore
+    from validation import QUARANTINE_FILENAME, format_report, write_report
+
+    parser = argparse.ArgumentParser(description="Stream a price workbook into the price store.")
+    parser.add_argument("workbook", type=Path)
+    parser.add_argument("--store", type=Path, default=Path(STORE_DIRNAME))
+    parser.add_argument("--crop", help="crop of a workbook without a Crop column")
+    parser.add_argument("--city", help="city of a workbook without a City column")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--overwrite", action="store_true", help="replace stored prices for the same dates")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not PriceStore.exists(args.store):
+        PriceStore.create(args.store, pd.DataFrame(columns=["Date", "Crop", "City", "Price"]))
+    t0 = time.perf_counter()
+    report = stream_to_store(
+        args.workbook, PriceStore(args.store), args.crop, args.city, args.overwrite, args.chunk_rows,
+        quarantine_path=args.store / QUARANTINE_FILENAME,
+    )
+    write_report(args.store, report, source=args.workbook)
+    print(format_report(report))
+    print(
+        f"{report['rows_in']} rows in {report['chunks']} chunk(s), {report['added']} new, "
+        f"in {time.perf_counter() - t0:.2f}s; peak RSS {peak_rss_bytes() / 2**20:.0f} MiB"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
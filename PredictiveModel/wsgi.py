@@ -0,0 +1,11 @@
+"""WSGI entry point for the price prediction web app.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Artifacts are loaded here, so with ``preload_app`` they are in memory
+before gunicorn forks its workers. The artifact watcher is started per
+worker from ``gunicorn.conf.py``.
+"""
+from app_with_webpage_fixed import create_app
+
+app = create_app(watch=False)
@@ -1,6 +1,14 @@
-"""Convert combined_crop_data_citywise.xlsx into frontend/crops.csv
+"""Convert the combined price data into frontend/crops.csv
 
-Assumptions (adjust if your real sheet differs):
+The data is read from the price store (PredictiveModel/price_store, see
+PredictiveModel/price_store.py) when it exists. The store's rows are also
+exported long-format (Date,Crop,City,Price) to
+frontend/combined_crop_data_citywise.csv, which frontend/excel-loader.js
+prefers over the workbook. Without a store the workbook is converted
+instead, streamed in chunks (PredictiveModel/workbook_reader.py) so that
+memory does not grow with the size of the workbook.
+
+Workbook assumptions (adjust if your real sheet differs):
 - Excel file path: ../frontend/combined_crop_data_citywise.xlsx relative to this script or same repo root
 - We expect at least columns identifying crop name, date, and price.
 - If the workbook is city-wise (multiple cities' price columns), we'll take the average across cities per crop+date.
@@ -16,6 +24,10 @@ import sys
 # ---------- Configuration ----------
 EXCEL_FILENAME = "combined_crop_data_citywise.xlsx"
 OUTPUT_CSV = Path("../frontend/crops.csv")  # relative to backend/ directory
+CITYWISE_CSV = Path("../frontend/combined_crop_data_citywise.csv")  # relative to backend/ directory
+PREDICTIVE_MODEL_DIR = Path(__file__).parent.parent / "PredictiveModel"
+# price_store and workbook_reader live with the prediction model
+sys.path.insert(0, str(PREDICTIVE_MODEL_DIR))
 # Potential column name variants
 CROP_COL_CANDIDATES = ["Crop", "crop", "Crop Name", "Crop_Name"]
 DATE_COL_CANDIDATES = ["Date", "date", "Month", "month", "Date Recorded"]
@@ -29,16 +41,27 @@ def find_column(possible_names: list[str], df: pd.DataFrame) -> str:
     raise ValueError(f"None of the possible columns {possible_names} found in spreadsheet columns: {list(df.columns)}")
 
 
-def load_excel(path: Path) -> pd.DataFrame:
+def load_excel(path: Path):
+    """Typed chunks of every sheet, read in bounded memory; dates are left for normalize to parse."""
+    from workbook_reader import iter_chunks
+
     if not path.exists():
         raise FileNotFoundError(f"Excel file not found: {path.resolve()}")
-    # Read all sheets and concatenate if multiple
-    xls = pd.ExcelFile(path)
-    frames = []
-    for sheet in xls.sheet_names:
-        frames.append(pd.read_excel(xls, sheet_name=sheet))
-    df = pd.concat(frames, ignore_index=True)
-    return df
+    return iter_chunks(path, date_columns=())
+
+
+def load_store(model_dir: Path) -> pd.DataFrame | None:
+    """Date, Crop, City and Price rows of the price store, or None if there is no store."""
+    from price_store import STORE_DIRNAME, PriceStore
+
+    if not PriceStore.exists(model_dir / STORE_DIRNAME):
+        return None
+    return PriceStore(model_dir / STORE_DIRNAME).read()
+
+
+def write_citywise(df: pd.DataFrame, path: Path):
+    out = df.assign(Date=df["Date"].dt.strftime("%Y-%m-%d"), Price=df["Price"].round(2))
+    out.sort_values(["Date", "Crop", "City"]).to_csv(path, index=False)
 
 
 def melt_and_aggregate(df: pd.DataFrame) -> pd.DataFrame:
@@ -67,28 +90,50 @@ def melt_and_aggregate(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
-def normalize(out: pd.DataFrame) -> pd.DataFrame:
+def clean_rows(out: pd.DataFrame) -> pd.DataFrame:
     # Drop rows with missing essentials
     out = out.dropna(subset=["Crop", "Date", "Price"]).copy()
     # Parse date -> ISO date (no time)
     out["Date"] = pd.to_datetime(out["Date"], errors="coerce")
     out = out.dropna(subset=["Date"]).copy()
     out["Date"] = out["Date"].dt.date.astype(str)
+    out["Crop"] = out["Crop"].astype(str)
+    return out
+
+
+def normalize(out: pd.DataFrame) -> pd.DataFrame:
     # Aggregate: average price per crop per date
-    grouped = out.groupby(["Crop", "Date"], as_index=False)["Price"].mean()
+    grouped = clean_rows(out).groupby(["Crop", "Date"], as_index=False)["Price"].mean()
     # Sort by date
     grouped.sort_values(["Crop", "Date"], inplace=True)
     return grouped
 
 
+def normalize_chunks(chunks) -> pd.DataFrame:
+    """normalize() over workbook chunks, keeping only running sums and counts per crop and date."""
+    totals = None
+    for chunk in chunks:
+        part = clean_rows(melt_and_aggregate(chunk)).groupby(["Crop", "Date"])["Price"].agg(["sum", "count"])
+        totals = part if totals is None else totals.add(part, fill_value=0)
+    if totals is None:
+        raise ValueError("No rows found in the workbook")
+    grouped = (totals["sum"] / totals["count"]).rename("Price").reset_index()
+    grouped.sort_values(["Crop", "Date"], inplace=True)
+    return grouped
+
+
 def main():
     script_dir = Path(__file__).parent
     excel_path = script_dir.parent / "frontend" / EXCEL_FILENAME
     try:
-        df_raw = load_excel(excel_path)
-        processed = melt_and_aggregate(df_raw)
-        final = normalize(processed)
+        store_df = load_store(PREDICTIVE_MODEL_DIR)
         OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
+        if store_df is not None:
+            write_citywise(store_df, CITYWISE_CSV)
+            print(f"✅ Generated {CITYWISE_CSV.resolve()} with {len(store_df)} rows")
+            final = normalize(store_df[["Crop", "Date", "Price"]])
+        else:
+            final = normalize_chunks(load_excel(excel_path))
         final.to_csv(OUTPUT_CSV, index=False)
         print(f"✅ Generated {OUTPUT_CSV.resolve()} with {len(final)} rows and columns {list(final.columns)}")
     except Exception as e:
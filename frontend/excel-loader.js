@@ -1,11 +1,14 @@
-// excel-loader.js - Loads combined_crop_data_citywise.xlsx and exposes normalized data
-// Requires SheetJS (XLSX) global: https://cdn.jsdelivr.net/npm/xlsx@0.18.5/dist/xlsx.full.min.js
+// excel-loader.js - Loads the combined city-wise price data and exposes normalized data
+// Prefers combined_crop_data_citywise.csv (exported from the price store by backend/convert_excel_to_csv.py,
+// parsed with d3.csvParse) and falls back to combined_crop_data_citywise.xlsx, which
+// requires SheetJS (XLSX) global: https://cdn.jsdelivr.net/npm/xlsx@0.18.5/dist/xlsx.full.min.js
 // Exports window.ExcelDataLoader with methods:
 //   loadExcel(): Promise<{ rows: Array<{Crop:string, Date: Date, Price: number, City?: string}>, cities: string[] }>
 // Caching to avoid multiple fetch/parse cycles.
 
 (function(){
   const FILE_PATH = 'combined_crop_data_citywise.xlsx';
+  const CSV_PATH = 'combined_crop_data_citywise.csv';
   let _cache = null;
 
   function sniffColumn(candidates, headers){
@@ -97,8 +100,19 @@
     return rows;
   }
 
-  async function loadExcel(){
-    if(_cache) return _cache;
+  async function loadCsvRows(){
+    if(typeof d3 === 'undefined') return null;
+    try {
+      const resp = await fetch(CSV_PATH, { cache:'no-store' });
+      if(!resp.ok) return null;
+      return normalizeSheet(d3.csvParse(await resp.text()));
+    } catch(e){
+      console.warn('excel-loader: '+CSV_PATH+' unavailable, using '+FILE_PATH, e);
+      return null;
+    }
+  }
+
+  async function loadWorkbookRows(){
     if(typeof XLSX === 'undefined') throw new Error('SheetJS (XLSX) library not loaded');
     const buf = await fetchArrayBuffer(FILE_PATH);
     const wb = XLSX.read(buf, { type:'array' });
@@ -110,6 +124,12 @@
       const rows = normalizeSheet(json);
       allRows = allRows.concat(rows);
     });
+    return allRows;
+  }
+
+  async function loadExcel(){
+    if(_cache) return _cache;
+    const allRows = (await loadCsvRows()) || (await loadWorkbookRows());
 
     // Aggregate duplicates (Crop,Date,City) if needed (averaging)
     const keyMap = new Map();